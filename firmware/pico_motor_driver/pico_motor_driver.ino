@@ -2,6 +2,12 @@
  * @file pico_motor_driver.ino
  * @brief Raspberry Pi Pico モータードライバーファームウェア (直値制御)
  * @details シリアル通信で目標PWM値を受信し、TB6612を用いてDCモーターを制御する。
+ *          ASCIIコマンド ("M:<pwm>", "E:<0|1>") に加えて、バイナリフレーム
+ *          (SYNC(0xA5) | LEN | SEQ | PAYLOAD | CRC8, src/hardware/motor_protocol.py 参照) を受け付ける。
+ *          "B:1" を受信するとステータス報告をバイナリフレームに切り替える。
+ *          "Q:<pwm>,<ms>" (または MSG_SEGMENT) は現在の出力から <pwm> まで <ms> ミリ秒で
+ *          変化するセグメントをキューに積み、約1msごとに補間して順に再生する。
+ *          キューが空になると最後の値を保持し、"M:" / "E:0" でキューを破棄する。
  */
 
 // --- ピン定義 ---
@@ -13,6 +19,45 @@ const uint8_t PIN_STBY = 2;
 // --- グローバル変数 ---
 int target_pwm = 0; ///< 目標PWM値 (-255 ~ 255)
 
+// --- 通信プロトコル ---
+const uint8_t FRAME_SYNC = 0xA5;
+const uint8_t MAX_PAYLOAD = 32;
+const uint8_t MSG_PWM = 0x01;     ///< int16: PWM値
+const uint8_t MSG_ENABLE = 0x02;  ///< uint8: 0=無効, 1=有効
+const uint8_t MSG_SEGMENT = 0x03; ///< int16 + uint16: 終点のPWM値, 所要時間 (ms)
+const uint8_t MSG_STATUS = 0x81;  ///< int16: 現在のPWM値
+const uint8_t MSG_QUEUE_DEPTH = 0x82;  ///< uint8: キューに残っているセグメント数
+
+bool binary_mode = false; ///< trueの場合ステータスをバイナリフレームで送信
+uint8_t tx_seq = 0;
+
+// ASCII行バッファ (Stringを使わずヒープ確保を避ける)
+char line_buf[32];
+uint8_t line_len = 0;
+
+// バイナリフレーム解析の状態
+enum RxState { RX_IDLE, RX_LEN, RX_SEQ, RX_PAYLOAD, RX_CRC };
+RxState rx_state = RX_IDLE;
+uint8_t rx_len = 0;
+uint8_t rx_seq = 0;
+uint8_t rx_pos = 0;
+uint8_t rx_payload[MAX_PAYLOAD];
+
+// --- セグメントキュー (リングバッファ) ---
+const uint8_t SEGMENT_QUEUE_SIZE = 16;
+const uint32_t SEGMENT_TICK_US = 1000; ///< 補間の周期 (us)
+struct Segment {
+  int16_t pwm;          ///< 終点のPWM値
+  uint16_t duration_ms; ///< 所要時間 (ms)
+};
+Segment seg_queue[SEGMENT_QUEUE_SIZE];
+uint8_t seg_head = 0;
+uint8_t seg_count = 0;
+bool seg_active = false; ///< 先頭のセグメントを再生中
+int seg_start_pwm = 0;
+uint32_t seg_start_us = 0;
+uint32_t last_segment_tick = 0;
+
 // --- プロトタイプ宣言 ---
 /**
  * @brief モーターのPWM出力を設定する
@@ -20,6 +65,40 @@ int target_pwm = 0; ///< 目標PWM値 (-255 ~ 255)
  */
 void setMotorPWM(int pwm);
 
+/**
+ * @brief ASCIIコマンドを1バイトずつ解析する
+ * @param c 受信バイト
+ */
+void parseAsciiByte(uint8_t c);
+
+/**
+ * @brief バイナリフレームを1バイトずつ解析する
+ * @param c 受信バイト
+ */
+void parseFrameByte(uint8_t c);
+
+/**
+ * @brief ステータスを現在のプロトコルで送信する
+ */
+void sendStatus();
+
+/**
+ * @brief セグメントをキューの末尾に追加する (満杯の場合は捨てる)
+ * @param pwm 終点のPWM値 (-255 ~ 255)
+ * @param duration_ms 所要時間 (ms)
+ */
+void queueSegment(int pwm, uint16_t duration_ms);
+
+/**
+ * @brief キューを破棄する (直値指令・無効化時)
+ */
+void clearSegments();
+
+/**
+ * @brief キューの先頭セグメントを補間して target_pwm を更新する
+ */
+void updateSegments();
+
 void setup() {
   Serial.begin(115200);
 
@@ -30,34 +109,226 @@ void setup() {
   pinMode(PIN_STBY, OUTPUT);
   digitalWrite(PIN_STBY, HIGH); // ドライバ有効化
 
+  // 起動メッセージ (PC側はこれかステータスの受信で準備完了と判断する)
+  Serial.println("Pico Motor Driver Started");
 }
 
 void loop() {
-  // PWM直接制御
+  // PWM直接制御 (セグメント再生中は補間値)
+  updateSegments();
   setMotorPWM(target_pwm);
 
-  // シリアルコマンド解析
-  if (Serial.available()) {
-    String input = Serial.readStringUntil('\n');
-    input.trim();
-
-    // コマンド形式: "M:100" (PWM値を -255 から 255 で設定)
-    if (input.startsWith("M:")) {
-      target_pwm = input.substring(2).toInt();
+  // シリアルコマンド解析 (受信済みのバイトをすべて処理)
+  while (Serial.available() > 0) {
+    uint8_t c = Serial.read();
+    if (rx_state != RX_IDLE) {
+      parseFrameByte(c);
+    } else if (c == FRAME_SYNC) {
+      rx_state = RX_LEN;
+    } else {
+      parseAsciiByte(c);
     }
   }
 
-  // ステータス報告 (PWM値をエコー)
-  // 形式: "S:PWM"
+  // ステータス報告 (PWM値とキューの残数をエコー)
+  // 形式: "S:PWM,DEPTH" またはバイナリフレーム
   // 頻繁な送信を防ぐため、一定間隔で送信
   static unsigned long last_report = 0;
   if (millis() - last_report > 100) {
-     Serial.print("S:");
-     Serial.println(target_pwm);
+     sendStatus();
      last_report = millis();
   }
 }
 
+void parseAsciiByte(uint8_t c) {
+  if (c == '\r') {
+    return;
+  }
+  if (c != '\n') {
+    if (line_len < sizeof(line_buf) - 1) {
+      line_buf[line_len++] = (char)c;
+    }
+    return;
+  }
+  line_buf[line_len] = '\0';
+  line_len = 0;
+
+  // コマンド形式: "M:100" (PWM値を -255 から 255 で設定)
+  if (line_buf[0] == 'M' && line_buf[1] == ':') {
+    clearSegments();
+    target_pwm = atoi(line_buf + 2);
+  } else if (line_buf[0] == 'Q' && line_buf[1] == ':') {
+    // コマンド形式: "Q:100,20" (20msかけてPWM 100まで変化)
+    char *comma = strchr(line_buf + 2, ',');
+    if (comma != NULL) {
+      queueSegment(atoi(line_buf + 2), (uint16_t)atol(comma + 1));
+    }
+  } else if (line_buf[0] == 'E' && line_buf[1] == ':') {
+    setEnabled(atoi(line_buf + 2) != 0);
+  } else if (line_buf[0] == 'B' && line_buf[1] == ':') {
+    // プロトコル切り替え要求: 同じ行を返して応答する
+    binary_mode = atoi(line_buf + 2) != 0;
+    Serial.print("B:");
+    Serial.println(binary_mode ? 1 : 0);
+  }
+}
+
+/**
+ * @brief CRC-8 (多項式 0x07) を1バイト分更新する
+ */
+uint8_t crc8Update(uint8_t crc, uint8_t data) {
+  crc ^= data;
+  for (uint8_t i = 0; i < 8; i++) {
+    crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+  }
+  return crc;
+}
+
+/**
+ * @brief CRCが一致したフレームのメッセージを順に適用する
+ */
+void handlePayload() {
+  uint8_t i = 0;
+  while (i < rx_len) {
+    uint8_t type = rx_payload[i++];
+    if (type == MSG_PWM && i + 2 <= rx_len) {
+      clearSegments();
+      target_pwm = (int16_t)(rx_payload[i] | (rx_payload[i + 1] << 8));
+      i += 2;
+    } else if (type == MSG_SEGMENT && i + 4 <= rx_len) {
+      queueSegment((int16_t)(rx_payload[i] | (rx_payload[i + 1] << 8)),
+                   (uint16_t)(rx_payload[i + 2] | (rx_payload[i + 3] << 8)));
+      i += 4;
+    } else if (type == MSG_ENABLE && i + 1 <= rx_len) {
+      setEnabled(rx_payload[i] != 0);
+      i += 1;
+    } else {
+      return;  // 未知のメッセージ: フレームの残りを破棄
+    }
+  }
+}
+
+void parseFrameByte(uint8_t c) {
+  switch (rx_state) {
+    case RX_LEN:
+      if (c > MAX_PAYLOAD) {
+        rx_state = RX_IDLE;
+        return;
+      }
+      rx_len = c;
+      rx_pos = 0;
+      rx_state = RX_SEQ;
+      break;
+    case RX_SEQ:
+      rx_seq = c;
+      rx_state = rx_len > 0 ? RX_PAYLOAD : RX_CRC;
+      break;
+    case RX_PAYLOAD:
+      rx_payload[rx_pos++] = c;
+      if (rx_pos >= rx_len) {
+        rx_state = RX_CRC;
+      }
+      break;
+    case RX_CRC: {
+      uint8_t crc = crc8Update(crc8Update(0, rx_len), rx_seq);
+      for (uint8_t i = 0; i < rx_len; i++) {
+        crc = crc8Update(crc, rx_payload[i]);
+      }
+      if (crc == c) {
+        handlePayload();
+      }
+      rx_state = RX_IDLE;
+      break;
+    }
+    default:
+      rx_state = RX_IDLE;
+      break;
+  }
+}
+
+void sendStatus() {
+  if (!binary_mode) {
+    Serial.print("S:");
+    Serial.print(target_pwm);
+    Serial.print(",");
+    Serial.println(seg_count);
+    return;
+  }
+  uint8_t frame[9];
+  frame[0] = FRAME_SYNC;
+  frame[1] = 5;  // LEN
+  frame[2] = tx_seq++;
+  frame[3] = MSG_STATUS;
+  frame[4] = (uint8_t)(target_pwm & 0xFF);
+  frame[5] = (uint8_t)((target_pwm >> 8) & 0xFF);
+  frame[6] = MSG_QUEUE_DEPTH;
+  frame[7] = seg_count;
+  uint8_t crc = 0;
+  for (uint8_t i = 1; i < 8; i++) {
+    crc = crc8Update(crc, frame[i]);
+  }
+  frame[8] = crc;
+  Serial.write(frame, sizeof(frame));
+}
+
+/**
+ * @brief ドライバの有効/無効を切り替える (無効化時はキューを破棄)
+ */
+void setEnabled(bool enable) {
+  digitalWrite(PIN_STBY, enable ? HIGH : LOW);
+  if (!enable) {
+    clearSegments();
+  }
+}
+
+void queueSegment(int pwm, uint16_t duration_ms) {
+  if (seg_count >= SEGMENT_QUEUE_SIZE) {
+    return;  // 満杯: PC側が残数を管理しているので通常は起きない
+  }
+  uint8_t tail = (seg_head + seg_count) % SEGMENT_QUEUE_SIZE;
+  seg_queue[tail].pwm = constrain(pwm, -255, 255);
+  seg_queue[tail].duration_ms = duration_ms;
+  seg_count++;
+}
+
+void clearSegments() {
+  seg_count = 0;
+  seg_active = false;
+}
+
+void updateSegments() {
+  if (seg_count == 0) {
+    return;
+  }
+  uint32_t now = micros();
+  if (seg_active && now - last_segment_tick < SEGMENT_TICK_US) {
+    return;
+  }
+  last_segment_tick = now;
+  if (!seg_active) {
+    // キューが空だった場合は現在の出力から開始する
+    seg_active = true;
+    seg_start_pwm = target_pwm;
+    seg_start_us = now;
+  }
+  while (seg_count > 0) {
+    Segment &seg = seg_queue[seg_head];
+    uint32_t duration_us = (uint32_t)seg.duration_ms * 1000;
+    uint32_t elapsed = now - seg_start_us;
+    if (elapsed < duration_us) {
+      target_pwm = seg_start_pwm + (int)((int64_t)(seg.pwm - seg_start_pwm) * elapsed / duration_us);
+      return;
+    }
+    // 終了: 次のセグメントはこの終点の時刻から始める (時間誤差を蓄積しない)
+    target_pwm = seg.pwm;
+    seg_start_pwm = seg.pwm;
+    seg_start_us += duration_us;
+    seg_head = (seg_head + 1) % SEGMENT_QUEUE_SIZE;
+    seg_count--;
+  }
+  seg_active = false;
+}
+
 /**
  * @brief モータードライバ (TB6612) への出力を行う
  * @param pwm PWM値 (-255 ~ 255) 正の値で正転、負の値で逆転
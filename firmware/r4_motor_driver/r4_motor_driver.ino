@@ -5,6 +5,16 @@
  * Receives serial commands: "M:PWM\n" (PWM: -255 to 255)
  * Drives two DC motors with the same PWM value.
  *
+ * Segment streaming: "Q:PWM,MS\n" (or MSG_SEGMENT) queues a ramp from the
+ * current output to PWM over MS milliseconds. Queued segments play back to
+ * back, interpolated at ~1 kHz; the last value is held when the queue runs
+ * empty. "M:" and "E:0" discard the queue. Status reports "S:PWM,DEPTH".
+ *
+ * Binary protocol (see src/hardware/motor_protocol.py):
+ *   SYNC(0xA5) | LEN | SEQ | PAYLOAD | CRC8
+ * Enabled when the host sends "B:1\n" (echoed back). ASCII commands are
+ * always accepted; only the status report format changes.
+ *
  * Pinout (User Specified):
  * DC A: 9, 10, 11
  * DC B: 5, 4, 3
@@ -22,9 +32,50 @@ const uint8_t PIN_STBY = 6;
 
 int current_pwm = 0;
 
+// --- Protocol ---
+const uint8_t FRAME_SYNC = 0xA5;
+const uint8_t MAX_PAYLOAD = 32;
+const uint8_t MSG_PWM = 0x01;     // int16
+const uint8_t MSG_ENABLE = 0x02;  // uint8
+const uint8_t MSG_SEGMENT = 0x03; // int16 PWM + uint16 duration (ms)
+const uint8_t MSG_STATUS = 0x81;  // int16
+const uint8_t MSG_QUEUE_DEPTH = 0x82;  // uint8
+
+bool binary_mode = false;
+uint8_t tx_seq = 0;
+
+// ASCII line buffer (no String allocation)
+char line_buf[32];
+uint8_t line_len = 0;
+
+// Binary frame parser state
+enum RxState { RX_IDLE, RX_LEN, RX_SEQ, RX_PAYLOAD, RX_CRC };
+RxState rx_state = RX_IDLE;
+uint8_t rx_len = 0;
+uint8_t rx_seq = 0;
+uint8_t rx_pos = 0;
+uint8_t rx_payload[MAX_PAYLOAD];
+
+// Segment queue (ring buffer)
+const uint8_t SEGMENT_QUEUE_SIZE = 16;
+const uint32_t SEGMENT_TICK_US = 1000;  // interpolation period
+struct Segment {
+  int16_t pwm;
+  uint16_t duration_ms;
+};
+Segment seg_queue[SEGMENT_QUEUE_SIZE];
+uint8_t seg_head = 0;
+uint8_t seg_count = 0;
+bool seg_active = false;  // true while the head segment is playing
+int seg_start_pwm = 0;
+uint32_t seg_start_us = 0;
+uint32_t last_segment_tick = 0;
+
 void setup() {
   Serial.begin(115200);
-  delay(1000);
+  // Wait for the USB serial connection (at most 1 s) instead of a fixed delay
+  while (!Serial && millis() < 1000) {
+  }
 
   pinMode(PIN_AIN1, OUTPUT);
   pinMode(PIN_AIN2, OUTPUT);
@@ -40,30 +91,210 @@ void setup() {
 }
 
 void loop() {
-  // Serial Command Parsing
-  if (Serial.available() > 0) {
-    String line = Serial.readStringUntil('\n');
-    line.trim();
-
-    if (line.startsWith("M:")) {
-      int pwm = line.substring(2).toInt();
-      driveMotors(pwm);
-      current_pwm = pwm;
-    } else if (line.startsWith("E:")) {
-      int enable = line.substring(2).toInt();
-      digitalWrite(PIN_STBY, enable ? HIGH : LOW);
+  updateSegments();
+
+  // Serial Command Parsing (drain everything that has arrived)
+  while (Serial.available() > 0) {
+    uint8_t c = Serial.read();
+    if (rx_state != RX_IDLE) {
+      parseFrameByte(c);
+    } else if (c == FRAME_SYNC) {
+      rx_state = RX_LEN;
+    } else {
+      parseAsciiByte(c);
     }
   }
 
   // Send Status (Match pico_interface expectation)
   static uint32_t last_status_time = 0;
   if (millis() - last_status_time > 100) {
-    Serial.print("S:");
-    Serial.println(current_pwm);
+    sendStatus();
     last_status_time = millis();
   }
 }
 
+void setPWM(int pwm) {
+  driveMotors(pwm);
+  current_pwm = pwm;
+}
+
+void setEnabled(bool enable) {
+  digitalWrite(PIN_STBY, enable ? HIGH : LOW);
+  if (!enable) {
+    clearSegments();
+  }
+}
+
+void queueSegment(int pwm, uint16_t duration_ms) {
+  if (seg_count >= SEGMENT_QUEUE_SIZE) {
+    return;  // Full: the host tracks the depth and should not overrun it
+  }
+  uint8_t tail = (seg_head + seg_count) % SEGMENT_QUEUE_SIZE;
+  seg_queue[tail].pwm = constrain(pwm, -255, 255);
+  seg_queue[tail].duration_ms = duration_ms;
+  seg_count++;
+}
+
+void clearSegments() {
+  seg_count = 0;
+  seg_active = false;
+}
+
+void updateSegments() {
+  if (seg_count == 0) {
+    return;
+  }
+  uint32_t now = micros();
+  if (seg_active && now - last_segment_tick < SEGMENT_TICK_US) {
+    return;
+  }
+  last_segment_tick = now;
+  if (!seg_active) {
+    // Start from the current output when the queue was idle
+    seg_active = true;
+    seg_start_pwm = current_pwm;
+    seg_start_us = now;
+  }
+  while (seg_count > 0) {
+    Segment &seg = seg_queue[seg_head];
+    uint32_t duration_us = (uint32_t)seg.duration_ms * 1000;
+    uint32_t elapsed = now - seg_start_us;
+    if (elapsed < duration_us) {
+      setPWM(seg_start_pwm + (int)((int64_t)(seg.pwm - seg_start_pwm) * elapsed / duration_us));
+      return;
+    }
+    // Finished: the next segment starts where this one ended (no accumulated timing error)
+    setPWM(seg.pwm);
+    seg_start_pwm = seg.pwm;
+    seg_start_us += duration_us;
+    seg_head = (seg_head + 1) % SEGMENT_QUEUE_SIZE;
+    seg_count--;
+  }
+  seg_active = false;
+}
+
+void parseAsciiByte(uint8_t c) {
+  if (c == '\r') {
+    return;
+  }
+  if (c != '\n') {
+    if (line_len < sizeof(line_buf) - 1) {
+      line_buf[line_len++] = (char)c;
+    }
+    return;
+  }
+  line_buf[line_len] = '\0';
+  line_len = 0;
+
+  if (line_buf[0] == 'M' && line_buf[1] == ':') {
+    clearSegments();
+    setPWM(atoi(line_buf + 2));
+  } else if (line_buf[0] == 'Q' && line_buf[1] == ':') {
+    char *comma = strchr(line_buf + 2, ',');
+    if (comma != NULL) {
+      queueSegment(atoi(line_buf + 2), (uint16_t)atol(comma + 1));
+    }
+  } else if (line_buf[0] == 'E' && line_buf[1] == ':') {
+    setEnabled(atoi(line_buf + 2) != 0);
+  } else if (line_buf[0] == 'B' && line_buf[1] == ':') {
+    binary_mode = atoi(line_buf + 2) != 0;
+    Serial.print("B:");
+    Serial.println(binary_mode ? 1 : 0);
+  }
+}
+
+uint8_t crc8Update(uint8_t crc, uint8_t data) {
+  crc ^= data;
+  for (uint8_t i = 0; i < 8; i++) {
+    crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+  }
+  return crc;
+}
+
+void parseFrameByte(uint8_t c) {
+  switch (rx_state) {
+    case RX_LEN:
+      if (c > MAX_PAYLOAD) {
+        rx_state = RX_IDLE;
+        return;
+      }
+      rx_len = c;
+      rx_pos = 0;
+      rx_state = RX_SEQ;
+      break;
+    case RX_SEQ:
+      rx_seq = c;
+      rx_state = rx_len > 0 ? RX_PAYLOAD : RX_CRC;
+      break;
+    case RX_PAYLOAD:
+      rx_payload[rx_pos++] = c;
+      if (rx_pos >= rx_len) {
+        rx_state = RX_CRC;
+      }
+      break;
+    case RX_CRC: {
+      uint8_t crc = crc8Update(crc8Update(0, rx_len), rx_seq);
+      for (uint8_t i = 0; i < rx_len; i++) {
+        crc = crc8Update(crc, rx_payload[i]);
+      }
+      if (crc == c) {
+        handlePayload();
+      }
+      rx_state = RX_IDLE;
+      break;
+    }
+    default:
+      rx_state = RX_IDLE;
+      break;
+  }
+}
+
+void handlePayload() {
+  uint8_t i = 0;
+  while (i < rx_len) {
+    uint8_t type = rx_payload[i++];
+    if (type == MSG_PWM && i + 2 <= rx_len) {
+      clearSegments();
+      setPWM((int16_t)(rx_payload[i] | (rx_payload[i + 1] << 8)));
+      i += 2;
+    } else if (type == MSG_SEGMENT && i + 4 <= rx_len) {
+      queueSegment((int16_t)(rx_payload[i] | (rx_payload[i + 1] << 8)),
+                   (uint16_t)(rx_payload[i + 2] | (rx_payload[i + 3] << 8)));
+      i += 4;
+    } else if (type == MSG_ENABLE && i + 1 <= rx_len) {
+      setEnabled(rx_payload[i] != 0);
+      i += 1;
+    } else {
+      return;  // Unknown message: drop the rest of the frame
+    }
+  }
+}
+
+void sendStatus() {
+  if (!binary_mode) {
+    Serial.print("S:");
+    Serial.print(current_pwm);
+    Serial.print(",");
+    Serial.println(seg_count);
+    return;
+  }
+  uint8_t frame[9];
+  frame[0] = FRAME_SYNC;
+  frame[1] = 5;
+  frame[2] = tx_seq++;
+  frame[3] = MSG_STATUS;
+  frame[4] = (uint8_t)(current_pwm & 0xFF);
+  frame[5] = (uint8_t)((current_pwm >> 8) & 0xFF);
+  frame[6] = MSG_QUEUE_DEPTH;
+  frame[7] = seg_count;
+  uint8_t crc = 0;
+  for (uint8_t i = 1; i < 8; i++) {
+    crc = crc8Update(crc, frame[i]);
+  }
+  frame[8] = crc;
+  Serial.write(frame, sizeof(frame));
+}
+
 void driveMotors(int pwm) {
   // Motor A
   driveMotor(PIN_AIN1, PIN_AIN2, PIN_PWMA, pwm);
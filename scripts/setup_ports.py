@@ -3,42 +3,210 @@
 @brief Armlatable用シリアルポート自動検出スクリプト
 @details Dynamixel (U2D2) と モータードライバー (Pico/R4) のポートを検出し、config.yaml を更新します。
 macOS および Linux/WSL をサポートしています。
+
+候補となるすべてのポートを並行して実際に調べ (Dynamixel は各ボーレートで ping、
+モータードライバーは起動メッセージ・S: ステータス・ping 応答を待つ)、役割を判定します。
+判定結果はデバイスのシリアル番号ごとに .device_cache.yaml に保存し、次回からは
+同じデバイスが接続されていれば調べずに使います (--probe で再判定)。
 """
 
+import serial
 import serial.tools.list_ports
 import yaml
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from hardware import motor_protocol as proto  # noqa: E402
+
+CACHE_PATH = ".device_cache.yaml"
+
+# 候補ポートのパターンと VID
+# U2D2 / FTDI: usbserial (Mac), ttyUSB (Linux/WSL), VID:0403
+# Pico / R4: usbmodem (Mac), ttyACM (Linux/WSL), VID:2e8a (Pico), VID:2341 (R4)
+DXL_PATTERNS = ["usbserial", "ttyusb"]
+DXL_VIDS = [0x0403]
+MOTOR_PATTERNS = ["usbmodem", "ttyacm"]
+MOTOR_VIDS = {0x2e8a: "pico", 0x2341: "r4"}
+
+# Dynamixel を探すボーレート (よく使う順)
+DXL_BAUD_RATES = [57600, 1000000, 115200, 2000000, 3000000, 4000000, 9600]
+MOTOR_BAUD_RATE = 115200
+MOTOR_LISTEN_TIMEOUT = 2.5  # ボードが開いた時点でリセットされる場合も起動メッセージまで待つ (秒)
+
+
+def fingerprint(port):
+    """ポートのデバイスを識別するキー (シリアル番号がなければ None)"""
+    if not port.serial_number or port.vid is None:
+        return None
+    return f"{port.vid:04x}:{port.pid:04x}:{port.serial_number}"
+
 
-def detect_ports():
+def candidate_ports():
+    """Dynamixel / モータードライバーの可能性があるポートを (ポート, 先に試す役割) で返す"""
+    candidates = []
+    for p in serial.tools.list_ports.comports():
+        device = p.device.lower()
+        if any(pat in device for pat in DXL_PATTERNS) or p.vid in DXL_VIDS:
+            candidates.append((p, "dynamixel"))
+        elif any(pat in device for pat in MOTOR_PATTERNS) or p.vid in MOTOR_VIDS:
+            candidates.append((p, "motor_driver"))
+    return candidates
+
+
+def probe_motor_driver(ser, timeout=MOTOR_LISTEN_TIMEOUT, vid=None):
     """
-    共通のパターンとハードウェアID（VID/PID）に基づいてシリアルポートを検出する。
-    Returns: (dxl_port, motor_port)
+    開いたポートがモータードライバーかどうかを調べる
+
+    起動メッセージ・S: ステータス・B:0 (ping) の応答・CRC の合うステータスフレームのいずれかを受信したら
+    モータードライバーと判定する。
+
+    Returns:
+        dict | None: {"role": "motor_driver", "type": "r4" | "pico"}
+    """
+    decoder = proto.FrameDecoder()
+    driver_type = MOTOR_VIDS.get(vid)
+    found = False
+    deadline = time.monotonic() + timeout
+    next_ping = 0.0
+    while time.monotonic() < deadline:
+        now = time.monotonic()
+        if now >= next_ping:
+            ser.write(proto.PING_LINE + b"\n")
+            ser.flush()
+            next_ping = now + 0.2
+        data = ser.read(ser.in_waiting or 1)
+        for event in decoder.feed(data):
+            if event[0] == 'frame':
+                found = found or any(msg_type == proto.MSG_STATUS for msg_type, _ in event[2])
+                continue
+            line = event[1]
+            if line.endswith(proto.BANNER_SUFFIX):
+                driver_type = "pico" if line.lower().startswith(b"pico") else "r4"
+                found = True
+            elif line.startswith(b"S:") or line == proto.PING_LINE:
+                found = True
+        # 種類が分かるまで (起動メッセージか VID) は待ち続ける
+        if found and driver_type is not None:
+            break
+    if not found:
+        return None
+    return {"role": "motor_driver", "type": driver_type or "r4"}
+
+
+def probe_dynamixel(port_handler, ids, baud_rates=DXL_BAUD_RATES):
     """
-    ports = serial.tools.list_ports.comports()
-    dxl_port = None
-    motor_port = None
+    開いたポートの各ボーレートで Dynamixel を探す
 
-    # 一般的なパターンと VID/PID
-    # U2D2 / FTDI: usbserial (Mac), ttyUSB (Linux/WSL), VID:0403
-    # Pico / R4: usbmodem (Mac), ttyACM (Linux/WSL), VID:2e8a (Pico), VID:2341 (R4)
+    設定済みのIDを個別に ping し (速い)、どのボーレートでも見つからなければブロードキャスト ping で探す。
 
-    for p in ports:
-        desc = p.description.lower()
-        hwid = p.hwid.lower()
-        device = p.device
+    Returns:
+        dict | None: {"role": "dynamixel", "baud_rate": ボーレート, "ids": [見つかったID]}
+    """
+    from dynamixel_sdk import PacketHandler, COMM_SUCCESS
+    packet_handler = PacketHandler(2.0)
+
+    for broadcast in (False, True):
+        for baud_rate in baud_rates:
+            if not port_handler.setBaudRate(baud_rate):
+                continue
+            if broadcast:
+                found, _ = packet_handler.broadcastPing(port_handler)
+                found = sorted(found)
+            else:
+                found = [dxl_id for dxl_id in ids
+                         if packet_handler.ping(port_handler, dxl_id)[1] == COMM_SUCCESS]
+            if found:
+                return {"role": "dynamixel", "baud_rate": baud_rate, "ids": found}
+    return None
+
+
+def probe_port(port, first_role, ids, baud_rates=DXL_BAUD_RATES):
+    """1つのポートを調べる (先に試す役割で見つからなければもう一方も試す)"""
+    order = [first_role] + [role for role in ("dynamixel", "motor_driver") if role != first_role]
+    for role in order:
+        try:
+            if role == "dynamixel":
+                from dynamixel_sdk import PortHandler
+                port_handler = PortHandler(port.device)
+                if not port_handler.openPort():
+                    continue
+                try:
+                    result = probe_dynamixel(port_handler, ids, baud_rates)
+                finally:
+                    port_handler.closePort()
+            else:
+                with serial.Serial(port.device, MOTOR_BAUD_RATE, timeout=0.05) as ser:
+                    ser.reset_input_buffer()
+                    result = probe_motor_driver(ser, vid=port.vid)
+        except (serial.SerialException, OSError) as e:
+            print(f"  {port.device}: {e}")
+            return None
+        if result is not None:
+            return result
+    return None
+
+
+def load_cache():
+    if not os.path.exists(CACHE_PATH):
+        return {}
+    with open(CACHE_PATH) as f:
+        return yaml.safe_load(f) or {}
+
+
+def save_cache(cache):
+    with open(CACHE_PATH, "w") as f:
+        yaml.dump(cache, f, default_flow_style=False, sort_keys=True)
+
+
+def detect_ports(ids, baud_rate=None, force_probe=False):
+    """
+    ポートを調べて役割を判定する
+
+    Args:
+        ids: 設定されている Dynamixel ID (ping に使う)
+        baud_rate: 設定されているボーレート (最初に試す)
+        force_probe: キャッシュを使わずにすべて調べ直す
+
+    Returns:
+        {"dynamixel": (ポート, 結果), "motor_driver": (ポート, 結果)} (見つかった役割のみ)
+    """
+    candidates = candidate_ports()
+    baud_rates = [baud_rate] + [b for b in DXL_BAUD_RATES if b != baud_rate] if baud_rate else DXL_BAUD_RATES
+    cache = {} if force_probe else load_cache()
 
-        # Dynamixel (U2D2 / FTDI) の検出
-        if any(pat in device.lower() for pat in ["usbserial", "ttyusb"]) or "vid:0403" in hwid:
-            if not dxl_port:
-                dxl_port = device
+    found = {}
+    to_probe = []
+    for port, first_role in candidates:
+        cached = cache.get(fingerprint(port))
+        if cached is not None and cached["role"] not in found:
+            print(f"  {port.device}: {cached['role']} (キャッシュ)")
+            found[cached["role"]] = (port.device, cached)
+        else:
+            to_probe.append((port, first_role))
 
-        # モータードライバー (Pico / R4 WiFi) の検出
-        if any(pat in device.lower() for pat in ["usbmodem", "ttyacm"]) or any(vid in hwid for vid in ["vid:2e8a", "vid:2341"]):
-            if not motor_port:
-                motor_port = device
+    # 両方の役割がキャッシュから分かった場合は調べない
+    if len(found) < 2 and to_probe:
+        print(f"{len(to_probe)} 個のポートを調べています: {', '.join(p.device for p, _ in to_probe)}")
+        with ThreadPoolExecutor(max_workers=len(to_probe)) as pool:
+            results = list(pool.map(lambda c: probe_port(c[0], c[1], ids, baud_rates), to_probe))
+        for (port, _), result in zip(to_probe, results):
+            if result is None:
+                print(f"  {port.device}: 応答なし")
+                continue
+            print(f"  {port.device}: {result}")
+            key = fingerprint(port)
+            if key is not None:
+                cache[key] = result
+            if result["role"] in found:
+                print(f"警告: {result['role']} が複数見つかりました。{found[result['role']][0]} を使います。")
+            else:
+                found[result["role"]] = (port.device, result)
+        save_cache(cache)
+    return found
 
-    return dxl_port, motor_port
 
 def main():
     config_path = "config.yaml"
@@ -65,19 +233,27 @@ def main():
         with open(config_path, "r") as f:
             config = yaml.safe_load(f)
 
-    dxl, motor = detect_ports()
+    found = detect_ports(config["dynamixel"]["ids"], config["dynamixel"].get("baud_rate"),
+                         force_probe="--probe" in sys.argv[1:])
 
     updated = False
-    if dxl:
-        print(f"Dynamixelポートを検出: {dxl}")
+    if "dynamixel" in found:
+        dxl, info = found["dynamixel"]
+        print(f"Dynamixelポートを検出: {dxl} ({info['baud_rate']} bps, ID: {info['ids']})")
         config["serial"]["dxl_port"] = dxl
+        config["dynamixel"]["baud_rate"] = info["baud_rate"]
+        missing = [dxl_id for dxl_id in config["dynamixel"]["ids"] if dxl_id not in info["ids"]]
+        if missing:
+            print(f"警告: 設定されたID {missing} が応答しませんでした。")
         updated = True
     else:
         print("警告: Dynamixelポート (U2D2) を検出できませんでした。")
 
-    if motor:
-        print(f"モータードライバーポートを検出: {motor}")
+    if "motor_driver" in found:
+        motor, info = found["motor_driver"]
+        print(f"モータードライバーポートを検出: {motor} ({info['type']})")
         config["serial"]["pico_port"] = motor
+        config["serial"]["motor_driver_type"] = info["type"]
         updated = True
     else:
         print("警告: モータードライバーポート (Pico/R4) を検出できませんでした。")
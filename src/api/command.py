@@ -0,0 +1,129 @@
+"""
+ControlCommand: コントローラーが出力する制御コマンド (全コントローラー共通)
+
+コントローラーは起動時に ControlCommand を1つ作り、毎ティックその中身を書き換えて返す。
+IDごとの目標値は ID 順に並んだ固定長の配列 (JointTargets) に保持するため、
+ティックごとのオブジェクト・辞書の生成がなく、Sync Write へまとめるときもそのまま順に読める。
+"""
+from array import array
+
+
+class JointTargets:
+    """
+    IDごとの目標値 (ID順の固定スロット + 変更フラグ)
+
+    読み出しは辞書と同じ操作 (targets[id], get, items, keys, in, len) で行える。
+    値が変わったスロットは dirty に 1 が立ち、clear_dirty() まで残る。
+
+    Args:
+        dxl_ids: Dynamixel IDのリスト (スロットの並び)
+    """
+    __slots__ = ('ids', 'values', 'dirty', '_slot', '_clean')
+
+    def __init__(self, dxl_ids):
+        self.ids = tuple(dxl_ids)
+        self.values = array('q', [0] * len(self.ids))
+        self.dirty = bytearray(b'\x01' * len(self.ids))  # 初回は全スロットを送信対象にする
+        self._slot = {dxl_id: i for i, dxl_id in enumerate(self.ids)}
+        self._clean = bytes(len(self.ids))
+
+    def __getitem__(self, dxl_id):
+        return self.values[self._slot[dxl_id]]
+
+    def __setitem__(self, dxl_id, value):
+        self.set_slot(self._slot[dxl_id], value)
+
+    def __contains__(self, dxl_id):
+        return dxl_id in self._slot
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"JointTargets({dict(self.items())})"
+
+    def get(self, dxl_id, default=None):
+        slot = self._slot.get(dxl_id)
+        return default if slot is None else self.values[slot]
+
+    def keys(self):
+        return self.ids
+
+    def items(self):
+        """(ID, 目標値) を ID 順に返す"""
+        return zip(self.ids, self.values)
+
+    def set_slot(self, slot, value):
+        """スロット番号を指定して値を設定する"""
+        value = int(value)
+        if self.values[slot] != value:
+            self.values[slot] = value
+            self.dirty[slot] = 1
+
+    def fill(self, value):
+        """全スロットを同じ値にする"""
+        for slot in range(len(self.ids)):
+            self.set_slot(slot, value)
+
+    def assign(self, values):
+        """ID順に並んだ値 (シーケンス) で全スロットを上書きする"""
+        for slot, value in enumerate(values):
+            self.set_slot(slot, value)
+
+    def update(self, targets):
+        """{ID: 値} の辞書で該当するスロットを上書きする (未知のIDは無視)"""
+        slots = self._slot
+        for dxl_id, value in targets.items():
+            slot = slots.get(dxl_id)
+            if slot is not None:
+                self.set_slot(slot, value)
+
+    def dirty_items(self):
+        """前回の clear_dirty() 以降に値が変わった (ID, 目標値)"""
+        return [(dxl_id, self.values[i]) for i, dxl_id in enumerate(self.ids) if self.dirty[i]]
+
+    def clear_dirty(self):
+        self.dirty[:] = self._clean
+
+
+class ControlCommand:
+    """
+    制御コマンド
+
+    Args:
+        dxl_ids: Dynamixel IDのリスト
+        dc_pwm: DCモーターPWM (-255 ~ 255)
+        dxl_mode: Dynamixelモード (1: Velocity, 3: Position, 4: Extended Position)
+        enable: 有効/無効切り替え (Torque, STBY)。切り替えない場合は None
+
+    profile_velocity / profile_acceleration は位置制御モードでの Profile Velocity / Acceleration。
+    ProfilePlanner が値を設定した (0 以外になった) 後は、値が変わったIDが目標位置と一緒に1回の Sync Write で
+    送信される。すべて 0 の間はプロファイルを書き込まず、サーボに設定済みの値をそのまま使う。
+    """
+    __slots__ = ('dc_pwm', 'dxl_mode', 'dxl_targets', 'enable', 'profile_velocity', 'profile_acceleration')
+
+    def __init__(self, dxl_ids, dc_pwm=0, dxl_mode=3, enable=None):
+        self.dc_pwm = dc_pwm
+        self.dxl_mode = dxl_mode
+        self.dxl_targets = JointTargets(dxl_ids)
+        self.enable = enable
+        self.profile_velocity = JointTargets(dxl_ids)
+        self.profile_acceleration = JointTargets(dxl_ids)
+
+    @property
+    def profiles(self):
+        """
+        DynamixelInterface.set_goals() に渡す (Profile Velocity, Profile Acceleration)
+
+        プロファイルを一度も設定していない場合は None (Goal Position だけの 4 バイトの Sync Write になる)
+        """
+        if not any(self.profile_velocity.values) and not any(self.profile_acceleration.values):
+            return None
+        return self.profile_velocity, self.profile_acceleration
+
+    def __repr__(self):
+        return (f"ControlCommand(dc_pwm={self.dc_pwm}, dxl_mode={self.dxl_mode}, "
+                f"dxl_targets={dict(self.dxl_targets.items())}, enable={self.enable})")
@@ -0,0 +1,75 @@
+"""
+KeyReader: 端末のキー入力を専用スレッドで読み取るイベントキュー
+
+制御ループのティックごとに stdin をポーリングすると、キーが効くまで最大1周期待たされ、
+周期より速く打ったキーは1ティックに1つずつしか処理されない。
+KeyReader は stdin を専用スレッドで待ち受け、届いたキーをすべて (押下時刻, キー) としてキューに積む。
+停止などの緊急キーを受け取った場合は on_urgent を呼び、制御ループを次のデッドラインを待たずに起こす。
+"""
+import os
+import queue
+import select
+import sys
+import termios
+import threading
+import time
+import tty
+from collections.abc import Callable
+
+# 次のティックを待たずに送信するキー (Space: 全停止, x: DCモーター停止, e/r: 有効/無効)
+URGENT_KEYS = frozenset(' xer')
+
+
+class KeyReader:
+    """
+    stdin を cbreak モードにして専用スレッドで読み取る
+
+    Args:
+        on_urgent: 緊急キーを受け取ったときに呼ぶ関数 (受信スレッドから呼ばれる)
+        urgent_keys: 緊急キーの集合
+        stream: 読み取る端末
+    """
+    POLL_INTERVAL = 0.1  # 停止要求を確認する間隔 (秒)
+
+    def __init__(self, on_urgent: Callable[[], None] | None = None, urgent_keys=URGENT_KEYS, stream=sys.stdin):
+        self.on_urgent = on_urgent
+        self.urgent_keys = urgent_keys
+        self.fd = stream.fileno()
+        self._old_settings = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+
+        self._events = queue.SimpleQueue()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="key-reader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            if not select.select([self.fd], [], [], self.POLL_INTERVAL)[0]:
+                continue
+            # 届いているバイトをまとめて読む (sys.stdin のバッファを経由しない)
+            data = os.read(self.fd, 64)
+            if not data:
+                break
+            now = time.monotonic()
+            urgent = False
+            for key in data.decode(errors='ignore'):
+                self._events.put((now, key))
+                urgent = urgent or key in self.urgent_keys
+            if urgent and self.on_urgent is not None:
+                self.on_urgent()
+
+    def get(self) -> tuple[float, str] | None:
+        """次のキーイベント (押下時刻, キー) を返す。なければ None"""
+        try:
+            return self._events.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """受信スレッドを止め、端末設定を復元する"""
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join(timeout=self.POLL_INTERVAL * 2)
+        termios.tcsetattr(self.fd, termios.TCSADRAIN, self._old_settings)
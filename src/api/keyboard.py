@@ -1,19 +1,12 @@
 """
 KeyboardController: キーボード入力で目標値を決定するコントローラー
 """
-import sys
-import tty
-import termios
-import select
-from dataclasses import dataclass
-
-@dataclass
-class ControlCommand:
-    """制御コマンド"""
-    dc_pwm: int         # DCモーターPWM (-255 ~ 255)
-    dxl_mode: int       # Dynamixelモード (1: Velocity, 4: Extended Position)
-    dxl_targets: dict[int, int] # IDごとの目標値
-    enable: bool | None = None # 有効/無効切り替え (Torque, STBY)
+from collections import deque
+from collections.abc import Callable
+from api.command import ControlCommand
+from api.key_input import URGENT_KEYS, KeyReader
+from api.profile import ProfilePlanner
+from hardware.dxl_interface import ServoState
 
 
 class KeyboardController:
@@ -27,22 +20,42 @@ class KeyboardController:
         m:   モード切替 (Position ↔ Velocity)
         Space: 全停止
         q:   終了
+
+    Args:
+        dxl_ids: Dynamixel IDのリスト
+        key_source: キー入力を返す関数 (入力がなければ None)。
+                    指定した場合は端末を使わず、この関数からキーを読む (リプレイ用)。
+                    指定しない場合は KeyReader が端末を専用スレッドで読み、ティックごとに届いたキーをすべて処理する
+        planner: 位置指令の移動を計画する ProfilePlanner。指定した場合は a/d の移動ごとに
+                 Profile Velocity / Acceleration を1回だけ送り、補間はサーボの台形プロファイルに任せる
     """
-    def __init__(self, dxl_ids: list[int]):
+    def __init__(self, dxl_ids: list[int], key_source: Callable[[], str | None] | None = None,
+                 planner: ProfilePlanner | None = None):
         self.dxl_ids = dxl_ids
         self.selected_id = dxl_ids[0] if dxl_ids else 1
         self.dc_pwm = 0
         self.dxl_mode = 4  # Extended Position Control (multi-turn)
         self.dxl_target_pos = {id: 0 for id in dxl_ids}
         self.dxl_target_vel = {id: 0 for id in dxl_ids}
+        self.dxl_state: dict[int, ServoState] = {}
+        self.command = ControlCommand(dxl_ids, dxl_mode=self.dxl_mode)
         self._running = True
         self._initialized = False
         self.pos_min = -20000  # Default limits
         self.pos_max = 20000
 
-        # Terminal settings for non-blocking input
-        self._old_settings = termios.tcgetattr(sys.stdin)
-        tty.setcbreak(sys.stdin.fileno())
+        self.key_log: list[tuple[float, str]] = []  # (経過時間, キー) の履歴 (リプレイ用)
+
+        self.planner = planner
+        self._move: tuple[float, float, list[int]] | None = None  # 実行中の移動 (開始時刻, 予定所要時間, ID)
+
+        # キー押下からハードウェアへの書き込みまでの遅延 (秒)
+        self._unsent: list[tuple[float, bool]] = []  # まだ書き込まれていないキーの (押下時刻, 緊急キーか)
+        self._latencies: deque[tuple[float, bool]] = deque(maxlen=10000)
+
+        # 端末入力は専用スレッドで読む (リプレイ時は key_source から読む)
+        self._key_source = key_source
+        self._reader = KeyReader() if key_source is None else None
 
         self._print_help()
 
@@ -57,6 +70,9 @@ class KeyboardController:
         print(" [e/r] Enable / Disable Motors")
         print(" [Space] Stop All")
         print(" [q]   Quit")
+        if self.planner is not None:
+            print(f" (Moves use servo profiles: {self.planner.max_velocity:.0f} pulse/s, "
+                  f"{self.planner.max_acceleration:.0f} pulse/s^2)")
         print("========================\n")
 
     def set_initial_position(self, pos_dict: dict[int, int]):
@@ -71,81 +87,168 @@ class KeyboardController:
         self.pos_min = pos_min
         self.pos_max = pos_max
 
-    def _get_key(self) -> str | None:
-        """Non-blocking key read"""
-        if select.select([sys.stdin], [], [], 0)[0]:
-            return sys.stdin.read(1)
-        return None
+    def set_wake(self, wake: Callable[[], None]):
+        """緊急キー (Space, x, e, r) を受け取ったときに制御ループを起こす関数を設定する"""
+        if self._reader is not None:
+            self._reader.on_urgent = wake
+
+    def _next_event(self) -> tuple[float | None, str] | None:
+        """次のキー入力 (押下時刻, キー) を返す。なければ None (key_source の場合、押下時刻は None)"""
+        if self._reader is not None:
+            return self._reader.get()
+        key = self._key_source()
+        return None if key is None else (None, key)
 
-    def update(self, elapsed: float) -> ControlCommand:
+    def update(self, elapsed: float, dxl_state: dict[int, ServoState] | None = None) -> ControlCommand:
         """
-        キー入力を処理して目標値を更新する
+        前回から届いたキー入力をすべて処理して目標値を更新する
 
         Args:
-            elapsed: 経過時間 (未使用だがインターフェース統一のため)
+            elapsed: 経過時間 (キー入力の履歴に使用)
+            dxl_state: IDごとのDynamixel現在状態 (read_stateの結果)
 
         Returns:
-            ControlCommand: 制御コマンド
+            ControlCommand: 制御コマンド (毎回同じオブジェクトを書き換えて返す)
         """
-        key = self._get_key()
-
-        if key:
-            if key == 'q':
-                self._running = False
-            elif key == '0':
-                self.selected_id = 0
-                print("\nSelected: ALL Dynamixels")
-            elif key in [str(i) for i in self.dxl_ids]:
-                self.selected_id = int(key)
-                print(f"\nSelected Dynamixel ID: {self.selected_id}")
-            elif key == 'w':
-                self.dc_pwm = min(255, self.dc_pwm + 50)
-            elif key == 's':
-                self.dc_pwm = max(-255, self.dc_pwm - 50)
-            elif key == 'x':
-                self.dc_pwm = 0
-            elif key == 'a':
-                ids_to_move = self.dxl_ids if self.selected_id == 0 else [self.selected_id]
-                for dxl_id in ids_to_move:
-                    if self.dxl_mode == 4:
-                        self.dxl_target_pos[dxl_id] += 500
-                    else:
-                        self.dxl_target_vel[dxl_id] += 20
-            elif key == 'd':
-                ids_to_move = self.dxl_ids if self.selected_id == 0 else [self.selected_id]
-                for dxl_id in ids_to_move:
-                    if self.dxl_mode == 4:
-                        self.dxl_target_pos[dxl_id] -= 500
-                    else:
-                        self.dxl_target_vel[dxl_id] -= 20
-            elif key == 'm':
+        if dxl_state:
+            self.dxl_state = dxl_state
+            self._check_move_done(elapsed)
+
+        enable = None
+        while (event := self._next_event()) is not None:
+            pressed_at, key = event
+            self.key_log.append((elapsed, key))
+            if pressed_at is not None:
+                self._unsent.append((pressed_at, key in URGENT_KEYS))
+            key_enable = self._handle_key(key, elapsed)
+            if key_enable is not None:
+                enable = key_enable
+
+        # 同じコマンドオブジェクトを書き換えて返す (ティックごとの生成・コピーをしない)
+        cmd = self.command
+        cmd.dc_pwm = self.dc_pwm
+        cmd.dxl_mode = self.dxl_mode
+        cmd.enable = enable
+        cmd.dxl_targets.update(self.dxl_target_pos if self.dxl_mode == 4 else self.dxl_target_vel)
+        return cmd
+
+    def _handle_key(self, key: str, elapsed: float) -> bool | None:
+        """1つのキーを処理する。有効/無効を切り替える場合はその値を返す"""
+        if key == 'q':
+            self._running = False
+        elif key == '0':
+            self.selected_id = 0
+            print("\nSelected: ALL Dynamixels")
+        elif key in [str(i) for i in self.dxl_ids]:
+            self.selected_id = int(key)
+            print(f"\nSelected Dynamixel ID: {self.selected_id}")
+        elif key == 'w':
+            self.dc_pwm = min(255, self.dc_pwm + 50)
+        elif key == 's':
+            self.dc_pwm = max(-255, self.dc_pwm - 50)
+        elif key == 'x':
+            self.dc_pwm = 0
+        elif key == 'a':
+            ids_to_move = self.dxl_ids if self.selected_id == 0 else [self.selected_id]
+            for dxl_id in ids_to_move:
+                if self.dxl_mode == 4:
+                    self.dxl_target_pos[dxl_id] += 500
+                else:
+                    self.dxl_target_vel[dxl_id] += 20
+            if self.dxl_mode == 4:
+                self._plan_move(ids_to_move, elapsed)
+        elif key == 'd':
+            ids_to_move = self.dxl_ids if self.selected_id == 0 else [self.selected_id]
+            for dxl_id in ids_to_move:
                 if self.dxl_mode == 4:
-                    self.dxl_mode = 1
-                    for dxl_id in self.dxl_ids:
-                        self.dxl_target_vel[dxl_id] = 0
-                    print("\nMode: Velocity")
+                    self.dxl_target_pos[dxl_id] -= 500
                 else:
-                    self.dxl_mode = 4
-                    print("\nMode: Position (Extended)")
-            elif key == 'e':
-                return ControlCommand(dc_pwm=self.dc_pwm, dxl_mode=self.dxl_mode, dxl_targets=self.dxl_target_pos.copy() if self.dxl_mode == 4 else self.dxl_target_vel.copy(), enable=True)
-            elif key == 'r':
-                return ControlCommand(dc_pwm=self.dc_pwm, dxl_mode=self.dxl_mode, dxl_targets=self.dxl_target_pos.copy() if self.dxl_mode == 4 else self.dxl_target_vel.copy(), enable=False)
-            elif key == ' ':
-                self.dc_pwm = 0
+                    self.dxl_target_vel[dxl_id] -= 20
+            if self.dxl_mode == 4:
+                self._plan_move(ids_to_move, elapsed)
+        elif key == 'm':
+            if self.dxl_mode == 4:
+                self.dxl_mode = 1
                 for dxl_id in self.dxl_ids:
                     self.dxl_target_vel[dxl_id] = 0
+                print("\nMode: Velocity")
+            else:
+                self.dxl_mode = 4
+                print("\nMode: Position (Extended)")
+        elif key == 'e':
+            return True
+        elif key == 'r':
+            return False
+        elif key == ' ':
+            self.dc_pwm = 0
+            for dxl_id in self.dxl_ids:
+                self.dxl_target_vel[dxl_id] = 0
+        return None
+
+    def actuated(self, now: float):
+        """
+        コマンドをハードウェアへ書き込み終えた時刻を受け取り、キー押下からの遅延を記録する
+        (制御ループが書き込みの後に呼ぶ)
+        """
+        if not self._unsent:
+            return
+        self._latencies.extend((now - pressed_at, urgent) for pressed_at, urgent in self._unsent)
+        self._unsent.clear()
+
+    def latency_summary(self) -> str:
+        """キー押下からハードウェアへの書き込みまでの遅延の統計 (緊急キーとそれ以外)"""
+        if not self._latencies:
+            return "Key latency: no keys"
+        parts = []
+        for label, urgent in (("urgent", True), ("other", False)):
+            latencies = sorted(latency for latency, is_urgent in self._latencies if is_urgent == urgent)
+            if not latencies:
+                continue
+            mean = sum(latencies) / len(latencies)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            parts.append(f"{label} {len(latencies)} keys: mean {mean * 1000:.2f} / p99 {p99 * 1000:.2f} / "
+                         f"max {latencies[-1] * 1000:.2f} ms")
+        return "Key latency: " + " | ".join(parts)
+
+    def _plan_move(self, ids: list[int], elapsed: float):
+        """現在位置から目標位置までの移動を計画し、プロファイルをコマンドに設定する"""
+        if self.planner is None:
+            return
+        starts = {dxl_id: self.dxl_state[dxl_id].position if dxl_id in self.dxl_state else self.dxl_target_pos[dxl_id]
+                  for dxl_id in ids}
+        goals = {dxl_id: self.dxl_target_pos[dxl_id] for dxl_id in ids}
+        moves, duration = self.planner.plan(starts, goals)
+        cmd = self.command
+        for dxl_id, move in moves.items():
+            cmd.profile_velocity[dxl_id] = move.velocity
+            cmd.profile_acceleration[dxl_id] = move.acceleration
+        self._move = (elapsed, duration, list(ids))
+        print(f"\nMove: {goals} (planned {duration:.2f} s)")
 
-        targets = self.dxl_target_pos if self.dxl_mode == 4 else self.dxl_target_vel
-        return ControlCommand(dc_pwm=self.dc_pwm, dxl_mode=self.dxl_mode, dxl_targets=targets.copy())
+    def _check_move_done(self, elapsed: float):
+        """移動対象の全IDの Moving が 0 になったら完了を表示する (Moving を読んでいない場合は何もしない)"""
+        if self._move is None:
+            return
+        started, duration, ids = self._move
+        if elapsed <= started:
+            return  # 目標値はこのティックの後で送信されるため、次のティックの状態から判定する
+        for dxl_id in ids:
+            state = self.dxl_state.get(dxl_id)
+            if state is None or state.moving is None:
+                return
+            if state.moving:
+                return
+        self._move = None
+        print(f"\nMove done: {elapsed - started:.2f} s (planned {duration:.2f} s)")
 
     def should_continue(self) -> bool:
         """継続するかどうか"""
         return self._running
 
     def cleanup(self):
-        """ターミナル設定を復元"""
-        termios.tcsetattr(sys.stdin, termios.TCSADRAIN, self._old_settings)
+        """キー入力スレッドを止め、ターミナル設定を復元"""
+        if self._reader is not None:
+            self._reader.close()
 
     def __del__(self):
         try:
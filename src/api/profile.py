@@ -0,0 +1,80 @@
+"""
+ProfilePlanner: ポイント・ツー・ポイント移動の台形プロファイルを計画する
+
+移動ごとに1回だけ Profile Velocity / Profile Acceleration を計算し、目標位置と一緒に送る。
+移動中の補間はサーボ内部のプロファイル生成に任せるため、移動中は目標値を送り続ける必要がない。
+複数IDを同時に動かす場合は、最も時間のかかるIDに合わせて他のIDの速度・加速度を縮め、全IDが同時に到着するようにする。
+"""
+import math
+from dataclasses import dataclass
+
+from hardware.dxl_interface import POSITION_PER_ACCEL_UNIT, POSITION_PER_VELOCITY_UNIT
+
+
+@dataclass(slots=True)
+class ProfileMove:
+    """1つのIDの移動計画"""
+    goal: int          # Goal Position
+    velocity: int      # Profile Velocity (0.229 rpm 単位)
+    acceleration: int  # Profile Acceleration (214.577 rev/min^2 単位)
+
+
+def move_time(distance, velocity, acceleration):
+    """
+    台形プロファイルの所要時間 (秒)
+
+    Args:
+        distance: 移動量 [pulse]
+        velocity: 最高速度 [pulse/s]
+        acceleration: 加速度 [pulse/s^2]
+    """
+    distance = abs(distance)
+    if distance * acceleration >= velocity * velocity:
+        return distance / velocity + velocity / acceleration
+    # 最高速度に達しない (三角形プロファイル)
+    return 2.0 * math.sqrt(distance / acceleration)
+
+
+class ProfilePlanner:
+    """
+    複数IDを同時に到着させる台形プロファイルの計画
+
+    Args:
+        max_velocity: 最高速度 [pulse/s]
+        max_acceleration: 加速度 [pulse/s^2]
+    """
+    def __init__(self, max_velocity, max_acceleration):
+        self.max_velocity = float(max_velocity)
+        self.max_acceleration = float(max_acceleration)
+
+    def plan(self, starts, goals):
+        """
+        移動を計画する
+
+        Args:
+            starts: {ID: 現在位置}
+            goals: {ID: 目標位置}
+
+        Returns:
+            (dict[int, ProfileMove], 予定所要時間 [秒])
+        """
+        distances = {dxl_id: abs(goal - starts.get(dxl_id, goal)) for dxl_id, goal in goals.items()}
+        longest = max(distances.values(), default=0)
+        if longest == 0:
+            velocity, acceleration, duration = self.max_velocity, self.max_acceleration, 0.0
+        else:
+            # 最も遠いIDの形 (最高速度・加速度) を距離の比で縮めると、全IDの所要時間が一致する
+            velocity = min(self.max_velocity, math.sqrt(longest * self.max_acceleration))
+            acceleration = self.max_acceleration
+            duration = move_time(longest, velocity, acceleration)
+
+        moves = {}
+        for dxl_id, goal in goals.items():
+            scale = distances[dxl_id] / longest if longest else 1.0
+            moves[dxl_id] = ProfileMove(
+                goal=int(goal),
+                # 0 はサーボ側で「無制限」になるため最小 1 にする
+                velocity=max(1, round(velocity * scale / POSITION_PER_VELOCITY_UNIT)),
+                acceleration=max(1, round(acceleration * scale / POSITION_PER_ACCEL_UNIT)),
+            )
+        return moves, duration
@@ -1,51 +1,68 @@
 """
 TestController: 時間ベースで目標値を計算するコントローラー
 """
-from dataclasses import dataclass
+from api.command import ControlCommand
+from api.trajectory import Trajectory
+from hardware.dxl_interface import ServoState
 
-@dataclass
-class ControlCommand:
-    """制御コマンド"""
-    dc_pwm: int         # DCモーターPWM (-255 ~ 255)
-    dxl_mode: int       # Dynamixelモード (1: Velocity, 3: Position)
-    dxl_targets: dict[int, int] # IDごとの目標値
-    enable: bool | None = None
+# 組み込みのテスト軌道 (10秒周期)
+# 0-5秒: PWM スイープ & 位置制御 (0 → 4095 = 360deg) / 5-10秒: DCモーター停止 & 速度制御 (100)
+DEFAULT_TRAJECTORY = {
+    'dt': 0.001,
+    'duration': 10.0,
+    'loop': True,
+    'dc_pwm': {'interp': 'linear', 'keys': [[0, -255], [5, 255], [5, 0], [10, 0]]},
+    'dxl_mode': {'keys': [[0, 3], [5, 1]]},
+    'joints': {'interp': 'linear', 'keys': [[0, 0], [5, 4095], [5, 100], [10, 100]]},
+}
 
 
 class TestController:
     """
     時間経過に基づいて目標値を計算するテスト用コントローラー
+
+    Args:
+        dxl_ids: Dynamixel IDのリスト
+        trajectory: 軌道ファイル (YAML) のパス。None の場合は組み込みのテスト軌道
     """
-    def __init__(self, dxl_ids: list[int]):
+    def __init__(self, dxl_ids: list[int], trajectory: str | None = None):
         self.dxl_ids = dxl_ids
-        self.period = 10.0  # 周期 (秒)
+        if trajectory is None:
+            self.trajectory = Trajectory.from_dict(DEFAULT_TRAJECTORY, dxl_ids)
+        else:
+            self.trajectory = Trajectory.load(trajectory, dxl_ids)
+            print(f"Trajectory: {trajectory} ({self.trajectory.duration:.1f} s, loop={self.trajectory.loop})")
+        self._elapsed = 0.0
+        self.command = ControlCommand(dxl_ids)
 
-    def update(self, elapsed: float) -> ControlCommand:
+    def update(self, elapsed: float, dxl_state: dict[int, ServoState] | None = None) -> ControlCommand:
         """
-        経過時間から目標値を計算する
+        経過時間から目標値を計算する (事前計算した軌道テーブルを引くだけ)
 
         Args:
             elapsed: 経過時間 (秒)
+            dxl_state: IDごとのDynamixel現在状態 (未使用だがインターフェース統一のため)
 
         Returns:
-            ControlCommand: 制御コマンド
+            ControlCommand: 制御コマンド (毎回同じオブジェクトを書き換えて返す)
         """
-        phase = elapsed % self.period
+        self._elapsed = elapsed
+        dc_pwm, dxl_mode, joints = self.trajectory.sample(elapsed)
+        cmd = self.command
+        cmd.dc_pwm = int(dc_pwm)
+        cmd.dxl_mode = dxl_mode
+        cmd.dxl_targets.assign(joints.tolist())
+        return cmd
 
-        if phase < 5.0:
-            # Phase 1: PWM Sweep & Position Control
-            dc_pwm = int((phase / 5.0) * 510 - 255)
-            dxl_mode = 3  # Position Mode
-            dxl_target = int((phase / 5.0) * 4095)  # 4095 = 360deg
-        else:
-            # Phase 2: Pico Stop & Velocity Control
-            dc_pwm = 0
-            dxl_mode = 1  # Velocity Mode
-            dxl_target = 100  # 100rpm
+    def dc_pwm_at(self, elapsed: float) -> int:
+        """
+        任意の時刻の DCモーターPWM (セグメントストリーミングで先の時刻の値を MCU へ送るために使う)
 
-        targets = {id: dxl_target for id in self.dxl_ids}
-        return ControlCommand(dc_pwm=dc_pwm, dxl_mode=dxl_mode, dxl_targets=targets)
+        Args:
+            elapsed: 経過時間 (秒)
+        """
+        return int(self.trajectory.sample_dc(elapsed))
 
     def should_continue(self) -> bool:
-        """継続するかどうか (常にTrue)"""
-        return True
+        """継続するかどうか (ループしない軌道は終端まで)"""
+        return not self.trajectory.finished(self._elapsed)
@@ -0,0 +1,249 @@
+"""
+Trajectory: 時間ベースの目標値を事前計算したテーブルから引く
+
+キーフレームで与えた軌道を起動時に一定間隔 (dt) の NumPy 配列へ展開しておき、
+制御ループでは elapsed からインデックスを計算して隣接2サンプルを線形補間するだけにする。
+軌道がどれだけ複雑でも1ティックあたりのコストは一定。
+
+チャンネル:
+    dc_pwm:   DCモーターPWM
+    dxl_mode: Dynamixelモード (step 補間のみ)
+    joints:   Dynamixel の目標値 (全IDで共通の軌道 + IDごとの位相オフセット, または IDごとの軌道)
+
+補間方法 (キーフレーム間):
+    step:   次のキーフレームまで値を保持
+    linear: 線形補間
+    spline: Catmull-Rom (3次エルミート) 補間
+    同じ時刻のキーフレームを2つ並べると、その時刻で値がジャンプする (例: [[5, 4095], [5, 100]])。
+    ジャンプの時刻は dt の格子に丸められ、前後の値を補間で混ぜることはない。
+
+ファイル形式 (YAML):
+    dt: 0.001        # テーブルの時間分解能 (秒)
+    duration: 10.0   # 軌道の長さ (秒, 省略時は最後のキーフレーム)
+    loop: true       # 最後まで到達したら先頭に戻る
+    dc_pwm:   {interp: linear, keys: [[0, -255], [5, 255], [5, 0], [10, 0]]}
+    dxl_mode: {keys: [[0, 3], [5, 1]]}
+    joints:
+      interp: spline
+      keys: [[0, 0], [2.5, 2048], [5, 4095]]
+      phase: {2: 0.5, 3: 1.0}    # IDごとの時間オフセット (秒)
+      per_id: {3: {interp: linear, keys: [[0, 0], [10, 1000]]}}  # 特定IDだけ別の軌道
+"""
+import numpy as np
+import yaml
+
+INTERPOLATIONS = ('step', 'linear', 'spline')
+
+
+class Profile:
+    """
+    キーフレームで表した1次元の軌道
+
+    Args:
+        keys: [(時刻, 値), ...] (時刻は昇順。同じ時刻を並べるとジャンプ)
+        interp: 'step', 'linear', 'spline'
+    """
+    def __init__(self, keys, interp='linear'):
+        if interp not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation: {interp}")
+        if len(keys) == 0:
+            raise ValueError("Profile needs at least one keyframe")
+        keys = np.asarray(keys, dtype=np.float64)
+        if np.any(np.diff(keys[:, 0]) < 0):
+            raise ValueError("Keyframe times must be non-decreasing")
+        self.times = keys[:, 0]
+        self.values = keys[:, 1]
+        self.interp = interp
+
+    @staticmethod
+    def from_dict(data, default_interp='linear'):
+        return Profile(data['keys'], data.get('interp', default_interp))
+
+    @property
+    def end(self):
+        return float(self.times[-1])
+
+    def jump_times(self):
+        """値が不連続に変わる時刻"""
+        times, values = self.times, self.values
+        changed = values[1:] != values[:-1]
+        if self.interp != 'step':
+            changed &= times[1:] == times[:-1]
+        return times[1:][changed]
+
+    def evaluate(self, t):
+        """時刻の配列 t に対する値を返す (キーフレームの範囲外は端の値を保持)"""
+        times, values = self.times, self.values
+        t = np.asarray(t, dtype=np.float64)
+        # ジャンプ (同時刻のキーフレーム) では後ろ側の値を使うため side='right'
+        i = np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 1)
+        if self.interp == 'step' or len(times) == 1:
+            return values[i]
+
+        i = np.minimum(i, len(times) - 2)
+        t0, t1 = times[i], times[i + 1]
+        v0, v1 = values[i], values[i + 1]
+        span = t1 - t0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = np.where(span > 0, (t - t0) / span, 1.0)
+        u = np.clip(u, 0.0, 1.0)
+        if self.interp == 'linear':
+            return v0 + (v1 - v0) * u
+
+        # Catmull-Rom: 接線は前後のキーフレームとの傾き (ジャンプの向こう側は使わない)
+        slopes = self._slopes()
+        m0 = slopes[i] * span
+        m1 = slopes[i + 1] * span
+        u2 = u * u
+        u3 = u2 * u
+        return ((2 * u3 - 3 * u2 + 1) * v0 + (u3 - 2 * u2 + u) * m0
+                + (-2 * u3 + 3 * u2) * v1 + (u3 - u2) * m1)
+
+    def _slopes(self):
+        """各キーフレームでの接線の傾き (値/秒)"""
+        times, values = self.times, self.values
+        dt = np.diff(times)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            seg = np.where(dt > 0, np.diff(values) / dt, 0.0)
+        slopes = np.zeros(len(times))
+        for k in range(len(times)):
+            left = seg[k - 1] if k > 0 and dt[k - 1] > 0 else None
+            right = seg[k] if k < len(seg) and dt[k] > 0 else None
+            if left is not None and right is not None:
+                slopes[k] = (left + right) / 2
+            elif left is not None or right is not None:
+                slopes[k] = left if left is not None else right
+        return slopes
+
+
+class Trajectory:
+    """
+    全チャンネルを一定間隔で事前計算した軌道テーブル
+
+    Args:
+        dxl_ids: Dynamixel IDのリスト (joints の列の並び)
+        dc_pwm: DCモーターPWMの Profile
+        dxl_mode: Dynamixelモードの Profile (補間方法によらず step として扱う)
+        joints: 全IDに共通の目標値の Profile
+        phase: {ID: 時間オフセット (秒)} joints を t + offset の時刻で評価する
+        per_id: {ID: Profile} 特定IDの目標値を別の軌道にする
+        dt: テーブルの時間分解能 (秒)
+        duration: 軌道の長さ (秒, None の場合は最後のキーフレーム)
+        loop: True の場合は duration で先頭に戻る
+    """
+    def __init__(self, dxl_ids, dc_pwm, dxl_mode, joints, phase=None, per_id=None,
+                 dt=0.001, duration=None, loop=True):
+        self.dxl_ids = list(dxl_ids)
+        phase = phase or {}
+        per_id = per_id or {}
+        if duration is None:
+            duration = max([dc_pwm.end, dxl_mode.end, joints.end] + [p.end for p in per_id.values()])
+        if duration <= 0:
+            raise ValueError("Trajectory duration must be positive")
+        self.dt = dt
+        self.duration = duration
+        self.loop = loop
+
+        steps = int(round(duration / dt))
+        t = np.arange(steps + 1) * dt
+        if dxl_mode.interp != 'step':
+            dxl_mode = Profile(np.column_stack((dxl_mode.times, dxl_mode.values)), 'step')
+        self.dc_pwm = dc_pwm.evaluate(t)
+        self.dxl_mode = np.rint(dxl_mode.evaluate(t)).astype(np.int64)
+
+        # 不連続点を含むサンプル間隔では補間しない
+        # (モード切替の直前に位置と速度の目標値を混ぜた値を出さないため)
+        self._hold = np.zeros(steps, dtype=bool)
+        self._mark_jumps(dc_pwm.jump_times())
+        self._mark_jumps(dxl_mode.jump_times())
+
+        # joints: (サンプル数, ID数)
+        self.joints = np.empty((len(t), len(self.dxl_ids)))
+        for col, dxl_id in enumerate(self.dxl_ids):
+            profile = per_id.get(dxl_id, joints)
+            offset = phase.get(dxl_id, 0.0)
+            tj = t + offset
+            jumps = profile.jump_times() - offset
+            if loop and offset:
+                # 位相をずらした列は途中で軌道の終端から先頭へ戻る
+                ends = profile.evaluate([0.0, duration])
+                if ends[0] != ends[1]:
+                    jumps = np.append(jumps, -offset)
+            if loop:
+                tj = np.mod(tj, duration)
+                jumps = np.mod(jumps, duration)
+            self.joints[:, col] = profile.evaluate(tj)
+            self._mark_jumps(jumps)
+
+        self._last = steps
+        self._row = np.empty(len(self.dxl_ids))
+        # 区間ごとの差分 (sample() の補間を乗算と加算の2回にするため)。不連続点を含む区間は 0 にして値を保持する
+        self._joints_delta = np.diff(self.joints, axis=0)
+        self._joints_delta[self._hold] = 0.0
+        self._dc_delta = np.diff(self.dc_pwm)
+        self._dc_delta[self._hold] = 0.0
+
+    def _mark_jumps(self, jump_times):
+        # 時刻 jt のジャンプは区間 (t[k-1], t[k]] に含まれる
+        k = np.ceil(np.asarray(jump_times) / self.dt - 1e-9).astype(np.int64)
+        k = k[(k >= 1) & (k <= len(self._hold))]
+        self._hold[k - 1] = True
+
+    @staticmethod
+    def from_dict(data, dxl_ids):
+        """辞書 (YAMLファイルの内容) から軌道を作る"""
+        joints_data = data['joints']
+        joints = Profile.from_dict(joints_data)
+        return Trajectory(
+            dxl_ids,
+            dc_pwm=Profile.from_dict(data.get('dc_pwm', {'keys': [[0, 0]]})),
+            dxl_mode=Profile.from_dict(data.get('dxl_mode', {'keys': [[0, 3]]}), 'step'),
+            joints=joints,
+            phase={int(k): float(v) for k, v in joints_data.get('phase', {}).items()},
+            per_id={int(k): Profile.from_dict(v, joints.interp) for k, v in joints_data.get('per_id', {}).items()},
+            dt=float(data.get('dt', 0.001)),
+            duration=data.get('duration'),
+            loop=bool(data.get('loop', True)),
+        )
+
+    @staticmethod
+    def load(path, dxl_ids):
+        """YAMLファイルから軌道を読み込む"""
+        with open(path) as f:
+            return Trajectory.from_dict(yaml.safe_load(f), dxl_ids)
+
+    def finished(self, elapsed):
+        """ループしない軌道の終端を過ぎたかどうか"""
+        return not self.loop and elapsed > self.duration
+
+    def _locate(self, elapsed):
+        """elapsed が含まれる区間の番号と区間内の位置 (0-1) を返す"""
+        pos = elapsed / self.dt
+        if self.loop:
+            pos %= self._last
+        elif pos < 0:
+            pos = 0.0
+        i = int(pos)
+        if i >= self._last:
+            return self._last - 1, 1.0
+        return i, pos - i
+
+    def sample_dc(self, elapsed):
+        """elapsed の時点の DCモーターPWM だけを返す (先の時刻のセグメントを作るため, 内部バッファを使わない)"""
+        i, frac = self._locate(elapsed)
+        return float(self.dc_pwm[i] + self._dc_delta[i] * frac)
+
+    def sample(self, elapsed):
+        """
+        elapsed の時点の値を返す (O(1))
+
+        Returns:
+            (dc_pwm, dxl_mode, joints): joints は内部バッファ (次の sample() で上書きされる)
+        """
+        i, frac = self._locate(elapsed)
+        row = self._row
+        np.multiply(self._joints_delta[i], frac, out=row)
+        row += self.joints[i]
+        dc = self.dc_pwm[i] + self._dc_delta[i] * frac
+        # モードは補間せず、区間の始点の値を使う
+        return float(dc), int(self.dxl_mode[i]), row
@@ -0,0 +1,209 @@
+"""
+BusStats: バスの通信統計 (ID ごとの応答時間ヒストグラム・タイムアウト・破損パケット・エラービット)
+
+DynamixelInterface / DCMotorInterface が通信のたびに記録し、制御ループが定期的に表示する。
+どのサーボ (またはケーブル) がループ時間を食っているかを実行中に確認するためのもの。
+
+記録は各バスの I/O スレッドから、参照は表示側のスレッドから行うため、ロックで保護する。
+"""
+import threading
+
+from dynamixel_sdk import COMM_SUCCESS, COMM_PORT_BUSY, COMM_TX_FAIL, COMM_TX_ERROR, COMM_RX_TIMEOUT, COMM_RX_CORRUPT
+
+# 応答時間ヒストグラムの区切り (ms)。最後のビンはそれ以上
+LATENCY_BINS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+
+# 通信結果の分類
+RESULT_NAMES = {
+    COMM_SUCCESS: 'ok',
+    COMM_RX_TIMEOUT: 'timeout',
+    COMM_RX_CORRUPT: 'corrupt',   # CRC 不一致・不正なステータスパケット
+    COMM_TX_FAIL: 'tx_fail',
+    COMM_TX_ERROR: 'tx_fail',
+    COMM_PORT_BUSY: 'busy',
+}
+
+# ステータスパケットの Error バイト (Protocol 2.0): bit7 = Alert, 下位7ビット = エラー番号
+ERROR_ALERT = 0x80
+ERROR_NAMES = {1: 'result_fail', 2: 'instruction', 3: 'crc', 4: 'data_range', 5: 'data_length',
+               6: 'data_limit', 7: 'access'}
+
+# Hardware Error Status (70) のビット
+HARDWARE_ERROR_BITS = {0: 'input_voltage', 2: 'overheating', 3: 'motor_encoder', 4: 'electrical_shock', 5: 'overload'}
+
+
+def hardware_error_names(value):
+    """Hardware Error Status の値を名前のリストにする"""
+    return [name for bit, name in HARDWARE_ERROR_BITS.items() if value & (1 << bit)]
+
+
+class LinkStats:
+    """1つの通信相手 (サーボ1台, またはバス全体) の統計"""
+    __slots__ = ('results', 'errors', 'alerts', 'hardware_error', 'retries', 'latency_bins', 'latency_sum',
+                 'latency_max', 'latency_count')
+
+    def __init__(self):
+        self.results = {}          # 分類名 -> 回数
+        self.errors = {}           # エラー番号の名前 -> 回数
+        self.alerts = 0            # Alert ビットが立った応答の数
+        self.hardware_error = None  # 最後に読んだ Hardware Error Status (未取得は None)
+        self.retries = 0
+        self.latency_bins = [0] * (len(LATENCY_BINS_MS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+
+    @property
+    def transactions(self):
+        return sum(self.results.values())
+
+    def add_latency(self, latency_ms):
+        bins = self.latency_bins
+        for i, edge in enumerate(LATENCY_BINS_MS):
+            if latency_ms < edge:
+                bins[i] += 1
+                break
+        else:
+            bins[-1] += 1
+        self.latency_sum += latency_ms
+        self.latency_count += 1
+        if latency_ms > self.latency_max:
+            self.latency_max = latency_ms
+
+    def percentile(self, q):
+        """ヒストグラムから q パーセンタイルの応答時間 (ms, ビンの上端) を求める"""
+        if self.latency_count == 0:
+            return 0.0
+        rank = q / 100.0 * self.latency_count
+        seen = 0
+        for i, count in enumerate(self.latency_bins):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BINS_MS[i] if i < len(LATENCY_BINS_MS) else self.latency_max
+        return self.latency_max
+
+    def snapshot(self):
+        return {
+            'transactions': self.transactions,
+            'results': dict(self.results),
+            'errors': dict(self.errors),
+            'alerts': self.alerts,
+            'hardware_error': None if self.hardware_error is None else hardware_error_names(self.hardware_error),
+            'retries': self.retries,
+            'latency_ms': {
+                'mean': self.latency_sum / self.latency_count if self.latency_count else 0.0,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.latency_max,
+                'bins': dict(zip([f"<{edge}" for edge in LATENCY_BINS_MS] + [f">={LATENCY_BINS_MS[-1]}"],
+                                 self.latency_bins)),
+            },
+        }
+
+
+class BusStats:
+    """
+    1つのバスの通信統計
+
+    record() は ID ごと、record_bus() は応答のない送信 (Sync Write など) をバス全体として記録する。
+
+    Args:
+        name: バスの名前 (ポート名など)
+    """
+    BUS = 'bus'  # 応答のない送信を記録するキー
+
+    def __init__(self, name):
+        self.name = name
+        self._links = {}
+        self._lock = threading.Lock()
+
+    def _link(self, key):
+        link = self._links.get(key)
+        if link is None:
+            link = self._links[key] = LinkStats()
+        return link
+
+    def record(self, dxl_id, result, latency=None, error=0):
+        """
+        1回の送受信を記録する
+
+        Args:
+            dxl_id: 相手の ID
+            result: SDK の通信結果 (COMM_SUCCESS など)
+            latency: 送信開始から応答を受信するまでの時間 (秒, 応答がない場合は None)
+            error: ステータスパケットの Error バイト
+        """
+        name = RESULT_NAMES.get(result, 'other')
+        with self._lock:
+            link = self._link(dxl_id)
+            link.results[name] = link.results.get(name, 0) + 1
+            if latency is not None and result == COMM_SUCCESS:
+                link.add_latency(latency * 1000.0)
+            if error:
+                if error & ERROR_ALERT:
+                    link.alerts += 1
+                code = error & ~ERROR_ALERT
+                if code:
+                    code_name = ERROR_NAMES.get(code, f'error_{code}')
+                    link.errors[code_name] = link.errors.get(code_name, 0) + 1
+
+    def record_bus(self, result, latency=None):
+        """応答のない送信 (Sync Write など) を記録する"""
+        self.record(self.BUS, result, latency)
+
+    def record_retry(self, dxl_id):
+        with self._lock:
+            self._link(dxl_id).retries += 1
+
+    def set_hardware_error(self, dxl_id, value):
+        with self._lock:
+            self._link(dxl_id).hardware_error = value
+
+    def count(self, dxl_id, name, n=1):
+        """通信結果以外のイベント (受信エラーなど) を記録する"""
+        with self._lock:
+            link = self._link(dxl_id)
+            link.results[name] = link.results.get(name, 0) + n
+
+    def snapshot(self):
+        """{ID (または 'bus'): 統計の辞書} を返す"""
+        with self._lock:
+            return {key: link.snapshot() for key, link in self._links.items()}
+
+    def reset(self):
+        with self._lock:
+            self._links.clear()
+
+    def format(self):
+        """1バス分の統計を表示用の行のリストにする"""
+        lines = []
+        with self._lock:
+            items = sorted(self._links.items(), key=lambda item: (isinstance(item[0], str), str(item[0])))
+            for key, link in items:
+                if link.transactions == 0:
+                    continue
+                text = f"  {self.name} {key!s:>6}: {link.transactions:6d} tx"
+                if link.latency_count:
+                    text += (f" | {link.latency_sum / link.latency_count:6.2f} ms mean, "
+                             f"p99 <{link.percentile(99):.4g}, max {link.latency_max:6.2f} ms")
+                failures = {name: n for name, n in link.results.items() if name != 'ok'}
+                if failures:
+                    text += " | " + ", ".join(f"{name} {n}" for name, n in sorted(failures.items()))
+                if link.retries:
+                    text += f" | retries {link.retries}"
+                if link.errors:
+                    text += " | errors " + ", ".join(f"{name} {n}" for name, n in sorted(link.errors.items()))
+                if link.alerts:
+                    text += f" | alerts {link.alerts}"
+                    if link.hardware_error is not None:
+                        text += f" ({', '.join(hardware_error_names(link.hardware_error)) or 'cleared'})"
+                lines.append(text)
+        return lines
+
+
+def format_report(stats_list):
+    """複数バスの統計をまとめて表示用の文字列にする"""
+    lines = []
+    for stats in stats_list:
+        lines.extend(stats.format())
+    return "\n".join(["Bus stats:"] + lines) if lines else "Bus stats: no transactions"
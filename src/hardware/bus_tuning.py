@@ -0,0 +1,363 @@
+"""
+BusTuner: Dynamixel バスの通信速度の自動調整
+
+制御ループの1往復の時間は、ボーレートで決まる転送時間と、サーボが応答を返すまで待つ
+Return Delay Time (工場出荷時 250 = 500 us) で下限が決まる。
+BusTuner はバス上のサーボを探して往復時間を測り、Return Delay Time を最小にしてから、
+全IDと U2D2 を1段ずつ速いボーレートへ一緒に切り替える。切り替えるたびに制御ループと同じ
+Sync Read を繰り返し、1回でも失敗したボーレートは採用せずに直前のボーレートへ戻す。
+
+Baud Rate(8) と Return Delay Time(9) は EEPROM 領域のため、書き込む間はトルクを OFF にする。
+"""
+import time
+from dataclasses import dataclass
+
+from dynamixel_sdk import BROADCAST_ID, COMM_SUCCESS, GroupSyncRead, PacketHandler
+from hardware.dxl_interface import BAUD_RATE_TABLE, READ_WAIT
+
+ADDR_BAUD_RATE = 8
+ADDR_RETURN_DELAY_TIME = 9
+ADDR_TORQUE_ENABLE = 64
+ADDR_PRESENT_CURRENT = 126
+STATE_READ_LENGTH = 10  # Present Current(126) ~ Present Position(132) (制御ループの Sync Read と同じ)
+
+MAX_BAUD_RATE = 4000000  # U2D2 で使う上限
+BAUD_INDEX = {rate: index for index, rate in BAUD_RATE_TABLE.items()}
+# サーボを探すボーレート (4.5M は U2D2 のポートに設定できないため除く)
+SEARCH_BAUD_RATES = sorted(rate for rate in BAUD_INDEX if rate <= MAX_BAUD_RATE)
+
+
+@dataclass(slots=True)
+class RoundTrip:
+    """Sync Read の往復時間の測定結果"""
+    baud_rate: int
+    trials: int
+    failures: int
+    mean_ms: float | None
+    p99_ms: float | None
+    max_ms: float | None
+
+    @property
+    def reliable(self):
+        return self.failures == 0 and self.trials > 0
+
+    def __str__(self):
+        if self.mean_ms is None:
+            return f"{self.baud_rate} bps: no response ({self.failures}/{self.trials} failed)"
+        return (f"{self.baud_rate} bps: mean {self.mean_ms:.2f} ms, p99 {self.p99_ms:.2f} ms, "
+                f"max {self.max_ms:.2f} ms ({self.failures}/{self.trials} failed)")
+
+
+@dataclass
+class TuneResult:
+    """1つのバスの調整結果"""
+    baud_rate: int                 # 全IDが応答するボーレート (失敗した場合も戻せたボーレート)
+    return_delay: dict[int, int]   # {ID: Return Delay Time}
+    before: RoundTrip
+    after: RoundTrip
+    ok: bool = True                # False: 応答しないIDが残った (config.yaml は更新しない)
+
+
+class BusTuner:
+    """
+    1つの Dynamixel バスのボーレートと Return Delay Time を調整する
+
+    Args:
+        port_handler: 開いたポート (PortHandler)
+        ids: 調整するID
+        trials: 各ボーレートで確認する Sync Read の回数 (1回でも失敗したら採用しない)
+    """
+    SETTLE_TIME = 0.05     # Baud Rate を書き込んでからサーボが切り替わるまでの待ち時間 (秒)
+    PING_RETRIES = 3       # 探索時に1つのボーレートで ping する回数
+    RESTORE_ATTEMPTS = 3   # 直前のボーレートへ戻す試行回数
+    MAX_FAILURES = 5       # 測定を打ち切る失敗回数 (応答しないボーレートでタイムアウトを待ち続けない)
+
+    def __init__(self, port_handler, ids, trials=100):
+        self.port = port_handler
+        self.packet = PacketHandler(2.0)
+        self.ids = list(ids)
+        self.trials = trials
+        self.locations = {}  # ID -> 応答したボーレート
+
+    def _set_port_baud(self, baud_rate):
+        """U2D2 (ホスト側) のボーレートを切り替える"""
+        if not self.port.setBaudRate(baud_rate):
+            print(f"[tune] {self.port.getPortName()}: failed to set the port to {baud_rate} bps")
+            return False
+        # setBaudRate() でシリアルが開き直されるため、その後に設定する
+        if self.port.ser is not None:
+            self.port.ser.timeout = READ_WAIT
+        self.port.clearPort()
+        return True
+
+    def _ping(self, dxl_id, retries=1):
+        return any(self.packet.ping(self.port, dxl_id)[1] == COMM_SUCCESS for _ in range(retries))
+
+    def _write1(self, dxl_id, address, value):
+        result, error = self.packet.write1ByteTxRx(self.port, dxl_id, address, value)
+        return result == COMM_SUCCESS and error == 0
+
+    def _read1(self, dxl_id, address):
+        """1バイト読み出す。失敗した場合は None"""
+        value, result, error = self.packet.read1ByteTxRx(self.port, dxl_id, address)
+        return value if result == COMM_SUCCESS and error == 0 else None
+
+    def discover(self, first_baud=None):
+        """
+        SEARCH_BAUD_RATES のすべてで ping し、各IDのボーレートを調べる (first_baud から試す)
+
+        Returns:
+            dict[int, int]: {ID: ボーレート} (見つからなかったIDは含まない)
+        """
+        order = SEARCH_BAUD_RATES
+        if first_baud in BAUD_INDEX:
+            order = [first_baud] + [b for b in order if b != first_baud]
+        self.locations = {}
+        for baud_rate in order:
+            missing = [dxl_id for dxl_id in self.ids if dxl_id not in self.locations]
+            if not missing:
+                break
+            if not self._set_port_baud(baud_rate):
+                continue
+            for dxl_id in missing:
+                if self._ping(dxl_id, self.PING_RETRIES):
+                    self.locations[dxl_id] = baud_rate
+        return dict(self.locations)
+
+    def measure(self, trials=None):
+        """制御ループと同じ状態の Sync Read を繰り返し、往復時間と失敗回数を測る"""
+        trials = trials or self.trials
+        reader = GroupSyncRead(self.port, self.packet, ADDR_PRESENT_CURRENT, STATE_READ_LENGTH)
+        for dxl_id in self.ids:
+            reader.addParam(dxl_id)
+        times, failures = [], 0
+        for trial in range(trials):
+            if failures >= self.MAX_FAILURES:
+                trials = trial
+                break
+            start = time.perf_counter()
+            result = reader.txRxPacket()
+            elapsed = time.perf_counter() - start
+            if result == COMM_SUCCESS and all(reader.isAvailable(dxl_id, ADDR_PRESENT_CURRENT, STATE_READ_LENGTH)
+                                              for dxl_id in self.ids):
+                times.append(elapsed * 1000.0)
+            else:
+                failures += 1
+                # 遅れて届いた応答が次の読み取りに混ざらないようにする
+                time.sleep(self.SETTLE_TIME)
+                self.port.clearPort()
+        if not times:
+            return RoundTrip(self.port.getBaudRate(), trials, failures, None, None, None)
+        times.sort()
+        return RoundTrip(self.port.getBaudRate(), trials, failures, sum(times) / len(times),
+                         times[min(len(times) - 1, int(len(times) * 0.99))], times[-1])
+
+    def disable_torque(self):
+        """
+        EEPROM に書き込めるよう全IDのトルクを OFF にする
+
+        Returns:
+            list[int] | None: OFF にしたID (もともと OFF のIDは含まない)。失敗した場合は None
+        """
+        disabled = []
+        for dxl_id in self.ids:
+            torque = self._read1(dxl_id, ADDR_TORQUE_ENABLE)
+            if torque is None:
+                print(f"[tune] ID {dxl_id}: failed to read Torque Enable")
+                return None
+            if torque:
+                if not self._write1(dxl_id, ADDR_TORQUE_ENABLE, 0):
+                    print(f"[tune] ID {dxl_id}: failed to disable torque")
+                    return None
+                disabled.append(dxl_id)
+        return disabled
+
+    def restore_torque(self, ids):
+        for dxl_id in ids:
+            if not self._write1(dxl_id, ADDR_TORQUE_ENABLE, 1):
+                print(f"[tune] ID {dxl_id}: failed to re-enable torque")
+
+    def read_return_delays(self):
+        """{ID: Return Delay Time} (読めなかったIDは含まない)"""
+        delays = {}
+        for dxl_id in self.ids:
+            value = self._read1(dxl_id, ADDR_RETURN_DELAY_TIME)
+            if value is not None:
+                delays[dxl_id] = value
+        return delays
+
+    def set_return_delays(self, delays):
+        """
+        Return Delay Time を書き込む
+
+        Args:
+            delays: {ID: 値 (2 us 単位)}
+
+        Returns:
+            bool: すべて書き込めたか
+        """
+        ok = True
+        for dxl_id, value in delays.items():
+            if not self._write1(dxl_id, ADDR_RETURN_DELAY_TIME, value):
+                print(f"[tune] ID {dxl_id}: failed to write Return Delay Time")
+                ok = False
+        return ok
+
+    def move_to(self, baud_rate):
+        """
+        全IDと U2D2 を baud_rate に切り替える
+
+        各IDには現在のボーレートで Baud Rate を書き込む (書き込みの応答は変更前のボーレートで返る)。
+
+        Returns:
+            bool: すべての書き込みが成功し、U2D2 を切り替えられたか
+        """
+        ok = True
+        for current in sorted(set(self.locations.values())):
+            ids = [dxl_id for dxl_id, rate in self.locations.items() if rate == current and rate != baud_rate]
+            if not ids or not self._set_port_baud(current):
+                continue
+            for dxl_id in ids:
+                if self._write1(dxl_id, ADDR_BAUD_RATE, BAUD_INDEX[baud_rate]):
+                    self.locations[dxl_id] = baud_rate
+                else:
+                    # 書き込みは届いて応答だけが壊れた可能性もあるため、ボーレートは不明のまま扱う
+                    print(f"[tune] ID {dxl_id}: failed to write Baud Rate {baud_rate} at {current} bps")
+                    ok = False
+        time.sleep(self.SETTLE_TIME)
+        return self._set_port_baud(baud_rate) and ok
+
+    def restore(self, baud_rate, failed_baud):
+        """
+        全IDを baud_rate に戻す
+
+        応答が壊れるボーレートでも書き込みは届くことが多いため、応答を必要としないブロードキャストで
+        Baud Rate を書き込む。まず failed_baud で、それでも戻らないIDがあれば SEARCH_BAUD_RATES のすべてで送る
+        (そのボーレートにいる設定外のサーボも baud_rate に揃う)。
+
+        Returns:
+            bool: 全IDが baud_rate で応答したか
+        """
+        index = BAUD_INDEX[baud_rate]
+        sweeps = [[failed_baud], [b for b in SEARCH_BAUD_RATES if b not in (baud_rate, failed_baud)]]
+        for attempt in range(self.RESTORE_ATTEMPTS):
+            for sources in sweeps:
+                for source in sources:
+                    if not self._set_port_baud(source):
+                        continue
+                    for _ in range(self.PING_RETRIES):
+                        self.packet.write1ByteTxOnly(self.port, BROADCAST_ID, ADDR_BAUD_RATE, index)
+                time.sleep(self.SETTLE_TIME)
+                if not self._set_port_baud(baud_rate):
+                    return False
+                missing = [dxl_id for dxl_id in self.ids if not self._ping(dxl_id, self.PING_RETRIES)]
+                if not missing and self.measure().reliable:
+                    self.locations = {dxl_id: baud_rate for dxl_id in self.ids}
+                    return True
+            print(f"[tune] restore to {baud_rate} bps (attempt {attempt + 1}): IDs {missing} not responding")
+        self.discover(baud_rate)
+        return False
+
+    def tune(self, start_baud, max_baud=MAX_BAUD_RATE, return_delay=0, dry_run=False):
+        """
+        サーボを探し、Return Delay Time を最小化してから、確実に通信できる最も速いボーレートへ切り替える
+
+        Args:
+            start_baud: 現在の設定のボーレート (最初に探す)
+            max_baud: 試す最高のボーレート
+            return_delay: 設定する Return Delay Time (2 us 単位, 0 で最小)
+            dry_run: 測定だけを行い、最後に Return Delay Time とボーレートを元に戻す
+
+        Returns:
+            TuneResult | None: サーボが見つからない・現在の設定でも通信が不安定な場合は None
+        """
+        found = self.discover(start_baud)
+        missing = [dxl_id for dxl_id in self.ids if dxl_id not in found]
+        if missing:
+            print(f"[tune] {self.port.getPortName()}: IDs {missing} not found at any baud rate")
+            return None
+        bauds = sorted(set(found.values()))
+        base = start_baud if start_baud in bauds else bauds[0]
+        if len(bauds) > 1 and dry_run:
+            print(f"[tune] servos found at {bauds} bps, a dry run cannot measure them without moving them")
+            return None
+        if len(bauds) > 1:
+            # ボーレートが揃っていない場合は、まず設定のボーレート (なければ最も遅いもの) に揃える
+            print(f"[tune] servos found at {bauds} bps, moving all to {base} bps")
+            if not self.move_to(base) and not self.restore(base, bauds[-1]):
+                return None
+        else:
+            self._set_port_baud(base)
+        print(f"[tune] {self.port.getPortName()}: IDs {self.ids} at {base} bps")
+
+        before = self.measure()
+        print(f"[tune] before: {before}")
+        if not before.reliable:
+            print("[tune] communication is not reliable at the current baud rate, check the wiring and power")
+            return None
+
+        torque_ids = self.disable_torque()
+        if torque_ids is None:
+            return None
+        try:
+            delays = self.read_return_delays()
+            if len(delays) != len(self.ids):
+                print("[tune] failed to read Return Delay Time")
+                return None
+            original = dict(delays)
+            changes = {dxl_id: return_delay for dxl_id, value in delays.items() if value != return_delay}
+            if changes:
+                ok = self.set_return_delays(changes) and self.measure().reliable
+                if ok:
+                    delays.update(changes)
+                    print(f"[tune] Return Delay Time -> {return_delay * 2} us ({sorted(changes)})")
+                else:
+                    print("[tune] communication failed after changing Return Delay Time, restoring")
+                    self.set_return_delays({dxl_id: delays[dxl_id] for dxl_id in changes})
+
+            good = base
+            for baud_rate in [b for b in sorted(BAUD_INDEX) if base < b <= max_baud]:
+                if self.move_to(baud_rate):
+                    trip = self.measure()
+                    print(f"[tune] try {trip}")
+                    if trip.reliable:
+                        good = baud_rate
+                        continue
+                print(f"[tune] {baud_rate} bps is not reliable, restoring {good} bps")
+                if not self.restore(good, baud_rate):
+                    print(f"[tune] failed to restore {good} bps. Servos found at: {self.locations} "
+                          "(run 'python src/main.py tune' again or 'make setup' to locate them)")
+                    return TuneResult(good, delays, before, before, ok=False)
+                break
+
+            after = self.measure()
+            print(f"[tune] after: {after}")
+            if dry_run:
+                return self._revert(TuneResult(good, delays, before, after), base, original)
+            return TuneResult(good, delays, before, after)
+        finally:
+            self.restore_torque(torque_ids)
+
+    def _revert(self, result, base, delays):
+        """
+        ドライラン: 変更する内容を表示し、Return Delay Time とボーレートを調整前に戻す
+
+        Args:
+            result: 調整結果 (変更する内容)
+            base: 調整前のボーレート
+            delays: 調整前の {ID: Return Delay Time}
+        """
+        changed = {dxl_id: value for dxl_id, value in delays.items() if result.return_delay[dxl_id] != value}
+        print(f"[tune] dry run: would set {base} -> {result.baud_rate} bps"
+              + (f", Return Delay Time {sorted(set(changed.values()))} -> {sorted(set(result.return_delay.values()))}"
+                 f" ({sorted(changed)})" if changed else ""))
+        if changed and not self.set_return_delays(changed):
+            result.ok = False
+        if result.baud_rate != base and not (self.move_to(base) and self.measure().reliable):
+            print(f"[tune] {base} bps is not reliable after moving back, restoring")
+            if not self.restore(base, result.baud_rate):
+                print(f"[tune] failed to restore {base} bps. Servos found at: {self.locations}")
+                result.ok = False
+        if result.ok:
+            print(f"[tune] dry run: restored {base} bps and the original Return Delay Time")
+        return result
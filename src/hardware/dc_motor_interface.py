@@ -1,53 +1,310 @@
 import serial
 import time
 import threading
+from collections import deque
+from dynamixel_sdk import COMM_SUCCESS, COMM_TX_FAIL
+from hardware import motor_protocol as proto
+from hardware.bus_stats import BusStats
 
 class DCMotorInterface:
-    def __init__(self, port, baudrate=115200):
-        self.ser = serial.Serial(port, baudrate, timeout=0.1)
+    NEGOTIATE_TIMEOUT = 0.3  # バイナリプロトコル切り替え応答の待ち時間 (秒)
+    PING_INTERVAL = 0.1      # 起動確認の再送間隔 (秒)
+
+    def __init__(self, port, baudrate=115200, history_size=256, protocol="ascii", keepalive_interval=0.5,
+                 serial_port=None, ready_timeout=3.0):
+        # serial_port: シミュレーション等で差し替える場合に pyserial 互換オブジェクトを指定
+        # ready_timeout: ファームウェアの応答 (起動メッセージ・ステータス・ping応答) を待つ最大時間 (秒)
+        self.ser = serial_port if serial_port is not None else serial.Serial(port, baudrate, timeout=0.1)
         # WSL/Linuxでの安定性のためにDTR/RTSを制御
         self.ser.dtr = True
         self.ser.rts = True
 
         self.lock = threading.Lock()
-        time.sleep(2) # Arduino/Picoのリセット待ち
 
-        # 初期バッファをクリア
+        # ポートを開く前に溜まっていたデータを捨てる
         self.ser.reset_input_buffer()
         self.ser.reset_output_buffer()
 
+        # 最後に送信したPWMのシャドウコピー (値, 送信時刻)
+        # 値が変わらなければ送信を省略し、keepalive_interval 秒ごとにだけ再送する (None の場合は再送しない)
+        self.keepalive_interval = keepalive_interval
+        self._sent_pwm = None
+
+        # 通信統計: 'status' はステータスの受信間隔・破損/欠落フレーム・解析エラー、'bus' は書き込み時間
+        self.stats = BusStats(port)
         self.latest_pwm = 0
+        self.latest_status_time = None  # 最後にステータスを受信した時刻 (time.monotonic)
+        # MCU のセグメントキューの残数 (ステータスで報告される。非対応のファームウェアでは None のまま)
+        self.queue_depth = None
+        # 送信したセグメントの終了予定時刻 (time.monotonic)。MCU のキューの中身を PC 側で見積もる
+        self._segment_ends = deque()
+        self.banner = None  # 受信した起動メッセージ (リセットされなかった場合は None)
+        # (受信時刻, PWM) のリングバッファ
+        self.history = deque(maxlen=history_size)
+
+        # ステータス受信スレッド: ポートを常に読み出し、制御ループをブロックしない
+        self._running = True
+        self._decoder = proto.FrameDecoder()
+        self._negotiated = threading.Event()
+        self._ready = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, name="dc-motor-reader", daemon=True)
+        self._reader.start()
+
+        # 固定時間待つ代わりに、ファームウェアから何か受信するまで待つ (リセット中なら起動メッセージ待ち)
+        self.binary = False
+        self._tx_seq = 0
+        started = time.monotonic()
+        if self._wait_ready(ready_timeout):
+            print(f"Motor driver ready ({(time.monotonic() - started) * 1000:.0f} ms)")
+        else:
+            print(f"Warning: Motor driver did not respond within {ready_timeout:.1f} s")
+
+        # バイナリプロトコル (対応していないファームウェアではASCIIのまま)
+        if protocol == "binary":
+            self.binary = self._negotiate_binary()
+            print(f"Motor driver protocol: {'binary' if self.binary else 'ascii (fallback)'}")
+
+    def _wait_ready(self, timeout):
+        """
+        ファームウェアが応答するまで待つ
+
+        起動メッセージ・ステータス (S: / フレーム)・ping (B:0) の応答のいずれかを受信した時点で準備完了とする。
+        ping はリセット直後の取りこぼしに備えて PING_INTERVAL ごとに送り直す。
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self.ser.write(proto.PING_LINE + b"\n")
+                self.ser.flush()
+            remaining = deadline - time.monotonic()
+            if self._ready.wait(max(0.0, min(self.PING_INTERVAL, remaining))):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+
+    def _negotiate_binary(self):
+        """ファームウェアにバイナリプロトコルへの切り替えを要求し、応答を待つ"""
+        self._negotiated.clear()
+        with self.lock:
+            self.ser.write(proto.NEGOTIATE_LINE + b"\n")
+            self.ser.flush()
+        return self._negotiated.wait(self.NEGOTIATE_TIMEOUT)
 
     def set_motor_pwm(self, pwm):
         """モーターPWM指令を送信する (-255 から 255)"""
-        cmd = f"M:{int(pwm)}\n"
-        with self.lock:
-            self.ser.write(cmd.encode())
-            self.ser.flush() # WSLでのバッファリング問題を回避するために即座に送信
+        self.send_commands(pwm=pwm)
 
     def set_enabled(self, enabled: bool):
         """モーターの有効/無効 (STBY) を切り替える"""
-        val = 1 if enabled else 0
-        cmd = f"E:{val}\n"
-        with self.lock:
-            self.ser.write(cmd.encode())
-            self.ser.flush()
+        self.send_commands(enabled=enabled)
 
-    def update(self):
-        """Picoからステータスを読み取る"""
-        if self.ser.in_waiting:
+    def send_commands(self, pwm=None, enabled=None):
+        """
+        PWM指令と有効/無効をまとめて1回の書き込みで送信する
+        (PWMは前回送信値から変化がなければ省略する)
+
+        Args:
+            pwm: PWM値 (-255 から 255)。Noneの場合は送信しない
+            enabled: 有効/無効。Noneの場合は送信しない
+        """
+        now = time.monotonic()
+        messages = []
+        # 有効化はPWMより先に適用する。切り替え後はPWMも必ず送り直す
+        if enabled is not None:
+            messages.append((proto.MSG_ENABLE, 1 if enabled else 0))
+            self.invalidate_cache()
+            if not enabled:
+                # 無効化で MCU のキューは破棄される
+                self._segment_ends.clear()
+        if pwm is not None:
+            pwm = int(pwm)
+            if self._needs_pwm_write(pwm, now):
+                messages.append((proto.MSG_PWM, pwm))
+                self._sent_pwm = (pwm, now)
+                # PWM の直接指令で MCU のキューは破棄される
+                self._segment_ends.clear()
+        self._write_messages(messages)
+
+    def queue_segments(self, segments):
+        """
+        PWM のセグメントを MCU のキューに追加する (1回の書き込みで送信)
+
+        各セグメントは「duration 秒かけて直前の終点 (キューが空なら現在の出力) から pwm まで直線で変化」で、
+        MCU が約 1 kHz で補間して順に再生する。キューが空になると最後の値を保持する。
+        PC 側で見積もったキューが満杯の場合、入りきらないセグメントは送信しない。
+
+        Args:
+            segments: [(pwm, duration), ...] (duration は秒, 0 でステップ)
+
+        Returns:
+            int: 送信したセグメントの数
+        """
+        now = time.monotonic()
+        self._expire_segments(now)
+        messages = []
+        for pwm, duration in segments:
+            if len(self._segment_ends) >= proto.SEGMENT_QUEUE_SIZE:
+                break
+            pwm = max(-255, min(255, int(pwm)))
+            duration_ms = max(0, min(proto.SEGMENT_MAX_MS, round(duration * 1000)))
+            start = self._segment_ends[-1] if self._segment_ends else now
+            self._segment_ends.append(start + duration_ms / 1000.0)
+            messages.append((proto.MSG_SEGMENT, (pwm, duration_ms)))
+        if messages:
+            # キューの再生中は出力がシャドウコピーと一致しないため、次の直接指令は必ず送信する
+            self.invalidate_cache()
+            self._write_messages(messages)
+        return len(messages)
+
+    def queue_segment(self, pwm, duration):
+        """セグメントを1つ MCU のキューに追加する。キューが満杯の場合は False"""
+        return self.queue_segments([(pwm, duration)]) == 1
+
+    def clear_segments(self):
+        """PC 側のキューの見積もりを破棄する (MCU のキューは PWM の直接指令か無効化で破棄される)"""
+        self._segment_ends.clear()
+
+    def _expire_segments(self, now):
+        ends = self._segment_ends
+        while ends and ends[0] <= now:
+            ends.popleft()
+
+    def queued_segments(self):
+        """PC 側で見積もった、MCU のキューに残っているセグメント数"""
+        self._expire_segments(time.monotonic())
+        return len(self._segment_ends)
+
+    def queued_time(self):
+        """PC 側で見積もった、MCU のキューを再生し終わるまでの時間 (秒)"""
+        if not self._segment_ends:
+            return 0.0
+        return max(0.0, self._segment_ends[-1] - time.monotonic())
+
+    def _write_messages(self, messages):
+        """メッセージをまとめて1回の書き込みで送信する (バイナリでは MAX_PAYLOAD ごとにフレームを分ける)"""
+        if not messages:
+            return
+
+        if self.binary:
+            chunks, size = [[]], 0
+            for msg_type, value in messages:
+                msg_size = 1 + proto.MSG_FORMATS[msg_type].size
+                if size + msg_size > proto.MAX_PAYLOAD:
+                    chunks.append([])
+                    size = 0
+                chunks[-1].append((msg_type, value))
+                size += msg_size
+            frames = []
+            for chunk in chunks:
+                frames.append(proto.encode_frame(self._tx_seq, chunk))
+                self._tx_seq = (self._tx_seq + 1) & 0xFF
+            data = b"".join(frames)
+        else:
+            data = b"".join(self._encode_ascii(msg_type, value) for msg_type, value in messages)
+
+        start = time.perf_counter()
+        try:
+            with self.lock:
+                self.ser.write(data)
+                self.ser.flush() # WSLでのバッファリング問題を回避するために即座に送信
+        except (serial.SerialException, OSError):
+            self.stats.record_bus(COMM_TX_FAIL)
+            raise
+        self.stats.record_bus(COMM_SUCCESS, time.perf_counter() - start)
+
+    def _needs_pwm_write(self, pwm, now):
+        if self._sent_pwm is None or self._sent_pwm[0] != pwm:
+            return True
+        return self.keepalive_interval is not None and now - self._sent_pwm[1] >= self.keepalive_interval
+
+    def invalidate_cache(self):
+        """シャドウコピーを破棄し、次回のPWM指令を必ず送信させる"""
+        self._sent_pwm = None
+
+    @staticmethod
+    def _encode_ascii(msg_type, value):
+        if msg_type == proto.MSG_PWM:
+            return f"M:{value}\n".encode()
+        if msg_type == proto.MSG_SEGMENT:
+            return f"Q:{value[0]},{value[1]}\n".encode()
+        return f"E:{value}\n".encode()
+
+    def _read_loop(self):
+        """受信スレッド本体: 届いたバイトをすべて読み出してフレーム/行単位で解析する"""
+        while self._running:
             try:
-                line = self.ser.readline().decode().strip()
-                if line.startswith("S:"):
-                    # 形式: S:PWM
-                    parts = line[2:].split(',')
-                    if len(parts) >= 1:
-                        self.latest_pwm = int(parts[0])
-            except Exception as e:
-                print(f"Error reading from Pico: {e}")
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                if self._running:
+                    self.stats.count('status', 'read_error')
+                    print(f"Error reading from Pico: {e}")
+                break
+            if not data:
+                continue
+
+            decoder = self._decoder
+            crc_errors, lost_frames = decoder.crc_errors, decoder.lost_frames
+            events = decoder.feed(data)
+            if decoder.crc_errors != crc_errors:
+                self.stats.count('status', 'corrupt', decoder.crc_errors - crc_errors)
+            if decoder.lost_frames != lost_frames:
+                self.stats.count('status', 'lost', decoder.lost_frames - lost_frames)
+            for event in events:
+                self._ready.set()
+                if event[0] == 'frame':
+                    values = dict(event[2])
+                    if proto.MSG_STATUS in values:
+                        self._publish_status(values[proto.MSG_STATUS], values.get(proto.MSG_QUEUE_DEPTH))
+                else:
+                    self._parse_line(event[1])
+
+    def _parse_line(self, raw):
+        try:
+            line = raw.decode().strip()
+            if line.startswith("S:"):
+                # 形式: S:PWM または S:PWM,DEPTH (セグメントキュー対応のファームウェア)
+                parts = line[2:].split(',')
+                if len(parts) >= 1:
+                    self._publish_status(int(parts[0]), int(parts[1]) if len(parts) >= 2 else None)
+            elif raw == proto.NEGOTIATE_LINE:
+                self._negotiated.set()
+            elif raw.endswith(proto.BANNER_SUFFIX):
+                self.banner = line
+        except Exception as e:
+            self.stats.count('status', 'parse_error')
+            print(f"Error reading from Pico: {e}")
+
+    def _publish_status(self, pwm, queue_depth=None):
+        now = time.monotonic()
+        if queue_depth is not None:
+            self.queue_depth = queue_depth
+        if self.latest_status_time is not None:
+            # 受信間隔 (ファームウェアの送信周期 + 遅延のばらつき)
+            self.stats.record('status', COMM_SUCCESS, now - self.latest_status_time)
+        self.history.append((now, pwm))
+        self.latest_pwm = pwm
+        self.latest_status_time = now
+
+    def update(self):
+        """
+        Picoからステータスを読み取る
+
+        ステータスは受信スレッドが常時更新しているため、ここでは何もしない
+        (インターフェース互換のために残している)
+        """
 
     def get_status(self):
         return self.latest_pwm
 
+    def get_stats(self):
+        """通信統計 (BusStats) のリスト"""
+        return [self.stats]
+
+    def get_history(self):
+        """受信したステータス履歴を [(受信時刻, PWM), ...] で返す (古い順)"""
+        return list(self.history)
+
     def close(self):
+        self._running = False
+        self._reader.join(timeout=0.5)
         self.ser.close()
@@ -1,12 +1,51 @@
 import os
+import time
+from dataclasses import dataclass
 from dynamixel_sdk import * # Dynamixel SDKライブラリを使用
+from hardware.bus_stats import ERROR_ALERT, BusStats
+
+# 応答待ちの読み込みでバイトが届くまでブロックする最大時間 (秒)
+# SDK は timeout=0 のシリアルを空読みし続けるため、そのままでは待ち時間中も GIL を握り続け、
+# 複数バスのワーカースレッドが同時に応答を待つと互いの受信処理を遅らせる。
+READ_WAIT = 0.002
+
+# 単位換算 (X-Series)
+POSITION_PER_VELOCITY_UNIT = 0.229 / 60.0 * 4096   # Velocity 1 = 0.229 rpm → [pulse/s]
+POSITION_PER_ACCEL_UNIT = 214.577 / 3600.0 * 4096  # Profile Acceleration 1 = 214.577 rev/min^2 → [pulse/s^2]
+
+# Baud Rate(8) レジスタの値 → ボーレート (X-Series)
+BAUD_RATE_TABLE = {0: 9600, 1: 57600, 2: 115200, 3: 1000000, 4: 2000000, 5: 3000000, 6: 4000000, 7: 4500000}
+
+@dataclass(slots=True)
+class ServoState:
+    """1台のDynamixelから読み取った状態"""
+    position: int   # Present Position
+    velocity: int   # Present Velocity
+    current: int    # Present Current
+    moving: bool | None = None  # Moving (読み取っていない場合は None)
+
 
 class DynamixelInterface:
-    def __init__(self, device_name, baud_rate=57600, protocol_version=2.0):
+    def __init__(self, device_name, baud_rate=57600, protocol_version=2.0, keepalive_interval=0.5, port_handler=None,
+                 retries=0, read_moving=False):
         self.device_name = device_name
         self.baud_rate = baud_rate
         self.protocol_version = protocol_version
 
+        # 通信統計 (IDごとの応答時間・タイムアウト・破損パケット・エラービット)
+        # 失敗した送受信は retries 回まで再送する (Sync Read は応答のなかったIDだけを読み直す)
+        self.stats = BusStats(device_name)
+        self.retries = retries
+        self._alerted = set()  # Alert ビットが立っているID (Hardware Error Status 読み取り済み)
+
+        # 最後に書き込んだ値のシャドウコピー {(アドレス, ID): (値, 書き込み時刻)}
+        # 値が変わっていなければ書き込みを省略し、keepalive_interval 秒ごとにだけ再送する
+        # (None の場合は再送しない)
+        self.keepalive_interval = keepalive_interval
+        self._shadow = {}
+        # 各IDの現在の動作モード (不明な場合は未登録)
+        self._modes = {}
+
         # Dynamixel コントロールテーブルアドレス (XM540-W150-R / X-Series 推奨値)
         # 使用するモデルに応じて変更
         self.ADDR_TORQUE_ENABLE          = 64
@@ -16,38 +55,248 @@ class DynamixelInterface:
         self.ADDR_PRESENT_POSITION       = 132
         self.ADDR_OPERATING_MODE         = 11
         self.ADDR_GOAL_CURRENT           = 102  # 電流制限 (トルク制限)
+        self.ADDR_PRESENT_CURRENT        = 126
+        self.ADDR_HARDWARE_ERROR_STATUS  = 70
+        self.ADDR_PROFILE_ACCELERATION   = 108
+        self.ADDR_PROFILE_VELOCITY       = 112
+        self.ADDR_MOVING                 = 122
 
-        self.portHandler = PortHandler(device_name)
+        # port_handler: シミュレーション等で差し替える場合に指定
+        self.portHandler = port_handler if port_handler is not None else PortHandler(device_name)
         self.packetHandler = PacketHandler(protocol_version)
 
+        # 全IDの目標値を1パケットで送信するためのSync Write
+        self.goalPositionWriter = GroupSyncWrite(self.portHandler, self.packetHandler, self.ADDR_GOAL_POSITION, 4)
+        self.goalVelocityWriter = GroupSyncWrite(self.portHandler, self.packetHandler, self.ADDR_GOAL_VELOCITY, 4)
+        # Profile Acceleration(108) / Profile Velocity(112) / Goal Position(116) の連続領域を1回のSync Writeで送信
+        self.profileGoalWriter = GroupSyncWrite(self.portHandler, self.packetHandler, self.ADDR_PROFILE_ACCELERATION,
+                                                self.ADDR_GOAL_POSITION + 4 - self.ADDR_PROFILE_ACCELERATION)
+        self._sync_writers = {}  # (アドレス, データ長) -> GroupSyncWrite
+
+        # Present Current(126) ~ Present Position(132) の連続領域を1回のSync Readで取得
+        # read_moving の場合は Moving(122) から読み、移動の完了をポーリングできるようにする (+4バイト/ID)
+        self._state_start = self.ADDR_MOVING if read_moving else self.ADDR_PRESENT_CURRENT
+        self.STATE_READ_LENGTH = self.ADDR_PRESENT_POSITION + 4 - self._state_start
+        self._state_readers = {}  # IDのタプル -> GroupSyncRead
+
+        self._open()
+
+    def _open(self):
         if self.portHandler.openPort():
-            print(f"Succeeded to open the port {device_name}")
+            print(f"Succeeded to open the port {self.device_name}")
         else:
-            print(f"Failed to open the port {device_name}")
-            return
+            print(f"Failed to open the port {self.device_name}")
+            return False
 
-        if self.portHandler.setBaudRate(baud_rate):
-            print(f"Succeeded to change the baudrate {baud_rate}")
+        if self.portHandler.setBaudRate(self.baud_rate):
+            print(f"Succeeded to change the baudrate {self.baud_rate}")
         else:
-            print(f"Failed to change the baudrate {baud_rate}")
-            return
+            print(f"Failed to change the baudrate {self.baud_rate}")
+            return False
+
+        # setBaudRate() でシリアルが開き直されるため、その後に設定する
+        if self.portHandler.ser is not None:
+            self.portHandler.ser.timeout = READ_WAIT
+        return True
+
+    def reconnect(self):
+        """ポートを開き直す。サーボ側の状態は不明になるためシャドウコピーを破棄する"""
+        self.portHandler.closePort()
+        self.invalidate_cache()
+        self._modes.clear()
+        return self._open()
+
+    def invalidate_cache(self, dxl_id=None):
+        """
+        シャドウコピーを破棄し、次回の書き込みを必ず送信させる
+
+        Args:
+            dxl_id: 対象のID。Noneの場合はすべて
+        """
+        if dxl_id is None:
+            self._shadow.clear()
+        else:
+            for key in [key for key in self._shadow if key[1] == dxl_id]:
+                del self._shadow[key]
+
+    def _needs_write(self, address, dxl_id, value, now, keepalive=True):
+        """シャドウコピーと比較し、書き込みが必要かどうかを判定する (keepalive=False の場合は値の変化のみ)"""
+        cached = self._shadow.get((address, dxl_id))
+        if cached is None or cached[0] != value:
+            return True
+        return keepalive and self.keepalive_interval is not None and now - cached[1] >= self.keepalive_interval
+
+    def get_stats(self):
+        """通信統計 (BusStats) のリスト"""
+        return [self.stats]
+
+    def _txrx(self, fn, dxl_id, *args):
+        """
+        1台との送受信 (packetHandler の ...TxRx) を統計に記録し、失敗した場合は retries 回まで再送する
+
+        Returns:
+            fn の戻り値 (最後の試行)
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats.record_retry(dxl_id)
+            start = time.perf_counter()
+            ret = fn(self.portHandler, dxl_id, *args)
+            result, error = ret[-2], ret[-1]
+            self.stats.record(dxl_id, result, time.perf_counter() - start, error)
+            if result == COMM_SUCCESS:
+                break
+        return ret
+
+    def _tx(self, writer):
+        """応答のない送信 (Sync Write) を統計に記録し、送信に失敗した場合は retries 回まで再送する"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats.record_retry(BusStats.BUS)
+            start = time.perf_counter()
+            result = writer.txPacket()
+            self.stats.record_bus(result, time.perf_counter() - start)
+            if result == COMM_SUCCESS:
+                return True
+        return False
 
     def enable_torque(self, dxl_id, enable=True):
-        self.packetHandler.write1ByteTxRx(self.portHandler, dxl_id, self.ADDR_TORQUE_ENABLE, 1 if enable else 0)
+        self._txrx(self.packetHandler.write1ByteTxRx, dxl_id, self.ADDR_TORQUE_ENABLE, 1 if enable else 0)
+        # トルクの切り替えで目標値が現在値に置き換わる場合があるため、再送させる
+        self.invalidate_cache(dxl_id)
+
+    def enable_torques(self, ids, enable=True):
+        """複数IDのトルクを1回のSync Writeで切り替える"""
+        self.sync_write(self.ADDR_TORQUE_ENABLE, 1, {dxl_id: 1 if enable else 0 for dxl_id in ids})
+        for dxl_id in ids:
+            self.invalidate_cache(dxl_id)
 
     def set_operating_mode(self, dxl_id, mode):
         # 設定時はトルクを無効化する必要がある
         self.enable_torque(dxl_id, False)
-        self.packetHandler.write1ByteTxRx(self.portHandler, dxl_id, self.ADDR_OPERATING_MODE, mode)
+        self._txrx(self.packetHandler.write1ByteTxRx, dxl_id, self.ADDR_OPERATING_MODE, mode)
         self.enable_torque(dxl_id, True)
+        self._modes[dxl_id] = mode
+
+    def set_operating_modes(self, ids, mode):
+        """
+        複数IDの動作モードをまとめて切り替える
+
+        トルクOFF・モード書き込み・トルクONをそれぞれ1回のSync Writeで送信する。
+        すでに指定モードになっているIDは対象外とする。
+
+        Args:
+            ids: Dynamixel IDのリスト
+            mode: 動作モード (1: Velocity, 3: Position, 4: Extended Position)
+        """
+        ids = [dxl_id for dxl_id in ids if self._modes.get(dxl_id) != mode]
+        if not ids:
+            return
+
+        # 設定時はトルクを無効化する必要がある
+        self.sync_write(self.ADDR_TORQUE_ENABLE, 1, {dxl_id: 0 for dxl_id in ids})
+        self.sync_write(self.ADDR_OPERATING_MODE, 1, {dxl_id: mode for dxl_id in ids})
+        self.sync_write(self.ADDR_TORQUE_ENABLE, 1, {dxl_id: 1 for dxl_id in ids})
+        for dxl_id in ids:
+            self._modes[dxl_id] = mode
+            self.invalidate_cache(dxl_id)
+
+    def sync_write(self, address, length, values):
+        """
+        複数IDの同じアドレスへ1回のSync Writeで書き込む
+
+        Args:
+            address: コントロールテーブルのアドレス
+            length: データ長 (1, 2, 4 バイト)
+            values: {Dynamixel ID: 値} の辞書
+        """
+        if not values:
+            return
+        writer = self._sync_writers.get((address, length))
+        if writer is None:
+            writer = GroupSyncWrite(self.portHandler, self.packetHandler, address, length)
+            self._sync_writers[(address, length)] = writer
+
+        writer.clearParam()
+        for dxl_id, value in values.items():
+            writer.addParam(dxl_id, self._to_4bytes(value)[:length])
+        self._tx(writer)
 
     def set_velocity(self, dxl_id, velocity):
         # この用途では速度制御モードを推奨
         # 速度の単位はモデルに依存
-        self.packetHandler.write4ByteTxRx(self.portHandler, dxl_id, self.ADDR_GOAL_VELOCITY, int(velocity))
+        self._write4(dxl_id, self.ADDR_GOAL_VELOCITY, int(velocity))
 
     def set_position(self, dxl_id, position):
-         self.packetHandler.write4ByteTxRx(self.portHandler, dxl_id, self.ADDR_GOAL_POSITION, int(position))
+         self._write4(dxl_id, self.ADDR_GOAL_POSITION, int(position))
+
+    def _write4(self, dxl_id, address, value):
+        now = time.monotonic()
+        if not self._needs_write(address, dxl_id, value, now):
+            return
+        result, _ = self._txrx(self.packetHandler.write4ByteTxRx, dxl_id, address, value)
+        if result == COMM_SUCCESS:
+            self._shadow[(address, dxl_id)] = (value, now)
+
+    def set_goals(self, targets, mode, profiles=None):
+        """
+        全IDの目標値を1回のSync Writeで送信する
+
+        位置制御モードで profiles を指定した場合、プロファイルが変わったIDは
+        Profile Acceleration / Profile Velocity / Goal Position をまとめて1回のSync Writeで送信し、
+        移動中の補間はサーボ内部の台形プロファイルに任せる。
+
+        Args:
+            targets: {Dynamixel ID: 目標値} の辞書 (前回と同じ値のIDは送信しない)
+            mode: 動作モード (1: Velocity, 3: Position, 4: Extended Position)
+            profiles: ({ID: Profile Velocity}, {ID: Profile Acceleration}) (0 は無制限)。None の場合は書き込まない
+        """
+        if mode == 3 or mode == 4:  # Position / Extended Position
+            writer = self.goalPositionWriter
+        elif mode == 1:  # Velocity
+            writer = self.goalVelocityWriter
+            profiles = None
+        else:
+            return
+
+        # 前回から変化したID (またはキープアライブ期限切れのID) だけを送信
+        now = time.monotonic()
+        address = writer.start_address
+        writer.clearParam()
+        changed = []
+        profiled = []
+        if profiles is not None:
+            velocities, accelerations = profiles
+            profile_writer = self.profileGoalWriter
+            profile_writer.clearParam()
+        for dxl_id, value in targets.items():
+            value = int(value)
+            if profiles is not None:
+                velocity, acceleration = int(velocities.get(dxl_id, 0)), int(accelerations.get(dxl_id, 0))
+                if (self._needs_write(self.ADDR_PROFILE_VELOCITY, dxl_id, velocity, now, keepalive=False)
+                        or self._needs_write(self.ADDR_PROFILE_ACCELERATION, dxl_id, acceleration, now, keepalive=False)):
+                    profile_writer.addParam(dxl_id, self._to_4bytes(acceleration) + self._to_4bytes(velocity)
+                                            + self._to_4bytes(value))
+                    profiled.append((dxl_id, value, velocity, acceleration))
+                    continue
+            if self._needs_write(address, dxl_id, value, now):
+                writer.addParam(dxl_id, self._to_4bytes(value))
+                changed.append((dxl_id, value))
+
+        # 送信できなかった値はシャドウコピーに残さず、次のティックで再送する
+        if profiled and self._tx(profile_writer):
+            for dxl_id, value, velocity, acceleration in profiled:
+                self._shadow[(self.ADDR_PROFILE_ACCELERATION, dxl_id)] = (acceleration, now)
+                self._shadow[(self.ADDR_PROFILE_VELOCITY, dxl_id)] = (velocity, now)
+                self._shadow[(address, dxl_id)] = (value, now)
+        if changed and self._tx(writer):
+            for dxl_id, value in changed:
+                self._shadow[(address, dxl_id)] = (value, now)
+
+    @staticmethod
+    def _to_4bytes(value):
+        # 負の値は2の補数としてリトルエンディアンで送信
+        return list((int(value) & 0xFFFFFFFF).to_bytes(4, 'little'))
 
     def set_current_limit(self, dxl_id, current_ma):
         """
@@ -57,15 +306,100 @@ class DynamixelInterface:
             dxl_id: Dynamixel ID
             current_ma: 電流制限値 (mA). XM430の場合、最大は約2300mA
         """
-        self.packetHandler.write2ByteTxRx(self.portHandler, dxl_id, self.ADDR_GOAL_CURRENT, int(current_ma))
+        self._txrx(self.packetHandler.write2ByteTxRx, dxl_id, self.ADDR_GOAL_CURRENT, int(current_ma))
+
+    def set_current_limits(self, ids, current_ma):
+        """複数IDの電流制限を1回のSync Writeで設定する"""
+        self.sync_write(self.ADDR_GOAL_CURRENT, 2, {dxl_id: int(current_ma) for dxl_id in ids})
 
     def get_present_position(self, dxl_id):
-        dxl_present_position, dxl_comm_result, dxl_error = self.packetHandler.read4ByteTxRx(self.portHandler, dxl_id, self.ADDR_PRESENT_POSITION)
-        # SDKバージョンやPython環境によっては2の補数処理が必要
-        # read4ByteTxRx は通常unsignedを返すため:
-        if dxl_present_position > 0x7fffffff:
-            dxl_present_position -= 4294967296
-        return dxl_present_position
+        """現在位置を読み取る (通信に失敗した場合は None)"""
+        dxl_present_position, dxl_comm_result, dxl_error = self._txrx(
+            self.packetHandler.read4ByteTxRx, dxl_id, self.ADDR_PRESENT_POSITION)
+        if dxl_comm_result != COMM_SUCCESS:
+            return None
+        # read4ByteTxRx は unsigned を返すため2の補数に変換
+        return self._to_signed(dxl_present_position, 32)
+
+    def read_state(self, ids):
+        """
+        全IDの現在位置・速度・電流を1回のSync Readで取得する
+
+        応答はIDごとに受信して統計に記録し、一部のIDが応答しなくても受信できたIDの状態は返す。
+        応答のなかったIDは retries 回まで読み直す。
+
+        Args:
+            ids: Dynamixel IDのリスト
+
+        Returns:
+            dict[int, ServoState]: 読み取りに成功したIDの状態
+        """
+        states = {}
+        pending = tuple(ids)
+        for attempt in range(self.retries + 1):
+            if not pending:
+                break
+            if attempt:
+                for dxl_id in pending:
+                    self.stats.record_retry(dxl_id)
+            pending = self._sync_read_state(pending, states)
+        return states
+
+    def _sync_read_state(self, ids, states):
+        """Sync Read を1回行い、受信できたIDの状態を states に追加する。応答のなかったIDのタプルを返す"""
+        reader = self._state_readers.get(ids)
+        if reader is None:
+            reader = GroupSyncRead(self.portHandler, self.packetHandler, self._state_start, self.STATE_READ_LENGTH)
+            for dxl_id in ids:
+                reader.addParam(dxl_id)
+            self._state_readers[ids] = reader
+
+        stats = self.stats
+        start = time.perf_counter()
+        result = reader.txPacket()
+        if result != COMM_SUCCESS:
+            stats.record_bus(result)
+            return ids
+
+        # GroupSyncRead.rxPacket() は最初の失敗で残りのIDを読まないため、IDごとに受信する
+        failed = []
+        alerts = []
+        offset = self.ADDR_PRESENT_CURRENT - self._state_start
+        read_moving = self._state_start == self.ADDR_MOVING
+        for dxl_id in ids:
+            data, result, error = self.packetHandler.readRx(self.portHandler, dxl_id, self.STATE_READ_LENGTH)
+            stats.record(dxl_id, result, time.perf_counter() - start, error)
+            if result != COMM_SUCCESS or len(data) < self.STATE_READ_LENGTH:
+                failed.append(dxl_id)
+                continue
+            data = bytes(data)
+            # [Moving(122, 1) / Moving Status(123, 1) / Present PWM(124, 2)] / Present Current(126, 2) / Velocity(128, 4) / Position(132, 4)
+            states[dxl_id] = ServoState(
+                position=int.from_bytes(data[offset + 6:offset + 10], 'little', signed=True),
+                velocity=int.from_bytes(data[offset + 2:offset + 6], 'little', signed=True),
+                current=int.from_bytes(data[offset:offset + 2], 'little', signed=True),
+                moving=data[0] != 0 if read_moving else None,
+            )
+            if error & ERROR_ALERT:
+                alerts.append(dxl_id)
+            else:
+                self._alerted.discard(dxl_id)
+
+        # Alert が新たに立ったIDは Hardware Error Status を読んで原因を記録する
+        for dxl_id in alerts:
+            if dxl_id not in self._alerted:
+                self._alerted.add(dxl_id)
+                value, result, _ = self._txrx(self.packetHandler.read1ByteTxRx, dxl_id, self.ADDR_HARDWARE_ERROR_STATUS)
+                if result == COMM_SUCCESS:
+                    stats.set_hardware_error(dxl_id, value)
+                    print(f"Dynamixel ID {dxl_id}: hardware error {value:#04x}")
+        return tuple(failed)
+
+    @staticmethod
+    def _to_signed(value, bits):
+        if value >= 1 << (bits - 1):
+            value -= 1 << bits
+        return value
 
     def close(self):
         self.portHandler.closePort()
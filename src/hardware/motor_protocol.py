@@ -0,0 +1,156 @@
+"""
+PC ↔ モータードライバー (Pico/R4) 間のバイナリフレームプロトコル
+
+フレーム形式:
+    SYNC(0xA5) | LEN | SEQ | PAYLOAD (LENバイト) | CRC8
+
+    LEN:     PAYLOADのバイト数 (最大 MAX_PAYLOAD)
+    SEQ:     送信側で1ずつ増えるシーケンス番号 (0-255で循環)
+    PAYLOAD: メッセージの並び。1フレームに複数のコマンドを詰められる
+             メッセージ = TYPE(1) + 引数 (TYPEごとに固定長, リトルエンディアン)
+    CRC8:    LEN, SEQ, PAYLOAD に対する CRC-8 (多項式 0x07, 初期値 0x00)
+
+セグメント (Q:<pwm>,<ms> / MSG_SEGMENT):
+    「ms ミリ秒かけて現在の出力から pwm まで直線で変化させる」指令を MCU のキュー (SEGMENT_QUEUE_SIZE 個) に積む。
+    MCU は先頭から順に約 1 kHz で補間して出力し、キューが空になったら最後の値を保持する。
+    PWM の直接指令 (M: / MSG_PWM) と無効化 (E:0) はキューを破棄する。
+    ステータスにはキューに残っているセグメント数を付ける (S:<pwm>,<depth> / MSG_QUEUE_DEPTH)。
+
+ASCIIプロトコル (M:<pwm>, E:<0|1>, S:<pwm>) はフォールバックとして残しており、
+接続時に "B:1" を送って同じ行が返ってきた場合のみバイナリに切り替える。
+ファームウェアは 0xA5 で始まるバイト列をフレーム、それ以外をASCII行として扱う。
+"""
+import struct
+
+FRAME_SYNC = 0xA5
+MAX_PAYLOAD = 32
+
+# PC → MCU
+MSG_PWM = 0x01      # int16: PWM値 (-255 ~ 255)
+MSG_ENABLE = 0x02   # uint8: 0=無効, 1=有効 (STBY)
+MSG_SEGMENT = 0x03  # int16 + uint16: 終点のPWM値, 所要時間 (ms, 0 でステップ)
+# MCU → PC
+MSG_STATUS = 0x81       # int16: 現在のPWM値
+MSG_QUEUE_DEPTH = 0x82  # uint8: キューに残っているセグメント数 (再生中のものを含む)
+
+MSG_FORMATS = {
+    MSG_PWM: struct.Struct('<h'),
+    MSG_ENABLE: struct.Struct('<B'),
+    MSG_SEGMENT: struct.Struct('<hH'),
+    MSG_STATUS: struct.Struct('<h'),
+    MSG_QUEUE_DEPTH: struct.Struct('<B'),
+}
+
+# MCU のセグメントキューの長さ (ファームウェアの SEGMENT_QUEUE_SIZE と一致させる)
+SEGMENT_QUEUE_SIZE = 16
+SEGMENT_MAX_MS = 0xFFFF
+
+# バイナリモードへの切り替え要求 / 応答 (ASCII)
+NEGOTIATE_LINE = b"B:1"
+# 起動確認: ASCIIモードを要求し、同じ行の応答で通信可能になったことを確認する
+PING_LINE = b"B:0"
+# 起動メッセージ ("R4 Motor Driver Started" など) の末尾
+BANNER_SUFFIX = b"Motor Driver Started"
+
+
+def crc8(data, crc=0):
+    """CRC-8 (多項式 0x07) を計算する"""
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def encode_frame(seq, messages):
+    """
+    メッセージ列を1つのフレームにエンコードする
+
+    Args:
+        seq: シーケンス番号 (0-255)
+        messages: [(TYPE, 値), ...] (引数が複数のメッセージは値をタプルで渡す)
+
+    Returns:
+        bytes: 送信するフレーム
+    """
+    payload = bytearray()
+    for msg_type, value in messages:
+        payload.append(msg_type)
+        payload += MSG_FORMATS[msg_type].pack(*value) if isinstance(value, tuple) else MSG_FORMATS[msg_type].pack(value)
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Payload too long: {len(payload)} bytes")
+
+    body = bytes((len(payload), seq & 0xFF)) + payload
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),))
+
+
+def decode_payload(payload):
+    """PAYLOADを [(TYPE, 値), ...] にデコードする (引数が複数のメッセージはタプル)。未知のTYPE以降は破棄する"""
+    messages = []
+    i = 0
+    while i < len(payload):
+        msg_type = payload[i]
+        fmt = MSG_FORMATS.get(msg_type)
+        if fmt is None or i + 1 + fmt.size > len(payload):
+            break
+        values = fmt.unpack_from(payload, i + 1)
+        messages.append((msg_type, values[0] if len(values) == 1 else values))
+        i += 1 + fmt.size
+    return messages
+
+
+class FrameDecoder:
+    """
+    受信バイト列からフレームとASCII行を取り出すストリームデコーダー
+
+    feed() に受信データを渡すと、以下のイベントのリストを返す:
+        ('frame', SEQ, [(TYPE, 値), ...])
+        ('line', bytes)   # 改行を除いたASCII行
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self._last_seq = None
+        self.crc_errors = 0
+        self.lost_frames = 0   # シーケンス番号の飛びから推定した欠落フレーム数
+
+    def feed(self, data):
+        self._buffer.extend(data)
+        events = []
+        buf = self._buffer
+
+        while buf:
+            if buf[0] == FRAME_SYNC:
+                if len(buf) < 2:
+                    break
+                length = buf[1]
+                if length > MAX_PAYLOAD:
+                    # 不正な長さ: 同期バイトを捨てて再同期
+                    del buf[0]
+                    continue
+                frame_size = length + 4
+                if len(buf) < frame_size:
+                    break
+                body = bytes(buf[1:frame_size - 1])
+                if crc8(body) != buf[frame_size - 1]:
+                    self.crc_errors += 1
+                    del buf[0]
+                    continue
+                seq = body[1]
+                if self._last_seq is not None:
+                    self.lost_frames += (seq - self._last_seq - 1) & 0xFF
+                self._last_seq = seq
+                events.append(('frame', seq, decode_payload(body[2:])))
+                del buf[:frame_size]
+            else:
+                end = buf.find(b'\n')
+                sync = buf.find(bytes((FRAME_SYNC,)))
+                if end < 0 or (0 <= sync < end):
+                    if sync < 0:
+                        break
+                    # 行の途中にフレームが始まった場合はそこまでを捨てる
+                    del buf[:sync]
+                    continue
+                events.append(('line', bytes(buf[:end]).strip()))
+                del buf[:end + 1]
+
+        return events
@@ -0,0 +1,598 @@
+"""
+シミュレーションバックエンド: 実機なしで制御スタック全体を動かすための模擬ハードウェア
+
+実際の DynamixelInterface / DCMotorInterface をそのまま使い、その下のシリアル層だけを
+差し替える。そのため Sync Write / Sync Read のパケット組み立てやステータス受信スレッドなど、
+本番と同じコードパスが動作する。
+
+- SimServoBus / SimPortHandler:
+    Protocol 2.0 のインストラクションパケットを解釈し、サーボごとのコントロールテーブルと
+    簡易ダイナミクス (速度・加速度制限付きの追従) を模擬する。
+    ボーレートとUSBレイテンシに応じて応答の到着時刻を遅らせる。
+- SimMotorDriverSerial:
+    Pico/R4 ファームウェアの挙動 (ASCII/バイナリコマンド、セグメントキューの補間再生、
+    100ms周期の S: ステータス) を模擬する pyserial 互換オブジェクト。
+
+time_scale はシリアル転送・レイテンシの模擬時間に掛かる係数。
+1.0 で実機相当、0.0 で待ち時間なし (実時間より高速に実行できる)。
+"""
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from dynamixel_sdk import PortHandler
+from hardware import motor_protocol as proto
+from hardware.dc_motor_interface import DCMotorInterface
+from hardware.dxl_interface import (BAUD_RATE_TABLE, POSITION_PER_ACCEL_UNIT, POSITION_PER_VELOCITY_UNIT, READ_WAIT,
+                                    DynamixelInterface)
+
+# Protocol 2.0
+INST_PING = 0x01
+INST_READ = 0x02
+INST_WRITE = 0x03
+INST_REBOOT = 0x08
+INST_STATUS = 0x55
+INST_SYNC_READ = 0x82
+INST_SYNC_WRITE = 0x83
+INST_BULK_READ = 0x92
+BROADCAST_ID = 0xFE
+ERR_ACCESS = 0x07
+
+HEADER = bytes((0xFF, 0xFF, 0xFD, 0x00))
+
+
+def _crc16(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+    return crc
+
+
+def _transfer_time(num_bytes, baud_rate):
+    return num_bytes * 10.0 / baud_rate
+
+
+class SimServo:
+    """1台の X-Series サーボ (XM430-W350 相当) のコントロールテーブルとダイナミクス"""
+    TABLE_SIZE = 256
+    EEPROM_END = 64        # これより前のアドレスはトルクON中は書き込み不可
+    POSITION_GAIN = 8.0    # 位置制御の比例ゲイン [1/s]
+    DEFAULT_ACCEL = 40000.0  # Profile Acceleration 未設定時の加速度 [pulse/s^2]
+    MAX_STEP = 0.002       # 積分の刻み幅 (秒)
+
+    def __init__(self, dxl_id, baud_index=1, model_number=1020):
+        self.table = bytearray(self.TABLE_SIZE)
+        self._set(0, 2, model_number)   # Model Number
+        self._set(6, 1, 45)             # Firmware Version
+        self._set(7, 1, dxl_id)         # ID
+        self._set(8, 1, baud_index)     # Baud Rate
+        self._set(9, 1, 250)            # Return Delay Time (2us単位)
+        self._set(11, 1, 3)             # Operating Mode (Position)
+        self._set(38, 2, 1193)          # Current Limit
+        self._set(44, 4, 265)           # Velocity Limit
+        self._set(48, 4, 4095)          # Max Position Limit
+        self._set(68, 1, 2)             # Status Return Level
+        self._set(144, 2, 120)          # Present Input Voltage
+        self._set(146, 1, 30)           # Present Temperature
+
+        self.position = 2048.0  # [pulse]
+        self.velocity = 0.0     # [pulse/s]
+        self._current_raw = 0.0
+        self._set(116, 4, 2048)  # Goal Position
+        self._last_time = None
+
+    @property
+    def dxl_id(self):
+        return self.table[7]
+
+    @property
+    def baud_rate(self):
+        return BAUD_RATE_TABLE.get(self.table[8], 57600)
+
+    @property
+    def return_delay(self):
+        return self.table[9] * 2e-6
+
+    def _get(self, address, length, signed=False):
+        return int.from_bytes(self.table[address:address + length], 'little', signed=signed)
+
+    def _set(self, address, length, value):
+        self.table[address:address + length] = (int(value) & ((1 << (8 * length)) - 1)).to_bytes(length, 'little')
+
+    def read(self, address, length):
+        """コントロールテーブルを読み出す。範囲外の場合はNone"""
+        if address + length > self.TABLE_SIZE:
+            return None
+        return bytes(self.table[address:address + length])
+
+    def write(self, address, data):
+        """
+        コントロールテーブルに書き込む
+
+        Returns:
+            int: エラー番号 (0: 成功)
+        """
+        if address + len(data) > self.TABLE_SIZE:
+            return ERR_ACCESS
+        torque_on = self.table[64] != 0
+        if torque_on and address < self.EEPROM_END:
+            return ERR_ACCESS
+        self.table[address:address + len(data)] = data
+        return 0
+
+    def advance(self, now):
+        """nowまでダイナミクスを進め、Present系レジスタを更新する"""
+        if self._last_time is None:
+            self._last_time = now
+        remaining = now - self._last_time
+        self._last_time = now
+        while remaining > 0:
+            dt = min(remaining, self.MAX_STEP)
+            self._step(dt)
+            remaining -= dt
+
+        velocity_raw = self.velocity / POSITION_PER_VELOCITY_UNIT
+        goal_position = self._get(116, 4, signed=True)
+        moving = abs(velocity_raw) > 1.0 or (self.table[11] in (3, 4) and abs(goal_position - self.position) > 20)
+        self._set(120, 2, int(now * 1000) % 32768)  # Realtime Tick
+        self._set(122, 1, 1 if moving else 0)        # Moving
+        self._set(123, 1, 0 if moving else 1)        # Moving Status (In-Position)
+        self._set(126, 2, int(self._current_raw))    # Present Current
+        self._set(128, 4, int(velocity_raw))         # Present Velocity
+        self._set(132, 4, int(round(self.position)))  # Present Position
+
+    def _step(self, dt):
+        mode = self.table[11]
+        velocity_limit = self._get(44, 4) * POSITION_PER_VELOCITY_UNIT
+        profile_velocity = self._get(112, 4) * POSITION_PER_VELOCITY_UNIT
+        if profile_velocity > 0:
+            velocity_limit = min(velocity_limit, profile_velocity)
+        accel = self._get(108, 4) * POSITION_PER_ACCEL_UNIT or self.DEFAULT_ACCEL
+
+        if self.table[64] == 0:
+            target_velocity = 0.0
+        elif mode == 1:
+            target_velocity = self._get(104, 4, signed=True) * POSITION_PER_VELOCITY_UNIT
+        elif mode in (3, 4):
+            goal = self._get(116, 4, signed=True)
+            if mode == 3:
+                goal = min(max(goal, 0), self._get(48, 4))
+            error = goal - self.position
+            # 停止距離を考慮して減速する (台形プロファイル相当)
+            target_velocity = math.copysign(min(abs(error) * self.POSITION_GAIN, math.sqrt(2 * accel * abs(error))), error)
+        else:
+            target_velocity = 0.0
+        target_velocity = max(-velocity_limit, min(velocity_limit, target_velocity))
+
+        delta = max(-accel * dt, min(accel * dt, target_velocity - self.velocity))
+        self.velocity += delta
+        self.position += self.velocity * dt
+
+        # 電流は加速度と速度 (摩擦) に比例する簡易モデル
+        current = (delta / dt) * 0.002 + self.velocity * 0.05 if self.table[64] else 0.0
+        current_limit = self._get(38, 2)
+        self._current_raw = max(-current_limit, min(current_limit, current))
+
+
+class SimServoBus:
+    """Protocol 2.0 バス上の複数サーボを模擬する"""
+    def __init__(self, ids, baud_rate=57600, clock=time.monotonic):
+        baud_index = next((index for index, rate in BAUD_RATE_TABLE.items() if rate == baud_rate), 1)
+        self.servos = {dxl_id: SimServo(dxl_id, baud_index) for dxl_id in ids}
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def handle(self, packet, baud_rate):
+        """
+        インストラクションパケットを処理する
+
+        Args:
+            packet: 受信したパケット (bytes)
+            baud_rate: 送信側のボーレート (一致するサーボだけが受信できる)
+
+        Returns:
+            list[tuple[float, bytes, int]]: (Return Delay Time, ステータスパケット, 応答のボーレート) のリスト (応答順)
+        """
+        parsed = self._parse(packet)
+        if parsed is None:
+            return []
+        dxl_id, inst, params = parsed
+
+        with self.lock:
+            now = self.clock()
+            listeners = {i: s for i, s in self.servos.items() if s.baud_rate == baud_rate}
+            for servo in listeners.values():
+                servo.advance(now)
+
+            if inst == INST_PING:
+                targets = sorted(listeners) if dxl_id == BROADCAST_ID else [dxl_id]
+                return [self._status(listeners[i], 0, listeners[i].read(0, 2) + listeners[i].read(6, 1))
+                        for i in targets if i in listeners]
+
+            if inst == INST_READ and dxl_id in listeners:
+                address, length = self._word(params, 0), self._word(params, 2)
+                data = listeners[dxl_id].read(address, length)
+                return [self._status(listeners[dxl_id], ERR_ACCESS if data is None else 0, data or b'')]
+
+            if inst == INST_WRITE:
+                address = self._word(params, 0)
+                targets = list(listeners) if dxl_id == BROADCAST_ID else [dxl_id]
+                responses = []
+                for i in targets:
+                    if i not in listeners:
+                        continue
+                    servo = listeners[i]
+                    # 応答は変更前のボーレートで返るため、ステータスを先に組み立てる
+                    status_baud = servo.baud_rate
+                    error = servo.write(address, params[2:])
+                    if dxl_id != BROADCAST_ID:
+                        responses.append(self._status(servo, error, b'', status_baud))
+                return responses
+
+            if inst == INST_SYNC_WRITE:
+                address, length = self._word(params, 0), self._word(params, 2)
+                for offset in range(4, len(params), length + 1):
+                    servo = listeners.get(params[offset])
+                    if servo is not None:
+                        servo.write(address, params[offset + 1:offset + 1 + length])
+                return []
+
+            if inst == INST_SYNC_READ:
+                address, length = self._word(params, 0), self._word(params, 2)
+                responses = []
+                for i in params[4:]:
+                    if i not in listeners:
+                        break  # 応答しないサーボがいると後続も返らない (SDKはタイムアウト)
+                    data = listeners[i].read(address, length)
+                    responses.append(self._status(listeners[i], ERR_ACCESS if data is None else 0, data or b''))
+                return responses
+
+            if inst == INST_BULK_READ:
+                responses = []
+                for offset in range(0, len(params), 5):
+                    i = params[offset]
+                    if i not in listeners:
+                        break
+                    address, length = self._word(params, offset + 1), self._word(params, offset + 3)
+                    data = listeners[i].read(address, length)
+                    responses.append(self._status(listeners[i], ERR_ACCESS if data is None else 0, data or b''))
+                return responses
+
+            if inst == INST_REBOOT and dxl_id in listeners:
+                listeners[dxl_id].table[64] = 0
+                return [self._status(listeners[dxl_id], 0, b'')]
+
+        return []
+
+    @staticmethod
+    def _word(params, offset):
+        return params[offset] | (params[offset + 1] << 8)
+
+    @staticmethod
+    def _parse(packet):
+        """ヘッダ・CRCを検証し、(ID, インストラクション, パラメータ) を返す"""
+        start = packet.find(HEADER[:3])
+        if start < 0 or len(packet) < start + 10:
+            return None
+        packet = packet[start:]
+        length = packet[5] | (packet[6] << 8)
+        total = length + 7
+        if len(packet) < total or _crc16(packet[:total - 2]) != (packet[total - 2] | (packet[total - 1] << 8)):
+            return None
+        body = packet[7:total - 2]
+        # バイトスタッフィング (FF FF FD FD → FF FF FD) を除去
+        params = bytearray()
+        for i, byte in enumerate(body[1:], start=1):
+            if byte == 0xFD and i >= 3 and body[i - 3:i] == b'\xff\xff\xfd':
+                continue
+            params.append(byte)
+        return packet[4], body[0], bytes(params)
+
+    @staticmethod
+    def _status(servo, error, data, baud_rate=None):
+        body = bytearray((INST_STATUS, error))
+        for byte in data:
+            body.append(byte)
+            if len(body) >= 3 and body[-3:] == b'\xff\xff\xfd':
+                body.append(0xFD)
+        length = len(body) + 2
+        packet = bytearray(HEADER) + bytes((servo.dxl_id, length & 0xFF, length >> 8)) + body
+        crc = _crc16(packet)
+        packet += bytes((crc & 0xFF, crc >> 8))
+        return servo.return_delay, bytes(packet), baud_rate or servo.baud_rate
+
+
+class SimPortHandler(PortHandler):
+    """
+    SimServoBus に接続する PortHandler
+
+    送信パケットの転送時間、サーボの Return Delay Time、応答の転送時間、USBレイテンシを
+    積み上げた時刻になるまで応答バイトを読めないようにする。
+    drop_rate / corrupt_rate を指定すると、その確率でステータスパケットを欠落 (以降の応答も返らない) /
+    破損 (CRC 不一致) させる (通信エラー処理の確認用)。
+    max_baud_rate を指定すると、それより速いボーレートでは HIGH_BAUD_CORRUPT_RATE の確率で応答を破損させる
+    (ケーブル長や配線による通信速度の上限の模擬, ボーレート調整の確認用)。
+    """
+    HIGH_BAUD_CORRUPT_RATE = 0.02
+
+    def __init__(self, bus, port_name="sim-dxl", latency=0.001, time_scale=1.0, drop_rate=0.0, corrupt_rate=0.0,
+                 seed=None, max_baud_rate=None):
+        super().__init__(port_name)
+        self.bus = bus
+        self.latency = latency
+        self.time_scale = time_scale
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.max_baud_rate = max_baud_rate
+        self._random = random.Random(seed)
+        self._rx = []  # (到着時刻, bytes)
+        self._lock = threading.Lock()
+
+    def openPort(self):
+        return self.setBaudRate(self.baudrate)
+
+    def closePort(self):
+        self.is_open = False
+        with self._lock:
+            self._rx.clear()
+
+    def clearPort(self):
+        with self._lock:
+            self._rx.clear()
+
+    def setBaudRate(self, baudrate):
+        if baudrate not in BAUD_RATE_TABLE.values():
+            return False
+        self.baudrate = baudrate
+        self.tx_time_per_byte = (1000.0 / self.baudrate) * 10.0
+        self.is_open = True
+        return True
+
+    def getBytesAvailable(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(len(chunk) for arrival, chunk in self._rx if arrival <= now)
+
+    def readPort(self, length):
+        now = time.monotonic()
+        # 実機のシリアルに設定する読み込みタイムアウト (READ_WAIT) と同様に、
+        # 応答が届くまで短時間ブロックする (空読みの繰り返しで GIL を握り続けない)
+        with self._lock:
+            next_arrival = self._rx[0][0] if self._rx else None
+        if next_arrival is None or next_arrival > now:
+            time.sleep(READ_WAIT if next_arrival is None else min(next_arrival - now, READ_WAIT))
+            now = time.monotonic()
+        data = bytearray()
+        with self._lock:
+            while self._rx and self._rx[0][0] <= now and len(data) < length:
+                arrival, chunk = self._rx.pop(0)
+                take = length - len(data)
+                data += chunk[:take]
+                if len(chunk) > take:
+                    self._rx.insert(0, (arrival, chunk[take:]))
+        return bytes(data)
+
+    def writePort(self, packet):
+        packet = bytes(packet)
+        now = time.monotonic()
+        arrival = now + (self.latency + _transfer_time(len(packet), self.baudrate)) * self.time_scale
+        responses = self.bus.handle(packet, self.baudrate)
+        corrupt_rate = self.corrupt_rate
+        if self.max_baud_rate and self.baudrate > self.max_baud_rate:
+            corrupt_rate = max(corrupt_rate, self.HIGH_BAUD_CORRUPT_RATE)
+        with self._lock:
+            for delay, status, baud_rate in responses:
+                if self.drop_rate and self._random.random() < self.drop_rate:
+                    break
+                if corrupt_rate and self._random.random() < corrupt_rate:
+                    status = status[:-1] + bytes((status[-1] ^ 0xFF,))
+                arrival += (delay + _transfer_time(len(status), baud_rate)) * self.time_scale
+                self._rx.append((arrival + self.latency * self.time_scale, status))
+        return len(packet)
+
+
+class SimMotorDriverSerial:
+    """
+    Pico/R4 モータードライバーファームウェアを模擬する pyserial 互換オブジェクト
+
+    ASCII ("M:", "Q:", "E:", "B:") とバイナリフレームの両方のコマンドを受け付け、
+    STATUS_PERIOD ごとに S: ステータス (バイナリモードではフレーム) を送信する。
+    セグメントは受信時刻から順に再生し、PWM は参照された時刻の補間値を返す。
+    """
+    STATUS_PERIOD = 0.101  # ファームウェアの送信周期 (millis() - last > 100)
+
+    def __init__(self, driver_type="r4", baudrate=115200, timeout=0.1, latency=0.001, time_scale=1.0):
+        self.port = f"sim-{driver_type}"
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.latency = latency
+        self.time_scale = time_scale
+        self.dtr = True
+        self.rts = True
+        self.is_open = True
+
+        self.pwm = 0
+        self.enabled = True
+        self.binary_mode = False
+        self._segments = deque()  # (終点のPWM, 所要時間 [秒])
+        self._segment_start = 0.0       # 先頭セグメントの開始時刻
+        self._segment_start_pwm = 0
+        self._clock = 0.0               # PWM を最後に更新した時刻
+        self._tx_seq = 0
+        self._decoder = proto.FrameDecoder()
+        self._out = []  # (到着時刻, bytes)
+        self._cond = threading.Condition()
+
+        now = time.monotonic()
+        self._next_status = now + self.STATUS_PERIOD
+        banner = b"R4 Motor Driver Started" if driver_type == "r4" else b"Pico Motor Driver Started"
+        self._emit(banner + b"\r\n", now)
+
+    def _delay(self, num_bytes):
+        return (self.latency + _transfer_time(num_bytes, self.baudrate)) * self.time_scale
+
+    def _emit(self, data, now):
+        self._out.append((now + self._delay(len(data)), data))
+
+    def _pump(self, now):
+        """nowまでに送信されるはずのステータスを生成する"""
+        while self._next_status <= now:
+            self._advance(self._next_status)
+            depth = len(self._segments)
+            if self.binary_mode:
+                data = proto.encode_frame(self._tx_seq, [(proto.MSG_STATUS, self.pwm), (proto.MSG_QUEUE_DEPTH, depth)])
+                self._tx_seq = (self._tx_seq + 1) & 0xFF
+            else:
+                data = f"S:{self.pwm},{depth}\r\n".encode()
+            self._emit(data, self._next_status)
+            self._next_status += self.STATUS_PERIOD
+        self._advance(now)
+
+    def _advance(self, now):
+        """セグメントキューを now まで再生して PWM を更新する"""
+        if now <= self._clock:
+            return
+        self._clock = now
+        segments = self._segments
+        while segments:
+            pwm, duration = segments[0]
+            end = self._segment_start + duration
+            if now < end:
+                frac = (now - self._segment_start) / duration
+                self.pwm = int(self._segment_start_pwm + (pwm - self._segment_start_pwm) * frac)
+                return
+            # 次のセグメントはこの終点の時刻から始める
+            self.pwm = self._segment_start_pwm = pwm
+            self._segment_start = end
+            segments.popleft()
+
+    def _ready(self, now):
+        size = 0
+        for arrival, data in self._out:
+            if arrival > now:
+                break
+            size += len(data)
+        return size
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            now = time.monotonic()
+            self._pump(now)
+            return self._ready(now)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while self.is_open:
+                now = time.monotonic()
+                self._pump(now)
+                if self._ready(now):
+                    return self._take(size, now)
+                if deadline is not None and now >= deadline:
+                    return b''
+                wake = self._next_status
+                if self._out:
+                    wake = min(wake, self._out[0][0])
+                if deadline is not None:
+                    wake = min(wake, deadline)
+                self._cond.wait(max(0.0, wake - now))
+        return b''
+
+    def _take(self, size, now):
+        data = bytearray()
+        while self._out and self._out[0][0] <= now and len(data) < size:
+            arrival, chunk = self._out.pop(0)
+            take = size - len(data)
+            data += chunk[:take]
+            if len(chunk) > take:
+                self._out.insert(0, (arrival, chunk[take:]))
+        return bytes(data)
+
+    def write(self, data):
+        data = bytes(data)
+        with self._cond:
+            now = time.monotonic() + self._delay(len(data))
+            for event in self._decoder.feed(data):
+                if event[0] == 'frame':
+                    for msg_type, value in event[2]:
+                        self._apply(msg_type, value, now)
+                else:
+                    self._handle_line(event[1], now)
+            self._cond.notify_all()
+        return len(data)
+
+    def _handle_line(self, line, now):
+        if line.startswith(b"M:"):
+            self._apply(proto.MSG_PWM, int(line[2:]), now)
+        elif line.startswith(b"Q:"):
+            pwm, duration_ms = line[2:].split(b",")
+            self._apply(proto.MSG_SEGMENT, (int(pwm), int(duration_ms)), now)
+        elif line.startswith(b"E:"):
+            self._apply(proto.MSG_ENABLE, int(line[2:]), now)
+        elif line.startswith(b"B:"):
+            self.binary_mode = int(line[2:]) != 0
+            self._emit(f"B:{1 if self.binary_mode else 0}\r\n".encode(), now)
+
+    def _apply(self, msg_type, value, now):
+        self._advance(now)
+        if msg_type == proto.MSG_PWM:
+            self._segments.clear()
+            self.pwm = max(-255, min(255, value))
+        elif msg_type == proto.MSG_SEGMENT:
+            if len(self._segments) >= proto.SEGMENT_QUEUE_SIZE:
+                return
+            if not self._segments:
+                # キューが空だった場合は現在の出力から開始する
+                self._segment_start = max(now, self._clock)
+                self._segment_start_pwm = self.pwm
+            pwm, duration_ms = value
+            self._segments.append((max(-255, min(255, pwm)), duration_ms / 1000.0))
+        elif msg_type == proto.MSG_ENABLE:
+            self.enabled = value != 0
+            if not self.enabled:
+                self._segments.clear()
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._pump(time.monotonic())
+            self._out.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+
+def create_sim_port(ids, baud_rate=57600, latency=0.001, time_scale=1.0, port_name="sim-dxl", drop_rate=0.0,
+                    corrupt_rate=0.0, max_baud_rate=None):
+    """模擬サーボバス (全IDが baud_rate) に接続した SimPortHandler を作成する (ポートは開いていない)"""
+    bus = SimServoBus(ids, baud_rate)
+    port = SimPortHandler(bus, port_name, latency=latency, time_scale=time_scale, drop_rate=drop_rate,
+                          corrupt_rate=corrupt_rate, max_baud_rate=max_baud_rate)
+    port.baudrate = baud_rate
+    return port
+
+
+def create_sim_dynamixel(ids, baud_rate=57600, latency=0.001, time_scale=1.0, port_name="sim-dxl", drop_rate=0.0,
+                         corrupt_rate=0.0, max_baud_rate=None, **kwargs):
+    """模擬サーボバスに接続した DynamixelInterface を作成する"""
+    port = create_sim_port(ids, baud_rate, latency=latency, time_scale=time_scale, port_name=port_name,
+                           drop_rate=drop_rate, corrupt_rate=corrupt_rate, max_baud_rate=max_baud_rate)
+    return DynamixelInterface(port.getPortName(), baud_rate=baud_rate, port_handler=port, **kwargs)
+
+
+def create_sim_dc_motor(driver_type="r4", latency=0.001, time_scale=1.0, **kwargs):
+    """模擬モータードライバーに接続した DCMotorInterface を作成する"""
+    ser = SimMotorDriverSerial(driver_type, latency=latency, time_scale=time_scale)
+    return DCMotorInterface(ser.port, serial_port=ser, **kwargs)
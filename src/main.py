@@ -7,21 +7,54 @@ Armlatable メインコントロールプログラム
     controller:
         test     - 自動テスト (デフォルト)
         keyboard - キーボード操作
+
+    python src/main.py bench [options]
+        制御ループのベンチマーク (詳細は python src/main.py bench --help)
+
+    python src/main.py replay [controller] [options]
+        ハードウェアなしでコントローラーを実行し、記録と比較 (詳細は python src/main.py replay --help)
+
+    python src/main.py tune [options]
+        Dynamixel のボーレートと Return Delay Time を自動調整し config.yaml に保存 (詳細は python src/main.py tune --help)
 """
 import yaml
-import time
 import sys
 import os
-from dataclasses import dataclass
+import time
+import contextlib
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
 from hardware.dxl_interface import DynamixelInterface
 from hardware.dc_motor_interface import DCMotorInterface
+from runtime.buses import DynamixelBuses, MotorDrivers
+from runtime.display import StatusDisplay
+from runtime.loop import ControlLoop
+from runtime.scheduler import LoopScheduler
 
 # --- 設定クラス ---
+@dataclass
+class MotorDriverConfig:
+    port: str
+    type: str = "pico"  # "pico" or "r4"
+
 @dataclass
 class SerialConfig:
     dxl_port: str
     pico_port: str
     motor_driver_type: str = "pico" # "pico" or "r4"
+    motor_protocol: str = "ascii"   # "ascii" or "binary" (非対応ファームウェアではasciiにフォールバック)
+    # 複数のモータードライバーを使う場合に指定 (pico_port / motor_driver_type の代わり, PWM は全台に同じ値を送る)
+    motor_drivers: list[MotorDriverConfig] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.motor_drivers = [MotorDriverConfig(**d) if isinstance(d, dict) else d for d in self.motor_drivers]
+
+@dataclass
+class DynamixelBusConfig:
+    port: str
+    ids: list[int]
+    baud_rate: int | None = None  # None の場合は dynamixel.baud_rate
 
 @dataclass
 class DynamixelConfig:
@@ -29,18 +62,62 @@ class DynamixelConfig:
     baud_rate: int
     model: str
     current_limit_ma: int = 500  # トルク制限 (mA)
+    retries: int = 0  # 通信に失敗した場合の再送回数 (Sync Read は応答のなかったIDだけを読み直す)
+    # 複数の U2D2 を使う場合に指定 (serial.dxl_port の代わり, ids の各IDはいずれか1つのバスに属する)
+    buses: list[DynamixelBusConfig] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.buses = [DynamixelBusConfig(**b) if isinstance(b, dict) else b for b in self.buses]
+        if self.buses:
+            bus_ids = [dxl_id for bus in self.buses for dxl_id in bus.ids]
+            if len(bus_ids) != len(set(bus_ids)):
+                raise ValueError(f"Dynamixel ID is assigned to more than one bus: {bus_ids}")
+            missing = [dxl_id for dxl_id in self.ids if dxl_id not in bus_ids]
+            if missing:
+                raise ValueError(f"Dynamixel IDs not assigned to any bus: {missing}")
 
 @dataclass
 class ControlConfig:
     loop_rate_hz: int
+    overrun_policy: str = "skip"  # 周期超過時: "skip" or "catch_up"
+    keepalive_interval_s: float | None = 0.5  # 変化のない指令を再送する間隔 (Noneで再送しない)
+    display_rate_hz: float = 10  # ステータス表示の更新周期 (0で表示しない)
+    parallel_io: bool = False  # Dynamixel と DCモーターへの書き込みをバスごとのスレッドで同時に行う
+    trajectory: str | None = None  # テストコントローラーの軌道ファイル (None で組み込みのテスト軌道)
+    process_mode: str = "single"  # "single" or "split" (コントローラーとハードウェアI/Oを別プロセスで実行)
+    stall_timeout_s: float = 0.5  # split: コマンドの更新がこの時間止まったら安全側の値に切り替える
+    stats_interval_s: float = 0  # バスの通信統計を表示する間隔 (0で終了時のみ)
+    dc_streaming: bool = False  # DCモーターの PWM を先読みしてセグメントで送り、MCU 側で補間させる
+    dc_lookahead_s: float = 0.2  # dc_streaming: MCU のキューに積んでおく時間 (秒)
+    dc_segment_s: float = 0.02   # dc_streaming: 1セグメントの長さ (秒)
+    motion_profile: bool = False  # キーボードの位置指令をサーボの台形プロファイルで動かし、Moving をポーリングする
+    profile_velocity: float = 2000.0      # motion_profile: 最高速度 [pulse/s]
+    profile_acceleration: float = 8000.0  # motion_profile: 加速度 [pulse/s^2]
     position_min: int = -20000
     position_max: int = 20000
 
+@dataclass
+class SimulationConfig:
+    enabled: bool = False    # True の場合、実機の代わりに模擬ハードウェアを使用
+    time_scale: float = 1.0  # シリアル転送・レイテンシの模擬時間の係数 (0で待ち時間なし)
+    latency_ms: float = 1.0  # USBシリアルの片道レイテンシ (ms)
+    drop_rate: float = 0.0     # サーボのステータスパケットを欠落させる確率
+    corrupt_rate: float = 0.0  # サーボのステータスパケットを破損 (CRC不一致) させる確率
+    max_baud_rate: int | None = None  # これより速いボーレートでは応答がときどき破損する (配線による上限の模擬)
+
+@dataclass
+class RecordingConfig:
+    enabled: bool = False
+    path: str = "recordings/telemetry.npy"  # 出力先 (同名の .json に ID の並びを保存)
+    capacity: int = 72000  # 保持するティック数 (超えると古いものから上書き, 20Hz で1時間)
+
 @dataclass
 class AppConfig:
     serial: SerialConfig
     dynamixel: DynamixelConfig
     control: ControlConfig
+    simulation: SimulationConfig
+    recording: RecordingConfig
 
     @staticmethod
     def load(path: str) -> 'AppConfig':
@@ -49,148 +126,253 @@ class AppConfig:
         return AppConfig(
             serial=SerialConfig(**data['serial']),
             dynamixel=DynamixelConfig(**data['dynamixel']),
-            control=ControlConfig(**data['control'])
+            control=ControlConfig(**data['control']),
+            simulation=SimulationConfig(**data.get('simulation', {})),
+            recording=RecordingConfig(**data.get('recording', {}))
         )
 
+    def dxl_buses(self) -> list[DynamixelBusConfig]:
+        """使用する Dynamixel バス (dynamixel.ids に含まれるIDのみ, IDのないバスは除く)"""
+        dxl = self.dynamixel
+        if not dxl.buses:
+            return [DynamixelBusConfig(self.serial.dxl_port, list(dxl.ids), dxl.baud_rate)]
+        buses = []
+        for bus in dxl.buses:
+            ids = [dxl_id for dxl_id in bus.ids if dxl_id in dxl.ids]
+            if ids:
+                buses.append(DynamixelBusConfig(bus.port, ids, bus.baud_rate or dxl.baud_rate))
+        return buses
+
+    def motor_drivers(self) -> list[MotorDriverConfig]:
+        """使用するモータードライバー (先頭のドライバーのステータスを表示・記録に使う)"""
+        if self.serial.motor_drivers:
+            return self.serial.motor_drivers
+        return [MotorDriverConfig(self.serial.pico_port, self.serial.motor_driver_type)]
+
 # --- コントローラー読み込み ---
-def get_controller(name: str, dxl_ids: list[int]):
+def get_controller(name: str, dxl_ids: list[int], key_source=None, trajectory: str | None = None, planner=None):
     """
     指定された名前のコントローラーを取得する
 
     Args:
         name: コントローラー名 ('test' or 'keyboard')
         dxl_ids: Dynamixel IDのリスト
+        key_source: キーボードコントローラーの入力元 (None の場合は端末, リプレイ用)
+        trajectory: テストコントローラーの軌道ファイル (None の場合は組み込みのテスト軌道)
+        planner: キーボードコントローラーの移動を計画する ProfilePlanner (None の場合は目標値を直接送る)
 
     Returns:
         Controller instance
     """
     if name == 'test':
         from api.test import TestController
-        return TestController(dxl_ids)
+        return TestController(dxl_ids, trajectory=trajectory)
     elif name == 'keyboard':
         from api.keyboard import KeyboardController
-        return KeyboardController(dxl_ids)
+        return KeyboardController(dxl_ids, key_source=key_source, planner=planner)
     else:
         raise ValueError(f"Unknown controller: {name}")
 
-# --- メイン ---
-def main():
-    # コントローラー選択
-    controller_name = sys.argv[1] if len(sys.argv) > 1 else 'test'
+def make_planner(config: AppConfig):
+    """control.motion_profile が有効な場合は ProfilePlanner を返す (無効な場合は None)"""
+    if not config.control.motion_profile:
+        return None
+    from api.profile import ProfilePlanner
+    return ProfilePlanner(config.control.profile_velocity, config.control.profile_acceleration)
 
-    # --- 設定読み込み ---
-    config_paths = ['config.yaml', 'src/config.yaml']
-    config = None
-    for path in config_paths:
+# --- ハードウェア生成 ---
+def create_hardware(config: AppConfig):
+    """
+    設定に応じて実機または模擬ハードウェアのインターフェースを生成する
+
+    Dynamixel のバスとモータードライバーはそれぞれ別のUSBデバイスなので、初期化 (ポートオープン・応答待ち) を並行して行う。
+    バスやドライバーが複数ある場合は DynamixelBuses / MotorDrivers にまとめて返す。
+
+    Returns:
+        (DynamixelInterface, DCMotorInterface)
+    """
+    dxl_options = dict(keepalive_interval=config.control.keepalive_interval_s, retries=config.dynamixel.retries,
+                       read_moving=config.control.motion_profile)
+    dc_options = dict(protocol=config.serial.motor_protocol, keepalive_interval=config.control.keepalive_interval_s)
+    buses = config.dxl_buses()
+    drivers = config.motor_drivers()
+
+    if config.simulation.enabled:
+        from hardware.simulation import create_sim_dynamixel, create_sim_dc_motor
+        sim_options = dict(latency=config.simulation.latency_ms / 1000.0, time_scale=config.simulation.time_scale)
+        fault_options = dict(drop_rate=config.simulation.drop_rate, corrupt_rate=config.simulation.corrupt_rate,
+                             max_baud_rate=config.simulation.max_baud_rate)
+        make_dxls = [partial(create_sim_dynamixel, bus.ids, bus.baud_rate, port_name=f"sim-dxl{i}",
+                             **sim_options, **fault_options, **dxl_options) for i, bus in enumerate(buses)]
+        make_dcs = [partial(create_sim_dc_motor, driver.type, **sim_options, **dc_options) for driver in drivers]
+    else:
+        make_dxls = [partial(DynamixelInterface, bus.port, baud_rate=bus.baud_rate, **dxl_options) for bus in buses]
+        # 内部的には同じプロトコルを使用しているため、DCMotorInterfaceを共通で使用
+        make_dcs = [partial(DCMotorInterface, driver.port, **dc_options) for driver in drivers]
+
+    with ThreadPoolExecutor(max_workers=len(make_dxls) + len(make_dcs)) as pool:
+        jobs = [pool.submit(make) for make in make_dxls + make_dcs]
+        wait(jobs)
+    errors = [job.exception() for job in jobs if job.exception() is not None]
+    if errors:
+        # 一部だけ開けた場合は閉じてから失敗を伝える
+        for job in jobs:
+            if job.exception() is None:
+                job.result().close()
+        raise errors[0]
+
+    dxls = [job.result() for job in jobs[:len(make_dxls)]]
+    dcs = [job.result() for job in jobs[len(make_dxls):]]
+    dxl = dxls[0] if len(dxls) == 1 else DynamixelBuses(zip(dxls, (bus.ids for bus in buses)))
+    dc_motor = dcs[0] if len(dcs) == 1 else MotorDrivers(dcs)
+    return dxl, dc_motor
+
+# --- 設定読み込み ---
+CONFIG_PATHS = ['config.yaml', 'src/config.yaml']
+
+def load_config() -> AppConfig | None:
+    """ルートまたは src/ の config.yaml を読み込む"""
+    for path in CONFIG_PATHS:
         try:
             if os.path.exists(path):
                 config = AppConfig.load(path)
                 print(f"Loaded config from: {path}")
-                break
+                return config
         except Exception as e:
             print(f"Warning: Failed to load config from {path}: {e}")
 
+    print("Error: config.yaml not found in root or src/")
+    return None
+
+# --- メイン ---
+def main():
+    # コントローラー選択
+    controller_name = sys.argv[1] if len(sys.argv) > 1 else 'test'
+
+    if controller_name == 'bench':
+        from runtime.bench import run_bench
+        # 標準出力は JSON 専用にする
+        with contextlib.redirect_stdout(sys.stderr):
+            config = load_config()
+        if config is None:
+            return
+        run_bench(config, sys.argv[2:], make_controller=partial(get_controller, trajectory=config.control.trajectory,
+                                                               planner=make_planner(config)),
+                  make_hardware=create_hardware)
+        return
+
+    if controller_name == 'replay':
+        from runtime.replay import run_replay
+        config = load_config()
+        if config is None:
+            return
+        sys.exit(run_replay(config, sys.argv[2:],
+                            make_controller=partial(get_controller, trajectory=config.control.trajectory,
+                                                    planner=make_planner(config))))
+
+    if controller_name == 'tune':
+        from runtime.tune import run_tune
+        config = load_config()
+        if config is None:
+            return
+        config_path = next(path for path in CONFIG_PATHS if os.path.exists(path))
+        sys.exit(run_tune(config, sys.argv[2:], config_path))
+
+    startup = time.monotonic()
+    # --- 設定読み込み ---
+    config = load_config()
     if config is None:
-        print("Error: config.yaml not found in root or src/")
         return
 
     # --- コントローラー初期化 ---
     DXL_IDS = config.dynamixel.ids
     try:
-        controller = get_controller(controller_name, DXL_IDS)
+        controller = get_controller(controller_name, DXL_IDS, trajectory=config.control.trajectory,
+                                    planner=make_planner(config))
         print(f"Controller: {controller_name}")
     except Exception as e:
         print(f"Failed to load controller: {e}")
         return
 
-    print(f"Initializing Hardware (Motor Driver: {config.serial.motor_driver_type})...")
-    try:
-        dxl = DynamixelInterface(config.serial.dxl_port, baud_rate=config.dynamixel.baud_rate)
-        # 内部的には同じプロトコルを使用しているため、DCMotorInterfaceを共通で使用
-        dc_motor = DCMotorInterface(config.serial.pico_port)
-    except Exception as e:
-        print(f"初期化失敗: {e}")
-        return
-
-    DXL_IDS = config.dynamixel.ids
-    for dxl_id in DXL_IDS:
-        dxl.enable_torque(dxl_id, True)
-        dxl.set_current_limit(dxl_id, config.dynamixel.current_limit_ma)
-    print(f"Torque enabled and current limit set to {config.dynamixel.current_limit_ma} mA for IDs: {DXL_IDS}")
-
-    # キーボードモードの場合、現在位置に同期＆位置制限を設定
-    if hasattr(controller, 'set_initial_position'):
-        # すべてのIDの現在位置を取得して同期
-        initial_positions = {}
-        for dxl_id in DXL_IDS:
-            current_pos = dxl.get_present_position(dxl_id)
-            initial_positions[dxl_id] = current_pos if current_pos is not None else 0
-
-        controller.set_initial_position(initial_positions)
-        print(f"Synced to current positions: {initial_positions}")
-    if hasattr(controller, 'set_position_limits'):
-        controller.set_position_limits(config.control.position_min, config.control.position_max)
-        print(f"Position limits: [{config.control.position_min}, {config.control.position_max}]")
-
-    print("制御ループ開始...")
+    sim_label = ", Simulated" if config.simulation.enabled else ""
+    split_label = ", I/O process" if config.control.process_mode == "split" else ""
+    driver_type = config.motor_drivers()[0].type
+    num_buses, num_drivers = len(config.dxl_buses()), len(config.motor_drivers())
+    bus_label = f", {num_buses} buses" if num_buses > 1 else ""
+    driver_label = f" x{num_drivers}" if num_drivers > 1 else ""
+    print(f"Initializing Hardware (Motor Driver: {driver_type}{driver_label}{bus_label}{sim_label}{split_label})...")
+    display = None
+    if config.control.display_rate_hz > 0:
+        display = StatusDisplay(driver_type, config.control.display_rate_hz)
+
+    if config.control.process_mode == "split":
+        # ハードウェアは I/O プロセスが生成する (テレメトリ記録も I/O プロセス側で行う)
+        from runtime.split import SplitLoop
+        if config.control.dc_streaming:
+            print("Note: dc_streaming is not supported in split mode (step PWM)")
+        loop = SplitLoop(config, create_hardware, controller, display=display)
+        try:
+            loop.setup(config.dynamixel.current_limit_ma, config.control.position_min, config.control.position_max)
+        except RuntimeError as e:
+            print(f"初期化失敗: {e}")
+            loop.shutdown()
+            return
+    else:
+        try:
+            dxl, dc_motor = create_hardware(config)
+        except Exception as e:
+            print(f"初期化失敗: {e}")
+            return
+
+        recorder = None
+        if config.recording.enabled:
+            from runtime.recorder import TelemetryRecorder
+            recorder = TelemetryRecorder(config.recording.path, DXL_IDS, config.recording.capacity)
+            print(f"Recording telemetry to {config.recording.path}")
+        dc_stream = None
+        if config.control.dc_streaming:
+            if hasattr(controller, 'dc_pwm_at'):
+                from runtime.dc_stream import DCSegmentStreamer
+                dc_stream = DCSegmentStreamer(dc_motor, controller.dc_pwm_at, config.control.dc_lookahead_s,
+                                              config.control.dc_segment_s)
+                print(f"DC segment streaming: lookahead {config.control.dc_lookahead_s} s, "
+                      f"segment {config.control.dc_segment_s} s")
+            else:
+                print(f"Note: {controller_name} controller does not support DC segment streaming (step PWM)")
+        loop = ControlLoop(controller, dxl, dc_motor, DXL_IDS, display=display,
+                           parallel_io=config.control.parallel_io, recorder=recorder,
+                           stats_interval=config.control.stats_interval_s, dc_stream=dc_stream)
+        loop.setup(config.dynamixel.current_limit_ma, config.control.position_min, config.control.position_max)
+
+    print(f"制御ループ開始... (起動 {time.monotonic() - startup:.2f} s)")
+    scheduler = LoopScheduler(config.control.loop_rate_hz, config.control.overrun_policy)
+    if hasattr(controller, 'set_wake'):
+        # 緊急のキー入力は次の周期を待たずに送信する
+        controller.set_wake(scheduler.wake)
     try:
-        start_time = time.time()
-        last_mode = None
-
+        if display is not None:
+            display.start()
+        scheduler.start()
         while controller.should_continue():
-            elapsed = time.time() - start_time
-
-            # --- ステータス読み取り ---
-            dc_motor.update()
-
-            # --- 目標値計算 (コントローラーに委譲) ---
-            cmd = controller.update(elapsed)
-
-            # DXL制御
-            for dxl_id, dxl_target in cmd.dxl_targets.items():
-                # モード変更時のみ設定
-                if cmd.dxl_mode != last_mode:
-                    dxl.set_operating_mode(dxl_id, cmd.dxl_mode)
-
-                if cmd.dxl_mode == 3 or cmd.dxl_mode == 4:  # Position / Extended Position
-                    dxl.set_position(dxl_id, dxl_target)
-                elif cmd.dxl_mode == 1:  # Velocity
-                    dxl.set_velocity(dxl_id, dxl_target)
-
-            if cmd.dxl_mode != last_mode:
-                last_mode = cmd.dxl_mode
-
-            # Enable/Disable 制御
-            if cmd.enable is not None:
-                print(f"\nSetting Motors: {'ENABLED' if cmd.enable else 'DISABLED'}")
-                for dxl_id in DXL_IDS:
-                    dxl.enable_torque(dxl_id, cmd.enable)
-                dc_motor.set_enabled(cmd.enable)
-
-            # DCモーター出力
-            dc_motor.set_motor_pwm(cmd.dc_pwm)
-
-            # Log
-            mode_str = 'ExtPos' if cmd.dxl_mode == 4 else ('Pos' if cmd.dxl_mode == 3 else 'Vel')
-            target_str = ", ".join([f"{id}:{val}" for id, val in cmd.dxl_targets.items()])
-            driver_label = config.serial.motor_driver_type.upper()
-            print(f"\rTime: {elapsed:.2f} | {driver_label}: {cmd.dc_pwm:4d} | DXLs({mode_str}): {target_str}", end='')
-            sys.stdout.flush()
-
-            time.sleep(1.0 / config.control.loop_rate_hz)
+            loop.tick(scheduler.wait())
 
     except KeyboardInterrupt:
         print("\n停止中...")
 
     finally:
-        dc_motor.set_motor_pwm(0)
-        for dxl_id in DXL_IDS:
-            dxl.enable_torque(dxl_id, False)
-        dxl.close()
-        dc_motor.close()
+        if display is not None:
+            display.stop()
+        loop.shutdown()
+        if config.recording.enabled and getattr(controller, 'key_log', None):
+            # キー入力もリプレイできるようにテレメトリと並べて保存
+            from runtime.replay import keys_path, save_keys
+            save_keys(keys_path(config.recording.path), controller.key_log)
         if hasattr(controller, 'cleanup'):
             controller.cleanup()
-        print("\nハードウェア接続を終了しました。")
+        print(f"\nLoop: {scheduler.stats.summary()}")
+        if hasattr(controller, 'latency_summary'):
+            print(controller.latency_summary())
+        print("ハードウェア接続を終了しました。")
 
 
 if __name__ == '__main__':
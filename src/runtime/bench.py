@@ -0,0 +1,193 @@
+"""
+制御ループのベンチマーク
+
+使用方法:
+    python src/main.py bench [--ticks N] [--max-ids N] [--bauds 57600,1000000] [--real] [--buses N] [--io parallel|serial]
+                             [--output FILE]
+
+実機または模擬ハードウェアに対してコントローラーを N ティック実行し、ステージごとの
+レイテンシ (p50/p95/p99/max) と、達成したループ周波数を control.loop_rate_hz と比較して報告する。
+結果は JSON で出力する (バージョン間の比較用)。
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import datetime, timezone
+
+from runtime.display import StatusDisplay
+from runtime.loop import ControlLoop
+from runtime.profiling import StageTimer
+from runtime.recorder import TelemetryRecorder
+from runtime.scheduler import LoopScheduler
+
+SCHEMA_VERSION = 1
+DEFAULT_SIM_BAUDS = [57600, 1000000, 4000000]
+
+
+def parse_args(argv, config):
+    parser = argparse.ArgumentParser(prog="main.py bench", description="制御ループのベンチマーク")
+    parser.add_argument("--controller", default="test", help="使用するコントローラー (default: test)")
+    parser.add_argument("--ticks", type=int, default=100, help="1条件あたりのティック数 (default: 100)")
+    parser.add_argument("--max-ids", type=int, default=len(config.dynamixel.ids),
+                        help="サーボ数を 1..N で変化させる (default: config の ID 数)")
+    parser.add_argument("--bauds", default=None,
+                        help="模擬バスのボーレート (カンマ区切り, default: 57600,1000000,4000000)")
+    parser.add_argument("--rate", type=float, default=config.control.loop_rate_hz,
+                        help="目標ループ周波数 (default: control.loop_rate_hz)")
+    parser.add_argument("--free-run", action="store_true", help="周期待ちをせず連続実行する (最大性能の測定)")
+    parser.add_argument("--real", action="store_true", help="模擬ハードウェアではなく実機で測定する")
+    parser.add_argument("--time-scale", type=float, default=config.simulation.time_scale,
+                        help="模擬ハードウェアの転送時間係数 (default: simulation.time_scale)")
+    parser.add_argument("--buses", type=int, default=max(1, len(config.dynamixel.buses)),
+                        help="模擬ハードウェアで ID を分割する Dynamixel バスの数 (default: dynamixel.buses の数)")
+    parser.add_argument("--io", choices=["parallel", "serial"], default=None,
+                        help="バスへの書き込み方式 (default: control.parallel_io)")
+    parser.add_argument("--record", action="store_true", help="テレメトリ記録を有効にして測定する (一時ファイルに書き込む)")
+    parser.add_argument("--output", default=None, help="JSON の出力先 (default: 標準出力)")
+    return parser.parse_args(argv)
+
+
+def bench_case(config, controller_name, ticks, rate_hz, free_run, make_controller, make_hardware, record=False):
+    """1条件 (ID数・ボーレート) のベンチマークを実行する"""
+    ids = config.dynamixel.ids
+    record_dir = tempfile.TemporaryDirectory() if record else None
+    # ハードウェア初期化のメッセージで JSON 出力が汚れないよう標準エラーへ逃がす
+    with contextlib.redirect_stdout(sys.stderr):
+        controller = make_controller(controller_name, ids)
+        dxl, dc_motor = make_hardware(config)
+        timer = StageTimer()
+        devnull = open(os.devnull, "w")
+        display = None
+        if config.control.display_rate_hz > 0:
+            display = StatusDisplay(config.motor_drivers()[0].type, config.control.display_rate_hz, out=devnull)
+        recorder = None
+        if record_dir is not None:
+            recorder = TelemetryRecorder(os.path.join(record_dir.name, "telemetry.npy"), ids, ticks)
+        loop = ControlLoop(controller, dxl, dc_motor, ids, display=display, timer=timer,
+                           parallel_io=config.control.parallel_io, recorder=recorder)
+        loop.setup(config.dynamixel.current_limit_ma, config.control.position_min, config.control.position_max)
+
+    scheduler = LoopScheduler(rate_hz, config.control.overrun_policy)
+    try:
+        if display is not None:
+            display.start()
+        scheduler.start()
+        start = time.monotonic()
+        first_tick = last_tick = None
+        for _ in range(ticks):
+            elapsed = time.monotonic() - start if free_run else scheduler.wait()
+            # 達成周波数はティック開始時刻の間隔 (ティック数 - 1 個) から求める
+            last_tick = time.monotonic()
+            if first_tick is None:
+                first_tick = last_tick
+            loop.tick(elapsed)
+            if not controller.should_continue():
+                break
+        bus_stats = {stats.name: stats.snapshot() for stats in dxl.get_stats() + dc_motor.get_stats()}
+    finally:
+        if display is not None:
+            display.stop()
+        with contextlib.redirect_stdout(sys.stderr):
+            loop.shutdown()
+            if hasattr(controller, 'cleanup'):
+                controller.cleanup()
+        devnull.close()
+        if record_dir is not None:
+            record_dir.cleanup()
+
+    stages = timer.summary()
+    num_ticks = len(timer.samples.get('total', []))
+    interval = last_tick - first_tick if first_tick is not None else 0.0
+    total_mean = stages.get('total', {}).get('mean_ms', 0.0)
+    return {
+        "backend": "sim" if config.simulation.enabled else "real",
+        "num_ids": len(ids),
+        "num_buses": len(config.dxl_buses()),
+        "motor_drivers": [driver.type for driver in config.motor_drivers()],
+        "baud_rate": config.dynamixel.baud_rate,
+        "ticks": num_ticks,
+        "target_rate_hz": rate_hz,
+        "free_run": free_run,
+        "parallel_io": config.control.parallel_io,
+        "record": record,
+        "achieved_rate_hz": (num_ticks - 1) / interval if num_ticks > 1 and interval > 0 else 0.0,
+        "capacity_hz": 1000.0 / total_mean if total_mean > 0 else 0.0,
+        "overruns": 0 if free_run else scheduler.stats.overruns,
+        "jitter_max_ms": 0.0 if free_run else scheduler.stats.jitter_max * 1000,
+        "stages": stages,
+        "bus_stats": bus_stats,
+    }
+
+
+def sim_buses(ids, num_buses, baud_rate):
+    """模擬ハードウェア用に ID を num_buses 個のバスへ順に割り振る (1バスの場合は空 = serial.dxl_port を使う)"""
+    if num_buses <= 1:
+        return []
+    return [{"port": f"sim-dxl{i}", "ids": ids[i::num_buses], "baud_rate": baud_rate} for i in range(num_buses)]
+
+
+def run_bench(config, argv, make_controller, make_hardware):
+    """
+    ベンチマークを実行して JSON を出力する
+
+    Args:
+        config: AppConfig
+        argv: コマンドライン引数 (bench 以降)
+        make_controller: (name, ids) からコントローラーを生成する関数
+        make_hardware: config から (DynamixelInterface, DCMotorInterface) を生成する関数
+    """
+    args = parse_args(argv, config)
+    real = args.real
+    if real:
+        bauds = [config.dynamixel.baud_rate]  # 実機のボーレートは変更しない
+    elif args.bauds:
+        bauds = [int(b) for b in args.bauds.split(",")]
+    else:
+        bauds = DEFAULT_SIM_BAUDS
+
+    simulation = replace(config.simulation, enabled=not real, time_scale=args.time_scale)
+    control = config.control
+    if args.io is not None:
+        control = replace(control, parallel_io=args.io == "parallel")
+    results = []
+    for baud_rate in bauds:
+        for num_ids in range(1, max(1, args.max_ids) + 1):
+            if real:
+                # 実機のバス構成は変更しない (先頭の num_ids 個のIDを使う)
+                ids = config.dynamixel.ids[:num_ids]
+                dynamixel = replace(config.dynamixel, ids=ids)
+            else:
+                ids = list(range(1, num_ids + 1))
+                dynamixel = replace(config.dynamixel, ids=ids, baud_rate=baud_rate,
+                                    buses=sim_buses(ids, args.buses, baud_rate))
+            case_config = replace(config, dynamixel=dynamixel, control=control, simulation=simulation)
+            result = bench_case(case_config, args.controller, args.ticks, args.rate, args.free_run,
+                                make_controller, make_hardware, record=args.record)
+            results.append(result)
+            total = result["stages"].get("total", {})
+            print(f"[bench] {result['backend']} baud={baud_rate} ids={num_ids} buses={result['num_buses']}: "
+                  f"rate {result['achieved_rate_hz']:.1f}/{args.rate:.1f} Hz, "
+                  f"tick p50 {total.get('p50_ms', 0):.2f} / p99 {total.get('p99_ms', 0):.2f} ms", file=sys.stderr)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "controller": args.controller,
+        "loop_rate_hz": config.control.loop_rate_hz,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"[bench] wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
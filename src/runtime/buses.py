@@ -0,0 +1,180 @@
+"""
+複数の Dynamixel バス (U2D2) と複数のモータードライバーを1つのインターフェースとして扱う
+
+    ControlLoop ──▶ DynamixelBuses ──▶ BusWorker(dxl0) ── U2D2 #0 (ID 1, 2, 3)
+                                   └─▶ BusWorker(dxl1) ── U2D2 #1 (ID 4, 5, 6)
+                ──▶ MotorDrivers   ──▶ Pico / R4 #0, #1, ...
+
+DynamixelBuses は DynamixelInterface と同じメソッドを持ち、IDごとの値を所属するバスへ振り分けて
+各バスのワーカースレッドで同時に実行する。1ティックの読み書き時間はバスの数によらず
+最も遅いバスの時間になるため、バスを増やすほど1ティックで更新できる関節数が増える。
+"""
+from runtime.io_worker import BusWorker
+
+
+class _BusTargets:
+    """{ID: 値} のうち1つのバスに属するIDだけを見せるビュー (コピーしない)"""
+    __slots__ = ('ids', 'values')
+
+    def __init__(self, ids, values):
+        self.ids = ids
+        self.values = values
+
+    def __iter__(self):
+        return (dxl_id for dxl_id in self.ids if dxl_id in self.values)
+
+    def items(self):
+        values = self.values
+        return ((dxl_id, values[dxl_id]) for dxl_id in self.ids if dxl_id in values)
+
+
+class DynamixelBuses:
+    """
+    複数の DynamixelInterface をまとめたもの (DynamixelInterface と同じ使い方ができる)
+
+    Args:
+        buses: [(DynamixelInterface, そのバスのIDのリスト), ...]
+    """
+    def __init__(self, buses):
+        self.buses = [(dxl, tuple(ids)) for dxl, ids in buses]
+        self.workers = [BusWorker(f"dxl{i}") for i in range(len(self.buses))]
+        self._bus_of = {dxl_id: i for i, (_, ids) in enumerate(self.buses) for dxl_id in ids}
+
+    def _split_ids(self, ids):
+        """IDのリストをバスごとに分ける"""
+        per_bus = [[] for _ in self.buses]
+        for dxl_id in ids:
+            bus = self._bus_of.get(dxl_id)
+            if bus is not None:
+                per_bus[bus].append(dxl_id)
+        return per_bus
+
+    def _run(self, calls):
+        """
+        バスごとの処理を各ワーカーで同時に実行し、すべての完了を待つ
+
+        Args:
+            calls: [(バス番号, 関数, 引数...), ...]
+
+        Returns:
+            各処理の戻り値のリスト
+        """
+        jobs = [self.workers[bus].submit(fn, *args) for bus, fn, *args in calls]
+        return [job.result() for job in jobs]
+
+    def enable_torques(self, ids, enable=True):
+        self._run([(i, dxl.enable_torques, bus_ids, enable)
+                   for i, ((dxl, _), bus_ids) in enumerate(zip(self.buses, self._split_ids(ids))) if bus_ids])
+
+    def set_current_limits(self, ids, current_ma):
+        self._run([(i, dxl.set_current_limits, bus_ids, current_ma)
+                   for i, ((dxl, _), bus_ids) in enumerate(zip(self.buses, self._split_ids(ids))) if bus_ids])
+
+    def set_operating_modes(self, ids, mode):
+        self._run([(i, dxl.set_operating_modes, bus_ids, mode)
+                   for i, ((dxl, _), bus_ids) in enumerate(zip(self.buses, self._split_ids(ids))) if bus_ids])
+
+    def set_goals(self, targets, mode, profiles=None):
+        """目標値を所属するバスへ振り分け、全バスへ同時に Sync Write する (profiles はIDで引くためそのまま渡す)"""
+        self._run([(i, dxl.set_goals, _BusTargets(bus_ids, targets), mode, profiles)
+                   for i, (dxl, bus_ids) in enumerate(self.buses)])
+
+    def read_state(self, ids):
+        """全バスを同時に Sync Read し、結果を1つの {ID: ServoState} にまとめる"""
+        per_bus = self._split_ids(ids)
+        states = {}
+        for result in self._run([(i, dxl.read_state, bus_ids)
+                                 for i, ((dxl, _), bus_ids) in enumerate(zip(self.buses, per_bus)) if bus_ids]):
+            states.update(result)
+        return states
+
+    def get_stats(self):
+        return [stats for dxl, _ in self.buses for stats in dxl.get_stats()]
+
+    def invalidate_cache(self, dxl_id=None):
+        for dxl, ids in self.buses:
+            if dxl_id is None or dxl_id in ids:
+                dxl.invalidate_cache(dxl_id)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        for dxl, _ in self.buses:
+            dxl.close()
+
+
+class MotorDrivers:
+    """
+    複数の DCMotorInterface をまとめたもの (DCMotorInterface と同じ使い方ができる)
+
+    PWM と有効/無効は全ドライバーに同じ値を送る。シリアルへの書き込みは OS のバッファに
+    入れるだけで応答を待たないため、ワーカースレッドは使わず順に書き込む。
+    ステータス (get_status, latest_status_time) は先頭のドライバーの値を返す。
+
+    Args:
+        drivers: DCMotorInterface のリスト
+    """
+    def __init__(self, drivers):
+        self.drivers = list(drivers)
+        self.primary = self.drivers[0]
+
+    @property
+    def latest_status_time(self):
+        return self.primary.latest_status_time
+
+    def update(self):
+        for driver in self.drivers:
+            driver.update()
+
+    def send_commands(self, pwm=None, enabled=None):
+        for driver in self.drivers:
+            driver.send_commands(pwm=pwm, enabled=enabled)
+
+    def set_motor_pwm(self, pwm):
+        for driver in self.drivers:
+            driver.set_motor_pwm(pwm)
+
+    def set_enabled(self, enabled):
+        for driver in self.drivers:
+            driver.set_enabled(enabled)
+
+    def invalidate_cache(self):
+        for driver in self.drivers:
+            driver.invalidate_cache()
+
+    def queue_segments(self, segments):
+        segments = list(segments)
+        return min(driver.queue_segments(segments) for driver in self.drivers)
+
+    def clear_segments(self):
+        for driver in self.drivers:
+            driver.clear_segments()
+
+    @property
+    def queue_depth(self):
+        """全ドライバーのうち最も少ないキューの残数 (未報告のドライバーがあれば None)"""
+        depths = [driver.queue_depth for driver in self.drivers]
+        return None if None in depths else min(depths)
+
+    def queued_segments(self):
+        return min(driver.queued_segments() for driver in self.drivers)
+
+    def queued_time(self):
+        return min(driver.queued_time() for driver in self.drivers)
+
+    def get_status(self):
+        return self.primary.get_status()
+
+    def get_statuses(self):
+        """全ドライバーの現在PWM"""
+        return [driver.get_status() for driver in self.drivers]
+
+    def get_history(self):
+        return self.primary.get_history()
+
+    def get_stats(self):
+        return [stats for driver in self.drivers for stats in driver.get_stats()]
+
+    def close(self):
+        for driver in self.drivers:
+            driver.close()
@@ -0,0 +1,87 @@
+"""
+DCSegmentStreamer: DCモーターの PWM をセグメントとして先読み送信する
+
+通常はティックごとに PWM をステップで送るため、DCモーターの動きの滑らかさはループ周期と
+USB のタイミングに左右される。コントローラーが任意の時刻の PWM を返せる (dc_pwm_at を持つ) 場合は、
+lookahead 秒先までの PWM を segment 秒ごとのランプにして MCU のキューへ送り、MCU 側で約 1 kHz で
+補間させる。ループが遅くても、先読み時間より短い停止であれば出力は途切れない。
+"""
+import time
+
+
+class DCSegmentStreamer:
+    """
+    DCモーターの PWM を MCU のセグメントキューへ送り続ける
+
+    キューが空になった場合 (ループが先読み時間以上止まった, MCU がキューを失った) は、
+    PWM の直接指令で MCU のキューを破棄してから現在時刻を起点に組み直す。
+
+    Args:
+        dc_motor: DCMotorInterface (または MotorDrivers)
+        pwm_at: 経過時間 (秒) → PWM の関数
+        lookahead: キューに積んでおく時間 (秒)
+        segment: 1セグメントの長さ (秒)
+    """
+    READY_TIMEOUT = 1.0  # キュー残数の報告がこの時間ない場合はファームウェアが非対応とみなす (秒)
+
+    def __init__(self, dc_motor, pwm_at, lookahead=0.2, segment=0.02):
+        self.dc_motor = dc_motor
+        self.pwm_at = pwm_at
+        self.lookahead = lookahead
+        self.segment = segment
+        self.active = True
+        self.segments_sent = 0
+        self.resyncs = 0
+        self._planned = None      # キューの終端に対応する経過時間 (None の場合は組み直す)
+        self._resync_time = None  # 最後に組み直した時刻 (time.monotonic)
+        self._first_elapsed = None
+
+    def write(self, elapsed, enabled=None):
+        """
+        elapsed + lookahead までのセグメントを送信する (有効/無効の切り替えも同じ書き込みで送る)
+
+        Args:
+            elapsed: 経過時間 (秒)
+            enabled: 有効/無効。None の場合は送信しない
+        """
+        dc = self.dc_motor
+        if not self.active or dc.queue_depth is None:
+            # ファームウェアがキュー残数を報告するまではステップで送る
+            if self._first_elapsed is None:
+                self._first_elapsed = elapsed
+            if self.active and elapsed - self._first_elapsed > self.READY_TIMEOUT:
+                print("Warning: Motor driver does not report segment queue depth, falling back to step PWM")
+                self.active = False
+            dc.send_commands(pwm=self.pwm_at(elapsed), enabled=enabled)
+            return
+
+        if self._planned is not None:
+            if enabled is not None or dc.queued_time() <= 0.0 or self._lost_queue():
+                self._planned = None
+                self.resyncs += 1
+        if self._planned is None:
+            # MCU のキューを破棄して現在の値から始める
+            dc.send_commands(pwm=self.pwm_at(elapsed), enabled=enabled)
+            self._planned = elapsed
+            self._resync_time = time.monotonic()
+
+        segments = []
+        t = self._planned
+        while t < elapsed + self.lookahead:
+            t += self.segment
+            segments.append((self.pwm_at(t), self.segment))
+        sent = dc.queue_segments(segments)
+        self._planned += sent * self.segment
+        self.segments_sent += sent
+
+    def _lost_queue(self):
+        """組み直してから先読み時間以上経った後のステータスで、MCU のキューが空と報告されたか"""
+        dc = self.dc_motor
+        status_time = dc.latest_status_time
+        return (dc.queue_depth == 0 and status_time is not None
+                and status_time > self._resync_time + self.lookahead)
+
+    def summary(self):
+        if not self.active:
+            return "DC stream: inactive (step PWM)"
+        return f"DC stream: {self.segments_sent} segments, {self.resyncs} resyncs"
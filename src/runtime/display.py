@@ -0,0 +1,78 @@
+"""
+StatusDisplay: 制御ループの状態を別スレッドで表示する
+
+制御スレッドは publish() で最新の状態を置くだけで、文字列の整形や端末への書き込みは
+表示スレッドが一定周期で行う。遅い端末 (SSH 越しなど) でも制御周期に影響しない。
+"""
+import queue
+import sys
+import threading
+
+
+class StatusDisplay:
+    """
+    最新の制御状態を一定周期でステータス行として表示するスレッド
+
+    Args:
+        driver_label: 表示用のモータードライバー名
+        rate_hz: 表示の更新周期 (Hz)
+        out: 出力先
+    """
+    def __init__(self, driver_label="", rate_hz=10.0, out=sys.stdout):
+        self.driver_label = driver_label.upper()
+        self.period = 1.0 / rate_hz
+        self.out = out
+        self._latest = None  # (elapsed, ControlCommand)
+        self._messages = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="status-display", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """表示スレッドを停止する (残りの表示を書き出してから戻る)"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+
+    def publish(self, elapsed, cmd):
+        """
+        最新の状態を置く (制御スレッドから呼ばれる。ブロックしない)
+
+        cmd はコントローラーが毎ティック書き換えて使い回すため、コピーせず参照だけを置く。
+        表示スレッドは整形する時点の値を表示する。
+        """
+        self._latest = (elapsed, cmd)
+
+    def message(self, text):
+        """ステータス行とは別に1行のメッセージを表示する (ブロックしない)"""
+        self._messages.put(text)
+
+    def _run(self):
+        shown = None
+        while True:
+            stopping = self._stop.wait(self.period)
+            lines = []
+            while not self._messages.empty():
+                lines.append(f"\n{self._messages.get()}")
+
+            latest = self._latest
+            if latest is not None and latest is not shown:
+                lines.append(self._format(*latest))
+                shown = latest
+
+            if lines:
+                self.out.write("".join(lines))
+                self.out.flush()
+            if stopping:
+                if shown is not None:
+                    # ステータス行の後に続く出力が同じ行に書かれないよう改行しておく
+                    self.out.write("\n")
+                    self.out.flush()
+                return
+
+    def _format(self, elapsed, cmd):
+        mode_str = 'ExtPos' if cmd.dxl_mode == 4 else ('Pos' if cmd.dxl_mode == 3 else 'Vel')
+        target_str = ", ".join([f"{id}:{val}" for id, val in cmd.dxl_targets.items()])
+        return f"\rTime: {elapsed:.2f} | {self.driver_label}: {cmd.dc_pwm:4d} | DXLs({mode_str}): {target_str}"
@@ -0,0 +1,22 @@
+"""
+BusWorker: バスごとのI/O専用スレッド
+
+U2D2 (Dynamixel) と Pico/R4 (DCモーター) は別々のUSBデバイスなので、それぞれの
+書き込みを専用スレッドで同時に行えば、1ティックのI/O時間は両者の和ではなく最大値になる。
+各バスへのアクセスは常に同じスレッドから順番に行われるため、インターフェース側の排他は不要。
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BusWorker:
+    """1つのバスへのI/Oを直列に実行するワーカースレッド"""
+    def __init__(self, name):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"io-{name}")
+
+    def submit(self, fn, *args):
+        """fn(*args) をワーカースレッドで実行する Future を返す"""
+        return self._executor.submit(fn, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
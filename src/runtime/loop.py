@@ -0,0 +1,198 @@
+"""
+ControlLoop: 制御ループ1ティック分の処理
+
+ステータス読み取り → コントローラー → Dynamixel/DCモーター出力 → 表示スレッドへの受け渡し → テレメトリ記録 の流れをまとめる。
+main() の実行ループとベンチマークの両方から同じ処理を使う。
+"""
+import time
+from hardware.bus_stats import format_report
+from runtime.io_worker import BusWorker
+from runtime.profiling import NullTimer
+
+
+def sync_controller(controller, read_state, dxl_ids, position_min, position_max):
+    """
+    コントローラーを現在のサーボ位置に同期し、位置制限を設定する
+
+    Args:
+        controller: コントローラー
+        read_state: 現在の状態 ({ID: ServoState}) を返す関数 (同期が必要な場合のみ呼ぶ)
+    """
+    # キーボードモードの場合、現在位置に同期＆位置制限を設定
+    if hasattr(controller, 'set_initial_position'):
+        # すべてのIDの現在位置を取得して同期
+        states = read_state()
+        initial_positions = {dxl_id: states[dxl_id].position if dxl_id in states else 0 for dxl_id in dxl_ids}
+
+        controller.set_initial_position(initial_positions)
+        print(f"Synced to current positions: {initial_positions}")
+    if hasattr(controller, 'set_position_limits'):
+        controller.set_position_limits(position_min, position_max)
+        print(f"Position limits: [{position_min}, {position_max}]")
+
+
+class ControlLoop:
+    """
+    コントローラーとハードウェアを接続する制御ループ
+
+    Args:
+        controller: update(elapsed, dxl_state) を持つコントローラー
+        dxl: DynamixelInterface
+        dc_motor: DCMotorInterface
+        dxl_ids: Dynamixel IDのリスト
+        display: 状態を表示する StatusDisplay (Noneの場合は表示しない)
+        timer: ステージごとの所要時間を記録するタイマー (StageTimer)
+        parallel_io: True の場合、Dynamixel と DCモーターへの書き込みをバスごとの
+                     ワーカースレッドで同時に行い、両方の完了を待ってティックを終える
+        recorder: 毎ティックのテレメトリを記録する TelemetryRecorder (Noneの場合は記録しない)
+        stats_interval: バスの通信統計を表示する間隔 (秒, None の場合は終了時のみ)
+        dc_stream: DCモーターの PWM をセグメントとして先読み送信する DCSegmentStreamer
+                   (None の場合はティックごとに PWM をステップで送る)
+    """
+    def __init__(self, controller, dxl, dc_motor, dxl_ids, display=None, timer=None, parallel_io=False,
+                 recorder=None, stats_interval=None, dc_stream=None):
+        self.controller = controller
+        self.dxl = dxl
+        self.dc_motor = dc_motor
+        self.dxl_ids = list(dxl_ids)
+        self.display = display
+        self.recorder = recorder
+        self.dc_stream = dc_stream
+        self.timer = timer if timer is not None else NullTimer()
+        self.last_mode = None
+        self.stats_interval = stats_interval
+        self._next_stats = stats_interval
+        # 書き込み完了時刻を受け取るコントローラー (キー入力の遅延計測)
+        self._actuated = getattr(controller, 'actuated', None)
+
+        self.workers = None
+        if parallel_io:
+            self.workers = (BusWorker("dxl"), BusWorker("dc"))
+
+    def setup(self, current_limit_ma, position_min, position_max):
+        """トルク有効化・電流制限の設定と、コントローラーの初期位置・位置制限の同期"""
+        dxl = self.dxl
+        # 全IDへまとめて送信 (IDごとの書き込み+応答待ちをしない)
+        dxl.enable_torques(self.dxl_ids, True)
+        dxl.set_current_limits(self.dxl_ids, current_limit_ma)
+        print(f"Torque enabled and current limit set to {current_limit_ma} mA for IDs: {self.dxl_ids}")
+
+        sync_controller(self.controller, lambda: dxl.read_state(self.dxl_ids), self.dxl_ids, position_min, position_max)
+
+    def tick(self, elapsed):
+        """
+        1ティック分の処理を行う
+
+        Args:
+            elapsed: 経過時間 (秒)
+
+        Returns:
+            ControlCommand: コントローラーが出力したコマンド (コントローラーが None を返した場合は None)
+        """
+        dxl, dc_motor, timer = self.dxl, self.dc_motor, self.timer
+        timer.begin()
+
+        # --- ステータス読み取り ---
+        dc_motor.update()
+        timer.lap('dc_update')
+        dxl_state = dxl.read_state(self.dxl_ids)
+        timer.lap('dxl_read')
+
+        # --- 目標値計算 (コントローラーに委譲) ---
+        cmd = self.controller.update(elapsed, dxl_state)
+        timer.lap('controller')
+        if cmd is None:
+            # まだ指令がない (別プロセスのコントローラーの起動待ちなど): 状態の読み取りだけ行う
+            timer.end()
+            return None
+
+        if cmd.enable is not None and self.display is not None:
+            self.display.message(f"Setting Motors: {'ENABLED' if cmd.enable else 'DISABLED'}")
+
+        if self.workers is not None:
+            # 両バスへ同時に書き込み、ティックごとに1回だけ同期する
+            dxl_job = self.workers[0].submit(self._write_dxl, cmd)
+            dc_job = self.workers[1].submit(self._write_dc, cmd, elapsed)
+            timer.record('dxl_write', dxl_job.result())
+            timer.record('dc_write', dc_job.result())
+            timer.lap('io_write')
+        else:
+            self._write_dxl(cmd)
+            timer.lap('dxl_write')
+            self._write_dc(cmd, elapsed)
+            timer.lap('dc_write')
+        if self._actuated is not None:
+            self._actuated(time.monotonic())
+
+        # Log (表示スレッドに最新状態を渡すだけで、端末への書き込みは待たない)
+        if self.display is not None:
+            self.display.publish(elapsed, cmd)
+        timer.lap('display')
+
+        if self.recorder is not None:
+            self.recorder.record(elapsed, cmd, dxl_state, dc_motor.get_status(), dc_motor.latest_status_time)
+            timer.lap('record')
+
+        timer.end()
+
+        if self.stats_interval and elapsed >= self._next_stats:
+            self._next_stats = elapsed + self.stats_interval
+            self._report_stats()
+        return cmd
+
+    def _report_stats(self):
+        report = self.stats_report()
+        if self.display is not None:
+            self.display.message(report)
+        else:
+            print(report)
+
+    def stats_report(self):
+        """全バス・全モータードライバーの通信統計を表示用の文字列にする"""
+        return format_report(self.dxl.get_stats() + self.dc_motor.get_stats())
+
+    def _write_dxl(self, cmd):
+        """Dynamixelへの出力 (モード切替・目標値・トルク)。所要時間 (秒) を返す"""
+        start = time.perf_counter()
+        dxl = self.dxl
+
+        # モード変更時のみ設定
+        if cmd.dxl_mode != self.last_mode:
+            dxl.set_operating_modes(cmd.dxl_targets, cmd.dxl_mode)
+            self.last_mode = cmd.dxl_mode
+
+        # 全IDの目標値を1パケットで送信
+        dxl.set_goals(cmd.dxl_targets, cmd.dxl_mode, cmd.profiles)
+        cmd.dxl_targets.clear_dirty()
+
+        # Enable/Disable 制御
+        if cmd.enable is not None:
+            dxl.enable_torques(self.dxl_ids, cmd.enable)
+        return time.perf_counter() - start
+
+    def _write_dc(self, cmd, elapsed):
+        """DCモーターへの出力。所要時間 (秒) を返す"""
+        start = time.perf_counter()
+        # 有効/無効の切り替えも同じ書き込みで送信
+        if self.dc_stream is not None:
+            self.dc_stream.write(elapsed, enabled=cmd.enable)
+        else:
+            self.dc_motor.send_commands(pwm=cmd.dc_pwm, enabled=cmd.enable)
+        return time.perf_counter() - start
+
+    def shutdown(self):
+        """モーターを停止し、ハードウェア接続を閉じる"""
+        if self.workers is not None:
+            for worker in self.workers:
+                worker.close()
+        # 停止指令はシャドウコピーに関係なく必ず送信する
+        self.dc_motor.invalidate_cache()
+        self.dc_motor.set_motor_pwm(0)
+        self.dxl.enable_torques(self.dxl_ids, False)
+        print(f"\n{self.stats_report()}")
+        if self.dc_stream is not None:
+            print(self.dc_stream.summary())
+        self.dxl.close()
+        self.dc_motor.close()
+        if self.recorder is not None:
+            self.recorder.close()
@@ -0,0 +1,74 @@
+"""
+StageTimer: 制御ループの各ステージの所要時間を記録する
+"""
+import time
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """ソート済みリストのpパーセンタイル (最近傍法)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class StageTimer:
+    """
+    ティック内のステージごとの所要時間を記録するタイマー
+
+    使用例:
+        timer.begin()
+        ...            # ステージ1の処理
+        timer.lap('read')
+        ...            # ステージ2の処理
+        timer.lap('write')
+        timer.end()    # ティック全体 ('total') を記録
+    """
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self._tick_start = 0.0
+        self._last = 0.0
+
+    def begin(self):
+        self._tick_start = self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.samples.setdefault(stage, []).append(now - self._last)
+        self._last = now
+
+    def end(self):
+        self.samples.setdefault('total', []).append(time.perf_counter() - self._tick_start)
+
+    def record(self, stage: str, seconds: float):
+        """別スレッドで計測した所要時間を記録する"""
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """ステージごとの p50/p95/p99/max/mean (ms)"""
+        result = {}
+        for stage, values in self.samples.items():
+            ordered = sorted(values)
+            result[stage] = {
+                'p50_ms': percentile(ordered, 50) * 1000,
+                'p95_ms': percentile(ordered, 95) * 1000,
+                'p99_ms': percentile(ordered, 99) * 1000,
+                'max_ms': ordered[-1] * 1000,
+                'mean_ms': sum(ordered) / len(ordered) * 1000,
+            }
+        return result
+
+
+class NullTimer:
+    """計測しない場合に使うタイマー (何もしない)"""
+    def begin(self):
+        pass
+
+    def lap(self, stage: str):
+        pass
+
+    def end(self):
+        pass
+
+    def record(self, stage: str, seconds: float):
+        pass
@@ -0,0 +1,173 @@
+"""
+TelemetryRecorder: 毎ティックの指令値とフィードバックをメモリマップファイルに記録する
+
+固定長レコード (NumPy 構造化配列) を事前に確保した .npy ファイルにリングバッファとして書き込む。
+1ティックあたりの処理は1レコード分のメモリコピーのみで、ファイルへの書き出しは OS のページキャッシュに任せる。
+容量に達すると最も古いレコードから上書きするため、長時間の実行でもファイルサイズと RAM は一定。
+
+レコードの形式 (N = Dynamixel ID数):
+    seq           uint64   通し番号 (1から。0は未使用のレコード)
+    t             float64  記録時刻 (time.monotonic)
+    elapsed       float64  コントローラーに渡した経過時間 (秒)
+    dc_pwm        int16    DCモーターPWM指令
+    dxl_mode      uint8    Dynamixelモード
+    enable        int8     有効化指令 (-1: なし, 0: 無効, 1: 有効)
+    targets       int32[N] IDごとの目標値
+    dc_status     int16    モータードライバーが報告した現在のPWM (get_status)
+    dc_status_age float32  最後にステータスを受信してからの時間 (秒, 未受信は NaN)
+    position      int32[N] Present Position
+    velocity      int32[N] Present Velocity
+    current       int16[N] Present Current
+    valid         bool[N]  サーボのフィードバックを取得できたかどうか
+
+ID の並びは同名の .json ファイルに保存する。記録後は load_recording() でゼロコピーに読み込める。
+"""
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+
+def record_dtype(num_ids):
+    """N個のID用のレコード型"""
+    return np.dtype([
+        ('seq', '<u8'),
+        ('t', '<f8'),
+        ('elapsed', '<f8'),
+        ('dc_pwm', '<i2'),
+        ('dxl_mode', 'u1'),
+        ('enable', 'i1'),
+        ('targets', '<i4', (num_ids,)),
+        ('dc_status', '<i2'),
+        ('dc_status_age', '<f4'),
+        ('position', '<i4', (num_ids,)),
+        ('velocity', '<i4', (num_ids,)),
+        ('current', '<i2', (num_ids,)),
+        ('valid', '?', (num_ids,)),
+    ])
+
+
+class TelemetryRecorder:
+    """
+    リングバッファ形式のテレメトリ記録
+
+    Args:
+        path: 出力する .npy ファイルのパス (None の場合はメモリ上にのみ記録する)
+        dxl_ids: Dynamixel IDのリスト (レコード内の並び順)
+        capacity: 保持するレコード数 (これを超えると古いものから上書き)
+    """
+    def __init__(self, path, dxl_ids, capacity):
+        self.path = path
+        self.dxl_ids = list(dxl_ids)
+        self.capacity = capacity
+        self.count = 0
+
+        dtype = record_dtype(len(self.dxl_ids))
+        if path is None:
+            self._records = np.zeros(capacity, dtype=dtype)
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._records = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(capacity,))
+            _write_meta(path, self.dxl_ids, capacity)
+        # 1レコード分の作業領域 (フィールドごとにメモリマップへ書くとページ参照が増えるため、まとめて1回コピーする)
+        self._scratch = np.zeros(1, dtype=dtype)
+        self._row = self._scratch[0]
+
+    def record(self, elapsed, cmd, dxl_state, dc_status, dc_status_time=None):
+        """
+        1ティック分のレコードを書き込む
+
+        Args:
+            elapsed: 経過時間 (秒)
+            cmd: ControlCommand
+            dxl_state: read_state() の結果 ({ID: ServoState})
+            dc_status: DCMotorInterface.get_status() の値
+            dc_status_time: 最後にステータスを受信した時刻 (time.monotonic, 未受信は None)
+        """
+        now = time.monotonic()
+        row = self._row
+        self.count += 1
+        row['seq'] = self.count
+        row['t'] = now
+        row['elapsed'] = elapsed
+        row['dc_pwm'] = cmd.dc_pwm
+        row['dxl_mode'] = cmd.dxl_mode
+        row['enable'] = -1 if cmd.enable is None else int(cmd.enable)
+        row['dc_status'] = dc_status or 0
+        row['dc_status_age'] = math.nan if dc_status_time is None else now - dc_status_time
+
+        targets, position, velocity, current, valid = (
+            row['targets'], row['position'], row['velocity'], row['current'], row['valid'])
+        dxl_targets = cmd.dxl_targets
+        for i, dxl_id in enumerate(self.dxl_ids):
+            targets[i] = dxl_targets.get(dxl_id, 0)
+            state = dxl_state.get(dxl_id) if dxl_state else None
+            if state is None:
+                valid[i] = False
+                continue
+            position[i] = state.position
+            velocity[i] = state.velocity
+            current[i] = state.current
+            valid[i] = True
+
+        self._records[(self.count - 1) % self.capacity] = row
+
+    def records(self):
+        """記録済みのレコードを古い順に返す"""
+        return _ordered(self._records, self.count)
+
+    def close(self):
+        """未書き込みのページをファイルへ反映して閉じる"""
+        if self._records is None or self.path is None:
+            return
+        self._records.flush()
+        self._records = None
+        print(f"Telemetry: {min(self.count, self.capacity)} records -> {self.path}")
+
+
+def meta_path(path):
+    """記録ファイルに付随するメタデータ (.json) のパス"""
+    return os.path.splitext(path)[0] + '.json'
+
+
+def _write_meta(path, dxl_ids, capacity):
+    with open(meta_path(path), 'w') as f:
+        json.dump({'dxl_ids': list(dxl_ids), 'capacity': capacity}, f)
+
+
+def _ordered(records, count):
+    if count <= len(records):
+        return records[:count]
+    # 一周している場合は最も古いレコードから並べ直す (この場合のみコピーが発生する)
+    head = count % len(records)
+    return np.concatenate((records[head:], records[:head]))
+
+
+def save_recording(path, records, dxl_ids):
+    """レコード配列を load_recording() で読み込める形式で保存する"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.save(path, records)
+    _write_meta(path, dxl_ids, len(records))
+
+
+def load_recording(path):
+    """
+    記録したテレメトリを読み込む
+
+    Returns:
+        (records, dxl_ids): 古い順に並んだレコード配列と ID のリスト。
+        リングバッファが一周していなければファイルのメモリマップをそのまま (ゼロコピーで) 返す。
+    """
+    records = np.load(path, mmap_mode='r')
+    with open(meta_path(path)) as f:
+        dxl_ids = json.load(f)['dxl_ids']
+
+    seq = records['seq']
+    count = int(seq.max()) if len(seq) else 0
+    return _ordered(records, count), dxl_ids
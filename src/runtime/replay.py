@@ -0,0 +1,208 @@
+"""
+リプレイ: ハードウェアなし・待ち時間なしでコントローラーを実行し、出力を比較する
+
+使用方法:
+    python src/main.py replay [controller] [--telemetry FILE] [--keys FILE] [--duration S] [--rate HZ]
+                              [--golden FILE] [--save FILE]
+
+入力 (タイムスタンプ列):
+    --telemetry を指定した場合は記録したテレメトリ (runtime.recorder) の経過時間とサーボの現在値を、
+    指定しない場合は --rate 周期の等間隔な時刻を --duration 秒分使う。
+キー入力:
+    キーボードコントローラーには --keys のキー列を与える。テレメトリ記録時に保存された
+    キー履歴 (<記録ファイル名>.keys) があれば自動的に使う。
+比較:
+    出力したコマンド列 (PWM・モード・有効化・IDごとの目標値) を --golden の記録と比較し、
+    最初に食い違ったティックを報告する。テレメトリ自体も golden として使える。
+    --save で今回のコマンド列を golden として保存する。
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from hardware.dxl_interface import ServoState
+from runtime.recorder import TelemetryRecorder, load_recording, save_recording
+
+COMPARE_FIELDS = ('dc_pwm', 'dxl_mode', 'enable', 'targets')
+KEY_NAMES = {' ': 'space'}
+
+
+def keys_path(telemetry_path):
+    """テレメトリに付随するキー履歴のパス"""
+    return os.path.splitext(telemetry_path)[0] + '.keys'
+
+
+def save_keys(path, key_log):
+    """キー履歴を '<経過時間> <キー>' の行で保存する"""
+    with open(path, 'w') as f:
+        for elapsed, key in key_log:
+            f.write(f"{elapsed!r} {KEY_NAMES.get(key, key)}\n")
+
+
+def load_keys(path):
+    """キー履歴を [(経過時間, キー), ...] で読み込む ('#' 以降はコメント)"""
+    names = {name: key for key, name in KEY_NAMES.items()}
+    keys = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            t, key = line.split(maxsplit=1)
+            keys.append((float(t), names.get(key, key)))
+    keys.sort(key=lambda item: item[0])
+    return keys
+
+
+class ScriptedKeys:
+    """
+    キー履歴を時刻順に返すキー入力元 (KeyboardController の key_source)
+
+    実際の端末と同じく1回の呼び出しで1キーだけ返す。now より後のキーはまだ返さない。
+    """
+    def __init__(self, keys):
+        self._keys = keys
+        self._index = 0
+        self.now = 0.0
+
+    def __call__(self):
+        if self._index < len(self._keys) and self._keys[self._index][0] <= self.now:
+            key = self._keys[self._index][1]
+            self._index += 1
+            return key
+        return None
+
+
+def _states_from_records(records, dxl_ids):
+    """記録したサーボの現在値を read_state() と同じ形式で1ティックずつ返す"""
+    position, velocity, current, valid = (records['position'], records['velocity'],
+                                          records['current'], records['valid'])
+    for n in range(len(records)):
+        yield {dxl_id: ServoState(int(position[n, i]), int(velocity[n, i]), int(current[n, i]))
+               for i, dxl_id in enumerate(dxl_ids) if valid[n, i]}
+
+
+def replay(controller, dxl_ids, timeline, states=None, keys=None):
+    """
+    コントローラーをタイムスタンプ列に沿って実行する (待ち時間なし)
+
+    Args:
+        controller: update(elapsed, dxl_state) を持つコントローラー
+        dxl_ids: Dynamixel IDのリスト
+        timeline: 各ティックの経過時間 (秒)
+        states: 各ティックにコントローラーへ渡すサーボ状態 (None の場合は渡さない)
+        keys: コントローラーに設定した ScriptedKeys (時刻を進めるため)
+
+    Returns:
+        numpy.ndarray: 出力したコマンド列 (runtime.recorder のレコード形式)
+    """
+    recorder = TelemetryRecorder(None, dxl_ids, len(timeline))
+    states = iter(states) if states is not None else None
+    for elapsed in timeline:
+        elapsed = float(elapsed)
+        dxl_state = next(states) if states is not None else None
+        if keys is not None:
+            keys.now = elapsed
+        cmd = controller.update(elapsed, dxl_state)
+        recorder.record(elapsed, cmd, dxl_state, None)
+        if not controller.should_continue():
+            break
+    return recorder.records()
+
+
+def compare(golden, result):
+    """
+    コマンド列を比較する
+
+    Returns:
+        str | None: 最初の食い違いの説明 (一致した場合は None)
+    """
+    for n in range(min(len(golden), len(result))):
+        for field in COMPARE_FIELDS:
+            expected, actual = golden[field][n], result[field][n]
+            if not np.array_equal(expected, actual):
+                return (f"tick {n} (t={golden['elapsed'][n]:.3f}): {field} "
+                        f"expected {expected.tolist()}, got {actual.tolist()}")
+    if len(golden) != len(result):
+        return f"length differs: expected {len(golden)} ticks, got {len(result)}"
+    return None
+
+
+def parse_args(argv, config):
+    parser = argparse.ArgumentParser(prog="main.py replay", description="コントローラーのリプレイと比較")
+    parser.add_argument("controller", nargs="?", default="test", help="使用するコントローラー (default: test)")
+    parser.add_argument("--telemetry", default=None, help="入力に使うテレメトリ記録 (.npy)")
+    parser.add_argument("--keys", default=None, help="キーボードコントローラーに与えるキー履歴")
+    parser.add_argument("--duration", type=float, default=60.0, help="等間隔入力の長さ (秒, default: 60)")
+    parser.add_argument("--rate", type=float, default=config.control.loop_rate_hz,
+                        help="等間隔入力の周波数 (default: control.loop_rate_hz)")
+    parser.add_argument("--golden", default=None, help="比較対象のコマンド列 (.npy)")
+    parser.add_argument("--save", default=None, help="今回のコマンド列を保存する (.npy)")
+    return parser.parse_args(argv)
+
+
+def run_replay(config, argv, make_controller):
+    """
+    リプレイを実行する
+
+    Args:
+        config: AppConfig
+        argv: コマンドライン引数 (replay 以降)
+        make_controller: (name, ids, key_source) からコントローラーを生成する関数
+
+    Returns:
+        int: 終了コード (golden と一致しなければ 1)
+    """
+    args = parse_args(argv, config)
+
+    dxl_ids = config.dynamixel.ids
+    states = None
+    if args.telemetry:
+        records, dxl_ids = load_recording(args.telemetry)
+        timeline = records['elapsed']
+        states = _states_from_records(records, dxl_ids)
+    else:
+        timeline = np.arange(int(args.duration * args.rate)) / args.rate
+
+    keys = None
+    key_file = args.keys
+    if key_file is None and args.telemetry and os.path.exists(keys_path(args.telemetry)):
+        key_file = keys_path(args.telemetry)
+    if args.controller == 'keyboard':
+        keys = ScriptedKeys(load_keys(key_file) if key_file else [])
+
+    controller = make_controller(args.controller, dxl_ids, key_source=keys)
+    if hasattr(controller, 'set_initial_position') and args.telemetry and len(records):
+        # 記録開始時の現在位置に同期 (ControlLoop.setup と同じ)
+        first = records[0]
+        controller.set_initial_position({dxl_id: int(first['position'][i]) for i, dxl_id in enumerate(dxl_ids)})
+    if hasattr(controller, 'set_position_limits'):
+        controller.set_position_limits(config.control.position_min, config.control.position_max)
+
+    start = time.perf_counter()
+    try:
+        result = replay(controller, dxl_ids, timeline, states, keys)
+    finally:
+        if hasattr(controller, 'cleanup'):
+            controller.cleanup()
+    duration = time.perf_counter() - start
+    rate = len(result) / duration if duration > 0 else float('inf')
+    print(f"[replay] {args.controller}: {len(result)} ticks in {duration * 1000:.1f} ms ({rate:.0f} ticks/s)")
+
+    if args.save:
+        save_recording(args.save, result, dxl_ids)
+        print(f"[replay] saved {args.save}")
+
+    if args.golden:
+        golden, golden_ids = load_recording(args.golden)
+        if list(golden_ids) != list(dxl_ids):
+            print(f"[replay] MISMATCH: golden IDs {golden_ids} != {dxl_ids}")
+            return 1
+        diff = compare(golden, result)
+        if diff is not None:
+            print(f"[replay] MISMATCH: {diff}")
+            return 1
+        print(f"[replay] OK: {len(result)} ticks match {args.golden}")
+    return 0
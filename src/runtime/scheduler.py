@@ -0,0 +1,146 @@
+"""
+LoopScheduler: 絶対デッドライン方式の固定周期スケジューラ
+
+sleep(周期) を処理の後に入れる方式では、実周期が「処理時間 + sleep」になり
+バスのレイテンシ変動に応じてずれていく。本スケジューラは単調増加クロック上の
+絶対デッドラインに合わせて待機するため、処理時間に関係なく周期が保たれる。
+
+wake() を呼ぶと待機中のティックを前倒しで実行する (緊急のキー入力など)。
+前倒しのティックはデッドラインを変えず、周期の統計にも含めない。
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class LoopStats:
+    """ループ周期の統計"""
+    ticks: int = 0
+    overruns: int = 0        # 処理が周期内に終わらなかった回数
+    skipped: int = 0         # 追いつけずに捨てたティック数
+    period_sum: float = 0.0
+    period_min: float = float('inf')
+    period_max: float = 0.0
+    jitter_sum: float = 0.0  # デッドラインからの遅れ (秒)
+    jitter_max: float = 0.0
+    wakeups: int = 0         # wake() で前倒しに実行したティック数
+    first_tick: float = 0.0
+    last_tick: float = 0.0
+
+    @property
+    def mean_period(self) -> float:
+        return self.period_sum / (self.ticks - 1) if self.ticks > 1 else 0.0
+
+    @property
+    def mean_jitter(self) -> float:
+        return self.jitter_sum / self.ticks if self.ticks else 0.0
+
+    @property
+    def achieved_rate_hz(self) -> float:
+        duration = self.last_tick - self.first_tick
+        return (self.ticks - 1) / duration if self.ticks > 1 and duration > 0 else 0.0
+
+    def summary(self) -> str:
+        if self.ticks < 2:
+            return f"ticks: {self.ticks}"
+        return (f"ticks: {self.ticks} | rate: {self.achieved_rate_hz:.1f} Hz | "
+                f"period: mean {self.mean_period * 1000:.2f} / min {self.period_min * 1000:.2f} / max {self.period_max * 1000:.2f} ms | "
+                f"jitter: mean {self.mean_jitter * 1000:.2f} / max {self.jitter_max * 1000:.2f} ms | "
+                f"overruns: {self.overruns} | skipped: {self.skipped}"
+                + (f" | wakeups: {self.wakeups}" if self.wakeups else ""))
+
+
+class LoopScheduler:
+    """
+    単調増加クロック上の絶対デッドラインで周期実行を行うスケジューラ
+
+    使用例:
+        scheduler = LoopScheduler(100)
+        scheduler.start()
+        while running:
+            elapsed = scheduler.wait()
+            ...
+
+    overrun_policy:
+        skip     - 周期を超過した場合、過ぎたデッドラインを捨てて次の周期に合わせる
+        catch_up - 過ぎたデッドラインの分を待たずに連続実行して追いつく
+                   (max_catch_up ティック以上遅れた場合は skip と同様に再同期)
+    """
+    SPIN_THRESHOLD = 0.0005  # デッドライン直前はsleepの粒度を避けてビジーウェイト (秒)
+
+    def __init__(self, rate_hz: float, overrun_policy: str = "skip", max_catch_up: int = 5):
+        if rate_hz <= 0:
+            raise ValueError(f"Invalid loop rate: {rate_hz}")
+        if overrun_policy not in ("skip", "catch_up"):
+            raise ValueError(f"Unknown overrun policy: {overrun_policy}")
+        self.period = 1.0 / rate_hz
+        self.overrun_policy = overrun_policy
+        self.max_catch_up = max_catch_up
+        self.stats = LoopStats()
+        self._start_time = 0.0
+        self._next_deadline = 0.0
+        self._last_tick = None
+        self._wake = threading.Event()
+
+    def wake(self):
+        """待機中の wait() を直ちに返す (他のスレッドから呼べる)"""
+        self._wake.set()
+
+    def start(self):
+        """スケジューラを開始する (最初のティックは即時実行)"""
+        self._start_time = time.monotonic()
+        self._next_deadline = self._start_time
+        self._last_tick = None
+        self._wake.clear()
+        self.stats = LoopStats()
+
+    def wait(self) -> float:
+        """
+        次のデッドラインまで待機する
+
+        Returns:
+            float: 開始からの経過時間 (秒)
+        """
+        deadline = self._next_deadline
+        now = time.monotonic()
+
+        if now < deadline:
+            remaining = deadline - now
+            if remaining > self.SPIN_THRESHOLD and self._wake.wait(remaining - self.SPIN_THRESHOLD):
+                # 前倒しのティック: 次のデッドラインはそのまま
+                self._wake.clear()
+                self.stats.wakeups += 1
+                return time.monotonic() - self._start_time
+            while time.monotonic() < deadline:
+                pass
+            now = time.monotonic()
+        elif self._last_tick is not None:
+            # デッドライン超過: 1周期以上遅れた分はポリシーに従って追いつく or 捨てる
+            self.stats.overruns += 1
+            missed = int((now - deadline) / self.period)
+            if missed and (self.overrun_policy == "skip" or missed > self.max_catch_up):
+                deadline += missed * self.period
+                self.stats.skipped += missed
+
+        # このティックで処理されるため、待機中以外に届いた wake() は捨てる
+        self._wake.clear()
+        self._record(now, deadline)
+        self._next_deadline = deadline + self.period
+        return now - self._start_time
+
+    def _record(self, now: float, deadline: float):
+        stats = self.stats
+        if self._last_tick is None:
+            stats.first_tick = now
+        else:
+            period = now - self._last_tick
+            stats.period_sum += period
+            stats.period_min = min(stats.period_min, period)
+            stats.period_max = max(stats.period_max, period)
+        jitter = now - deadline
+        stats.jitter_sum += jitter
+        stats.jitter_max = max(stats.jitter_max, jitter)
+        stats.ticks += 1
+        stats.last_tick = now
+        self._last_tick = now
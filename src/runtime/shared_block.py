@@ -0,0 +1,144 @@
+"""
+共有メモリ上の seqlock ブロック: プロセス間で「最新の値」を1つだけ受け渡す
+
+書き込み側 (1プロセスのみ): 通し番号を奇数にする → 値を書く → 通し番号を偶数にする
+読み込み側: 偶数の通し番号を読む → 値を読む → 通し番号が変わっていなければ採用、変わっていれば読み直す
+
+どちらもロックを取らないため、読み込み側が遅れても書き込み側 (I/Oプロセス) が待たされることはない。
+"""
+import math
+import struct
+import time
+from multiprocessing import shared_memory
+
+from hardware.dxl_interface import ServoState
+
+_SEQ = struct.Struct('<Q')
+READ_TIMEOUT = 0.05  # 書き込み途中のまま通し番号が変わらない場合 (書き込み側の異常終了) の打ち切り時間 (秒)
+
+
+class SeqlockBlock:
+    """
+    固定レイアウトの値を1つ保持する共有メモリブロック
+
+    Args:
+        layout: 値のレイアウト (struct.Struct)
+        name: 既存ブロックの名前 (None の場合は新規作成し、close() で削除する)
+    """
+    def __init__(self, layout, name=None):
+        self.layout = layout
+        self._owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self._owner, size=_SEQ.size + layout.size)
+        self._seq = _SEQ.unpack_from(self.shm.buf, 0)[0] & ~1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, values):
+        buf = self.shm.buf
+        seq = self._seq
+        _SEQ.pack_into(buf, 0, seq + 1)
+        self.layout.pack_into(buf, _SEQ.size, *values)
+        self._seq = seq + 2
+        _SEQ.pack_into(buf, 0, seq + 2)
+
+    def read(self):
+        """
+        最新の値を読む
+
+        Returns:
+            (通し番号, 値のタプル): まだ書き込まれていない場合・読めなかった場合の値は None
+        """
+        buf = self.shm.buf
+        deadline = None
+        while True:
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            if seq == 0:
+                return 0, None
+            if not seq & 1:
+                values = self.layout.unpack_from(buf, _SEQ.size)
+                if _SEQ.unpack_from(buf, 0)[0] == seq:
+                    return seq, values
+            # 書き込み中 (通常は数 µs で終わる)
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + READ_TIMEOUT
+            elif now > deadline:
+                return seq, None
+            time.sleep(0)
+
+    def close(self):
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+class CommandBlock(SeqlockBlock):
+    """
+    コントローラー → I/Oプロセスの制御コマンド
+
+    レイアウト: 書き込み時刻, PWM, モード, 有効化 (-1/0/1), 有効化の通し番号, 停止要求, IDごとの目標値,
+               IDごとの Profile Velocity / Profile Acceleration
+    有効化は「切り替えの指示」なので、通し番号が変わったときだけ I/O プロセスが実行する。
+    """
+    def __init__(self, dxl_ids, name=None):
+        self.num_ids = len(dxl_ids)
+        n = self.num_ids
+        super().__init__(struct.Struct(f'<diibIB{n}q{n}q{n}q'), name)
+
+    def write_command(self, cmd, enable, enable_seq, stop=False):
+        self.write((time.monotonic(), cmd.dc_pwm, cmd.dxl_mode, enable, enable_seq, stop, *cmd.dxl_targets.values,
+                    *cmd.profile_velocity.values, *cmd.profile_acceleration.values))
+
+    def read_command(self):
+        """
+        (書き込み時刻, PWM, モード, 有効化, 有効化の通し番号, 停止要求, 目標値のタプル,
+         Profile Velocity のタプル, Profile Acceleration のタプル) または None
+        """
+        _, values = self.read()
+        if values is None:
+            return None
+        n = self.num_ids
+        return values[:6] + (values[6:6 + n], values[6 + n:6 + 2 * n], values[6 + 2 * n:])
+
+
+class StateBlock(SeqlockBlock):
+    """
+    I/Oプロセス → コントローラーのハードウェア状態
+
+    レイアウト: 書き込み時刻, ティック数, DCモーターの現在PWM, ステータス受信時刻 (未受信は NaN),
+               IDごとの Present Position / Velocity / Current, Moving (-1: 未取得), 取得できたかどうか
+    """
+    def __init__(self, dxl_ids, name=None):
+        self.dxl_ids = list(dxl_ids)
+        n = len(self.dxl_ids)
+        super().__init__(struct.Struct(f'<dQid{n}i{n}i{n}h{n}b{n}B'), name)
+
+    def write_state(self, tick, dxl_state, dc_status, dc_status_time):
+        ids = self.dxl_ids
+        states = [dxl_state.get(dxl_id) if dxl_state else None for dxl_id in ids]
+        self.write((
+            time.monotonic(), tick, dc_status or 0, math.nan if dc_status_time is None else dc_status_time,
+            *(s.position if s else 0 for s in states),
+            *(s.velocity if s else 0 for s in states),
+            *(s.current if s else 0 for s in states),
+            *(-1 if s is None or s.moving is None else int(s.moving) for s in states),
+            *(s is not None for s in states),
+        ))
+
+    def read_state(self):
+        """
+        Returns:
+            (ティック数, {ID: ServoState}, DCモーターの現在PWM): 未受信の場合は None
+        """
+        _, values = self.read()
+        if values is None:
+            return None
+        n = len(self.dxl_ids)
+        tick, dc_status = values[1], values[2]
+        pos, vel, cur = values[4:4 + n], values[4 + n:4 + 2 * n], values[4 + 2 * n:4 + 3 * n]
+        moving, valid = values[4 + 3 * n:4 + 4 * n], values[4 + 4 * n:]
+        dxl_state = {dxl_id: ServoState(pos[i], vel[i], cur[i], None if moving[i] < 0 else moving[i] != 0)
+                     for i, dxl_id in enumerate(self.dxl_ids) if valid[i]}
+        return tick, dxl_state, dc_status
@@ -0,0 +1,214 @@
+"""
+2プロセス構成: コントローラーとハードウェアI/Oを別プロセスで実行する
+
+    コントローラープロセス (main)          I/Oプロセス
+    controller.update()  ── CommandBlock ──▶  ControlLoop (Dynamixel / DCモーター)
+                         ◀──  StateBlock ──
+
+I/Oプロセスは一定周期で状態を読み、共有メモリにある最新のコマンドを送り続ける。
+コントローラーの処理が重くても (GIL を共有しないため) 出力の周期は乱れない。
+コマンドの更新が stall_timeout 秒以上止まった場合は安全側の値 (DCモーター停止、速度モードは0、
+位置モードは最後の目標位置を保持) に切り替え、コマンドが再開したら元に戻す。
+"""
+import multiprocessing
+import signal
+import time
+
+from api.command import ControlCommand
+from runtime.loop import ControlLoop, sync_controller
+from runtime.scheduler import LoopScheduler
+from runtime.shared_block import CommandBlock, StateBlock
+
+START_TIMEOUT = 15.0  # I/Oプロセスの初期化を待つ時間 (秒)
+PARENT_CHECK_INTERVAL = 1.0  # コントローラープロセスの生存確認の間隔 (秒)
+
+
+class SharedCommandSource:
+    """
+    I/Oプロセスの ControlLoop にコントローラーの代わりに渡す、共有メモリのコマンド受信側
+
+    update() のたびに直前に読んだ状態を StateBlock に書き、CommandBlock の最新コマンドを返す。
+    """
+    def __init__(self, dxl_ids, commands, states, dc_motor, stall_timeout):
+        self.commands = commands
+        self.states = states
+        self.dc_motor = dc_motor
+        self.stall_timeout = stall_timeout
+        self.command = ControlCommand(dxl_ids)
+        self.ticks = 0
+        self.stalls = 0
+        self._stalled = False
+        self._enable_seq = 0
+        self._running = True
+        self._parent = multiprocessing.parent_process()
+        self._next_parent_check = 0.0
+
+    def update(self, elapsed, dxl_state=None):
+        self.ticks += 1
+        self.states.write_state(self.ticks, dxl_state, self.dc_motor.get_status(), self.dc_motor.latest_status_time)
+
+        now = time.monotonic()
+        received = self.commands.read_command()
+        if received is None:
+            # コントローラーの最初のコマンド待ち
+            self._check_parent(now)
+            return None
+        sent_at, dc_pwm, dxl_mode, enable, enable_seq, stop, targets, velocities, accelerations = received
+        if stop:
+            # 停止要求のコマンドは送信せず、ControlLoop.shutdown() でモーターを止める
+            self._running = False
+            return None
+
+        cmd = self.command
+        cmd.enable = None
+        if now - sent_at > self.stall_timeout:
+            if not self._stalled:
+                self._stalled = True
+                self.stalls += 1
+                print(f"\n[io] Controller stalled ({now - sent_at:.2f} s): holding safe command")
+            self._check_parent(now)
+            # 安全側: DCモーター停止、速度指令は0、位置指令は最後の目標を保持
+            cmd.dc_pwm = 0
+            if cmd.dxl_mode == 1:
+                cmd.dxl_targets.fill(0)
+            return cmd
+        if self._stalled:
+            self._stalled = False
+            print("\n[io] Controller resumed")
+
+        cmd.dc_pwm = dc_pwm
+        cmd.dxl_mode = dxl_mode
+        cmd.dxl_targets.assign(targets)
+        cmd.profile_velocity.assign(velocities)
+        cmd.profile_acceleration.assign(accelerations)
+        if enable_seq != self._enable_seq:
+            self._enable_seq = enable_seq
+            cmd.enable = bool(enable)
+        return cmd
+
+    def _check_parent(self, now):
+        """コントローラープロセスが終了していたら停止する"""
+        if now < self._next_parent_check:
+            return
+        self._next_parent_check = now + PARENT_CHECK_INTERVAL
+        if self._parent is not None and not self._parent.is_alive():
+            print("\n[io] Controller process exited: stopping")
+            self._running = False
+
+    def should_continue(self):
+        return self._running
+
+
+def io_main(config, make_hardware, command_name, state_name, ready):
+    """I/Oプロセスのエントリーポイント"""
+    # Ctrl+C はコントローラープロセスが受け、停止要求として伝える
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    ids = config.dynamixel.ids
+    commands = CommandBlock(ids, name=command_name)
+    states = StateBlock(ids, name=state_name)
+    dxl, dc_motor = make_hardware(config)
+
+    recorder = None
+    if config.recording.enabled:
+        from runtime.recorder import TelemetryRecorder
+        recorder = TelemetryRecorder(config.recording.path, ids, config.recording.capacity)
+        print(f"Recording telemetry to {config.recording.path}")
+
+    source = SharedCommandSource(ids, commands, states, dc_motor, config.control.stall_timeout_s)
+    loop = ControlLoop(source, dxl, dc_motor, ids, parallel_io=config.control.parallel_io, recorder=recorder,
+                       stats_interval=config.control.stats_interval_s)
+    scheduler = LoopScheduler(config.control.loop_rate_hz, config.control.overrun_policy)
+    try:
+        loop.setup(config.dynamixel.current_limit_ma, config.control.position_min, config.control.position_max)
+        # コントローラーが初期位置に同期できるよう、最初の状態を書いてから準備完了を通知する
+        states.write_state(0, dxl.read_state(ids), dc_motor.get_status(), dc_motor.latest_status_time)
+        ready.set()
+
+        scheduler.start()
+        while source.should_continue():
+            loop.tick(scheduler.wait())
+    finally:
+        loop.shutdown()
+        print(f"\n[io] Loop: {scheduler.stats.summary()} | stalls: {source.stalls}")
+        commands.close()
+        states.close()
+
+
+class SplitLoop:
+    """
+    コントローラープロセス側の制御ループ (ControlLoop と同じ setup / tick / shutdown を持つ)
+
+    Args:
+        config: AppConfig
+        make_hardware: config から (DynamixelInterface, DCMotorInterface) を生成する関数 (I/Oプロセスで呼ぶ)
+        controller: コントローラー
+        display: StatusDisplay (Noneの場合は表示しない)
+    """
+    def __init__(self, config, make_hardware, controller, display=None):
+        self.config = config
+        self.make_hardware = make_hardware
+        self.controller = controller
+        self.display = display
+        self.dxl_ids = config.dynamixel.ids
+        self.commands = CommandBlock(self.dxl_ids)
+        self.states = StateBlock(self.dxl_ids)
+        self.process = None
+        self._enable = -1
+        self._enable_seq = 0
+        self._last_cmd = None
+
+    def setup(self, current_limit_ma, position_min, position_max):
+        """I/Oプロセスを起動し、ハードウェアの初期化完了を待ってからコントローラーを同期する"""
+        # fork だとコントローラープロセスのスレッドや端末設定を引き継ぐため、常に spawn で起動する
+        ctx = multiprocessing.get_context('spawn')
+        ready = ctx.Event()
+        self.process = ctx.Process(target=io_main, name="io",
+                                   args=(self.config, self.make_hardware, self.commands.name, self.states.name, ready))
+        self.process.start()
+
+        deadline = time.monotonic() + START_TIMEOUT
+        while not ready.wait(0.05):
+            if not self.process.is_alive():
+                raise RuntimeError(f"I/O process exited during setup (exit code {self.process.exitcode})")
+            if time.monotonic() > deadline:
+                raise RuntimeError("I/O process did not become ready")
+
+        sync_controller(self.controller, lambda: self.states.read_state()[1], self.dxl_ids, position_min, position_max)
+
+    def tick(self, elapsed):
+        received = self.states.read_state()
+        dxl_state = received[1] if received is not None else None
+
+        cmd = self.controller.update(elapsed, dxl_state)
+        self._send(cmd)
+
+        if self.display is not None:
+            self.display.publish(elapsed, cmd)
+        return cmd
+
+    def _send(self, cmd, stop=False):
+        if cmd.enable is not None:
+            self._enable = int(cmd.enable)
+            self._enable_seq += 1
+        self.commands.write_command(cmd, self._enable, self._enable_seq, stop)
+        self._last_cmd = cmd
+        if hasattr(self.controller, 'actuated'):
+            # I/Oプロセスへの受け渡しまで (ハードウェアへの書き込みは I/O プロセスの次のティック)
+            self.controller.actuated(time.monotonic())
+
+    def shutdown(self):
+        """I/Oプロセスに停止を要求し、終了を待つ (モーターの停止は I/O プロセスが行う)"""
+        if self.process is not None and self.process.is_alive():
+            cmd = self._last_cmd
+            if cmd is None:
+                cmd = ControlCommand(self.dxl_ids)
+            cmd.enable = None
+            self._send(cmd, stop=True)
+            self.process.join(timeout=5.0)
+            if self.process.is_alive():
+                print("I/O process did not stop: terminating")
+                self.process.terminate()
+                self.process.join()
+        self.commands.close()
+        self.states.close()
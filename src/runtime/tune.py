@@ -0,0 +1,148 @@
+"""
+Dynamixel バスの通信速度の自動調整
+
+使用方法:
+    python src/main.py tune [--max-baud 4000000] [--return-delay 0] [--trials N] [--dry-run]
+
+各バスのサーボを探して往復時間を測り、Return Delay Time を最小にしてから、全IDと U2D2 を
+確実に通信できる最も速いボーレート (最大 --max-baud) へ切り替える。結果のボーレートは config.yaml の
+dynamixel.baud_rate (複数バスの場合は dynamixel.buses[].baud_rate) に保存する。
+simulation.enabled の場合は模擬バスで調整するだけで、config.yaml は変更しない。
+--dry-run の場合は各ボーレートで測定して変更する内容を表示し、サーボと U2D2 を調整前の設定に戻す。
+"""
+import argparse
+import os
+
+import yaml
+
+from hardware.bus_tuning import BAUD_INDEX, MAX_BAUD_RATE, BusTuner
+
+# scripts/setup_ports.py がデバイスごとの判定結果 (Dynamixel のボーレートを含む) を保存するキャッシュ
+DEVICE_CACHE_PATH = ".device_cache.yaml"
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="main.py tune", description="Dynamixel バスの通信速度の自動調整")
+    parser.add_argument("--max-baud", type=int, default=MAX_BAUD_RATE,
+                        help=f"試す最高のボーレート (default: {MAX_BAUD_RATE})")
+    parser.add_argument("--return-delay", type=int, default=0,
+                        help="設定する Return Delay Time (2 us 単位, default: 0)")
+    parser.add_argument("--trials", type=int, default=100,
+                        help="各ボーレートで確認する Sync Read の回数 (1回でも失敗したら採用しない, default: 100)")
+    parser.add_argument("--dry-run", action="store_true", help="測定と変更内容の表示だけを行い、サーボの設定と config.yaml を元のままにする")
+    return parser.parse_args(argv)
+
+
+def usb_latency_timer(port):
+    """Linux の USB シリアル (FTDI) の (latency_timer [ms], sysfs のパス)。分からない場合は None"""
+    name = os.path.basename(os.path.realpath(port))
+    path = f"/sys/bus/usb-serial/devices/{name}/latency_timer"
+    try:
+        with open(path) as f:
+            return int(f.read().strip()), path
+    except (OSError, ValueError):
+        return None
+
+
+def open_port(config, bus, index):
+    """バスのポートを開く (simulation.enabled の場合は模擬バス)"""
+    sim = config.simulation
+    if sim.enabled:
+        from hardware.simulation import create_sim_port
+        port = create_sim_port(bus.ids, bus.baud_rate, latency=sim.latency_ms / 1000.0, time_scale=sim.time_scale,
+                               port_name=f"sim-dxl{index}", drop_rate=sim.drop_rate, corrupt_rate=sim.corrupt_rate,
+                               max_baud_rate=sim.max_baud_rate)
+    else:
+        from dynamixel_sdk import PortHandler
+        port = PortHandler(bus.port)
+    if not port.openPort():
+        print(f"[tune] failed to open the port {bus.port}")
+        return None
+    return port
+
+
+def save_config(path, bauds):
+    """
+    調整したボーレートを config.yaml に保存する
+
+    Args:
+        bauds: {ポート: ボーレート}
+    """
+    with open(path) as f:
+        data = yaml.safe_load(f)
+    dxl = data["dynamixel"]
+    if dxl.get("buses"):
+        for bus in dxl["buses"]:
+            if bus["port"] in bauds:
+                bus["baud_rate"] = bauds[bus["port"]]
+    else:
+        dxl["baud_rate"] = bauds[data["serial"]["dxl_port"]]
+    with open(path, "w") as f:
+        yaml.dump(data, f, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+
+def invalidate_device_cache(path=DEVICE_CACHE_PATH):
+    """ポート検出キャッシュの Dynamixel を削除する (次の make setup で古いボーレートに戻さないよう調べ直させる)"""
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        cache = yaml.safe_load(f) or {}
+    cache = {key: entry for key, entry in cache.items() if entry.get("role") != "dynamixel"}
+    with open(path, "w") as f:
+        yaml.dump(cache, f, default_flow_style=False, sort_keys=True)
+
+
+def run_tune(config, argv, config_path):
+    """
+    全バスを調整し、結果を config.yaml に保存する
+
+    Args:
+        config: AppConfig
+        argv: コマンドライン引数 (tune 以降)
+        config_path: 保存先の config.yaml
+
+    Returns:
+        int: 終了コード (すべてのバスを調整できた場合は 0)
+    """
+    args = parse_args(argv)
+    if args.max_baud not in BAUD_INDEX:
+        print(f"[tune] unsupported baud rate {args.max_baud} (choose from {sorted(BAUD_INDEX)})")
+        return 1
+
+    tuned = {}
+    status = 0
+    for index, bus in enumerate(config.dxl_buses()):
+        port = open_port(config, bus, index)
+        if port is None:
+            status = 1
+            continue
+        try:
+            result = BusTuner(port, bus.ids, trials=args.trials).tune(bus.baud_rate, args.max_baud, args.return_delay,
+                                                                       dry_run=args.dry_run)
+        finally:
+            port.closePort()
+        if result is None or not result.ok:
+            status = 1
+            continue
+        before, after = result.before, result.after
+        if before.mean_ms and after.mean_ms:
+            label = " (dry run)" if args.dry_run else ""
+            print(f"[tune] {port.getPortName()}{label}: {bus.baud_rate} -> {result.baud_rate} bps, "
+                  f"round trip {before.mean_ms:.2f} -> {after.mean_ms:.2f} ms ({before.mean_ms / after.mean_ms:.1f}x)")
+        tuned[bus.port] = result.baud_rate
+
+        latency = None if config.simulation.enabled else usb_latency_timer(bus.port)
+        if latency is not None and latency[0] > 1:
+            # FTDI の既定値 (16 ms) のままだと、ボーレートを上げても往復時間はこの値で頭打ちになる
+            print(f"[tune] Note: USB latency_timer is {latency[0]} ms. "
+                  f"'echo 1 | sudo tee {latency[1]}' lowers the round trip further")
+
+    if config.simulation.enabled:
+        print("[tune] simulation: config.yaml is not changed")
+    elif args.dry_run:
+        print(f"[tune] dry run: config.yaml is not changed (would save {tuned})")
+    elif tuned:
+        save_config(config_path, tuned)
+        invalidate_device_cache()
+        print(f"[tune] saved {config_path}")
+    return status